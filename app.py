@@ -3,10 +3,27 @@ import pandas as pd
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 from typing import Tuple
-import io, time, re
+import os, re, tempfile, posixpath
 import random
-from sp_connector import SPConnector 
-from urllib.parse import quote
+import threading
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FuturesTimeout
+from sp_connector import SPConnector, PreconditionFailed
+from workbook import sanitize_sheet_name, LazyWorkbook, Snapshot, build_workbook, diff_workbook, diff_sheet, apply_ops
+from mirror import SheetMirror
+from write_queue import WriteCoalescer
+from journal import WriteJournal
+from graph_workbook import write_ops
+from history_store import HistoryStore, new_tag
+from async_sp_connector import shared_connector
+from id_index import IdIndex, NUM_DIGITS, CAP_MAX
+from id_allocator import IdAllocator
+from key_index import KeyIndex, normalize_keys, parse_id_list
+from location_index import LocationIndex
+from schema import typed_arquivos, to_excel_frame, assign, parse_dates
+from date_index import DateIndex
+from text_index import TextIndex
+from paged_table import paginate, page_count, PAGE_SIZES
 
 # ===== Config via novo secrets =====
 TENANT_ID = st.secrets["graph"]["tenant_id"]
@@ -17,6 +34,20 @@ SITE_PATH = st.secrets["graph"]["site_path"]
 LIBRARY   = st.secrets["graph"]["library_name"]    
 USER_UPN  = st.secrets.get("onedrive", {}).get("user_upn", "")
 file_name = st.secrets["files"]["arquivo"]   
+# diretório opcional p/ cache em disco do workbook (eTag + bytes); vazio = só memória
+CACHE_DIR = st.secrets["files"].get("cache_dir", "")
+# espelho local (SQLite) das abas por eTag; "off" desliga
+MIRROR_PATH = st.secrets["files"].get("mirror_path", "") or os.path.join(CACHE_DIR or tempfile.gettempdir(), "workbook_mirror.sqlite")
+# diário local das escritas ainda não confirmadas pelo SharePoint; "off" desliga
+JOURNAL_PATH = st.secrets["files"].get("journal_path", "") or os.path.join(CACHE_DIR or tempfile.gettempdir(), "escritas_pendentes.jsonl")
+# pasta da biblioteca com o histórico (uma subpasta por mês, um CSV por anexo); padrão "historico" ao lado do arquivo principal
+HISTORY_DIR = st.secrets["files"].get("history_dir", "") or posixpath.join(posixpath.dirname(file_name), "historico")
+# como gravar no arquivo principal: "arquivo" (reenvia o .xlsx) ou "excel_api" (só as células/linhas afetadas)
+STORAGE_MODE = st.secrets["files"].get("storage_mode", "arquivo")
+# arquivo de controle (JSON na biblioteca) com o último ID reservado por prefixo
+ID_SIDECAR = st.secrets["files"].get("ids_sidecar", "") or posixpath.join(posixpath.dirname(file_name), "ids_reservados.json")
+# arquivo opcional p/ compartilhar o access token entre processos do host
+TOKEN_CACHE = st.secrets["graph"].get("token_cache_path", "")
 
 GRAPH = "https://graph.microsoft.com/v1.0"
 
@@ -28,36 +59,255 @@ def _sp():
         TENANT_ID, CLIENT_ID, CLIENT_SECRET,
         hostname=HOSTNAME, site_path=SITE_PATH, library_name=LIBRARY,
         user_upn=USER_UPN,  # se preencher, entra em modo OneDrive
+        cache_dir=CACHE_DIR,  # sobrevive ao "🔄 Atualizar" (que limpa o cache_resource)
+        token_cache_path=TOKEN_CACHE or None,
+        refresh_in_background=True,  # token renovado antes de vencer, fora das requisições
     )
 
+def _sp_async():
+    """
+    Conector assíncrono num loop próprio: baixa vários arquivos em paralelo (arquivos do histórico).
+    Único no processo (fora do cache_resource): o "🔄 Atualizar" não abre outro loop/cliente.
+    """
+    return shared_connector(
+        TENANT_ID, CLIENT_ID, CLIENT_SECRET,
+        hostname=HOSTNAME, site_path=SITE_PATH, library_name=LIBRARY,
+        user_upn=USER_UPN,
+        token_cache_path=TOKEN_CACHE or None,
+    )
+
+
+def _baixar_varios(caminhos) -> dict:
+    """{caminho: bytes | Exception}, todos baixados em paralelo."""
+    loop, conn = _sp_async()
+    return loop.submit(conn.download_many(caminhos)).result(timeout=300)
+
+@st.cache_resource
+def _espelho():
+    """Espelho SQLite do arquivo principal (None se desligado ou indisponível)."""
+    if MIRROR_PATH.lower() == "off":
+        return None
+    try:
+        return SheetMirror(MIRROR_PATH, source=file_name, keep=MAX_VERSOES_WORKBOOK + 2)
+    except Exception:
+        return None
+
+
+def _espelhar(etag: str | None, sheets):
+    """Agenda a gravação da versão no espelho (thread de fundo); falha no espelho nunca impede a leitura/gravação."""
+    m = _espelho()
+    if m is None or not etag:
+        return
+    try:
+        m.store_later(etag, sheets)
+    except Exception:
+        pass
+
 # ===== (mantido) saneamento de nome de aba =====
-def _sanitize_sheet_name(name: str) -> str:
-    invalid = ['\\', '/', '?', '*', '[', ']']
-    for ch in invalid:
-        name = name.replace(ch, '_')
-    return (name or "Sheet1")[:31]
+_sanitize_sheet_name = sanitize_sheet_name
+
+
+# ===== Versões do workbook já abertas (leitura preguiçosa + base das escritas condicionais) =====
+# Quantas versões (por eTag) manter em memória no processo
+MAX_VERSOES_WORKBOOK = 4
+# Quantas vezes reaplicar as mudanças sobre uma versão mais nova antes de desistir
+MAX_REBASES = 5
+# Abas que carregar_excel() devolve (nessa ordem)
+ABAS_PRINCIPAIS = ("Arquivos", "Espaços", "Selectboxes", "Retenção", "Histórico")
+
+
+@st.cache_resource
+def _versoes_workbook():
+    """eTag -> Snapshot daquela versão (abas lidas sob demanda). Compartilhado por todas as sessões."""
+    return {"lock": threading.Lock(), "versoes": OrderedDict()}
 
 
+def _registrar_versao(etag: str | None, sheets):
+    if not etag:
+        return
+    if not isinstance(sheets, Snapshot):
+        try:
+            historico = _historico()
+        except Exception:
+            historico = None
+        sheets = Snapshot(sheets, version=etag, history=historico)
+    reg = _versoes_workbook()
+    with reg["lock"]:
+        reg["versoes"][etag] = sheets
+        reg["versoes"].move_to_end(etag)
+        while len(reg["versoes"]) > MAX_VERSOES_WORKBOOK:
+            reg["versoes"].popitem(last=False)
+
+
+def _versao_workbook(etag: str | None):
+    if not etag:
+        return None
+    reg = _versoes_workbook()
+    with reg["lock"]:
+        return reg["versoes"].get(etag)
+
+
+def _ler_versao(file_path: str, revalidate: bool = True):
+    """
+    (workbook, eTag) da versão atual; só lê as abas que forem acessadas.
+    Arquivo principal: se o eTag remoto já está no espelho, as abas vêm do SQLite
+    (sem baixar nem abrir o .xlsx); senão baixa e devolve o .xlsx na hora — a conversão
+    para o espelho roda em segundo plano e serve às próximas leituras.
+    """
+    sp = _sp()
+    m = _espelho() if file_path == file_name else None
+    if m is not None and revalidate:
+        try:
+            etag = sp.get_metadata(file_path).get("eTag")
+            if m.has_version(etag):
+                return m.workbook(etag), etag
+        except FileNotFoundError:
+            raise
+        except Exception:
+            pass  # espelho/metadados indisponíveis: segue pelo download
+    f, etag = sp.open_download_with_etag(file_path, revalidate=revalidate)
+    wb = LazyWorkbook(f, version=etag)
+    if m is not None and not m.has_version(etag):
+        _espelhar(etag, wb)  # em segundo plano: a primeira leitura não espera o SQLite
+    return wb, etag
+
 
-# ===== Carregar Excel (todas as abas que você usa) =====
 @st.cache_data
-def carregar_excel():
-    try:
-        content = _sp().download(file_name)
+def _etag_atual():
+    """Revalida o arquivo e registra a versão; limpo junto com o cache_data."""
+    wb, etag = _ler_versao(file_name)
+    if _versao_workbook(etag) is None:
+        _registrar_versao(etag, wb)
+    else:
+        wb.close()
+    return etag
+
+
+def _workbook():
+    """(Snapshot, eTag) da versão atual do arquivo principal — sem rede enquanto o cache_data vale."""
+    etag = _etag_atual()
+    wb = _versao_workbook(etag)
+    if wb is None:
+        # registro foi descartado (p.ex. cache_resource limpo): reabre
+        _etag_atual.clear()
+        etag = _etag_atual()
+        wb = _versao_workbook(etag)
+    return wb, etag
+
+
+def _snapshot() -> Snapshot:
+    return _workbook()[0]
+
+
+def _indice_ids() -> IdIndex:
+    """Índice prefixo -> último sufixo da versão atual (montado uma vez por versão, compartilhado)."""
+    def _montar(snap):
+        arq = snap.get("Arquivos")
+        ids = arq["ID"] if isinstance(arq, pd.DataFrame) and "ID" in arq.columns else ()
+        indice = IdIndex(ids)
+        # cadastros ainda no diário também ocupam IDs
+        indice.observe_ids(
+            row.get("ID") for op in _ops_pendentes()
+            if op["sheet"] == "Arquivos" and op["op"] == "upsert" for row in op["rows"]
+        )
+        return indice
+    return _snapshot().derived("id_index", _montar)
+
+
+def _indice_da_aba(df: pd.DataFrame, nome: str, montar):
+    """
+    `montar(df)` sobre a aba Arquivos devolvida por carregar_excel (posições = iloc de `df`).
+    Sem operações pendentes, `df` é a própria aba da versão e o índice é o da versão
+    (montado uma vez, compartilhado por todas as sessões); senão é montado sobre `df`.
+    """
+    pendentes = [op for op in st.session_state.get("workbook_pendentes", []) if op["sheet"] == "Arquivos"]
+    snap = _versao_workbook(st.session_state.get("workbook_etag"))
+    if snap is not None and not pendentes:
+        def _da_versao(s):
+            arq = s.get("Arquivos")
+            return montar(arq if isinstance(arq, pd.DataFrame) else pd.DataFrame())
+        indice = snap.derived(nome, _da_versao)
+        if len(indice) == len(df):
+            return indice
+    return montar(df)
+
+
+def _indice_arquivos(df: pd.DataFrame) -> KeyIndex:
+    """Índice ID -> posição da linha em `df`."""
+    return _indice_da_aba(df, "key_index", lambda d: KeyIndex(d["ID"] if "ID" in d.columns else ()))
+
+
+def _indice_locais(df: pd.DataFrame) -> LocationIndex:
+    """Índice Local/Estante/Prateleira/Caixa -> posições das linhas em `df`."""
+    return _indice_da_aba(df, "location_index", LocationIndex)
+
+
+@st.cache_resource
+def _alocador() -> IdAllocator:
+    """Reserva de IDs compartilhada entre sessões/processos (arquivo de controle + leases)."""
+    return IdAllocator(_sp(), ID_SIDECAR)
+
+
+def _indice_datas(df: pd.DataFrame, coluna: str) -> DateIndex:
+    """Índice ordenado da coluna de data `coluna` -> posições das linhas em `df`."""
+    return _indice_da_aba(df, f"date_index:{coluna}",
+                          lambda d: DateIndex(d[coluna] if coluna in d.columns else pd.Series(dtype=object)))
+
+
+# Atalhos de período (Consultar): nome -> (início, fim) a partir de hoje
+def _periodo_atalho(nome: str, hoje: date) -> tuple:
+    mes = hoje.replace(day=1)
+    trimestre = mes.replace(month=3 * ((mes.month - 1) // 3) + 1)
+    return {
+        "Mês passado": (mes - relativedelta(months=1), mes - relativedelta(days=1)),
+        "Este mês": (mes, mes + relativedelta(months=1, days=-1)),
+        "Último trimestre": (trimestre - relativedelta(months=3), trimestre - relativedelta(days=1)),
+        "Próximo mês": (mes + relativedelta(months=1), mes + relativedelta(months=2, days=-1)),
+        "Próximos 90 dias": (hoje, hoje + relativedelta(days=90)),
+    }[nome]
+
+
+ATALHOS_PERIODO = ["Personalizado", "Mês passado", "Este mês", "Último trimestre", "Próximo mês", "Próximos 90 dias"]
+CAMPOS_DATA = ["Data Arquivamento", "Data Prevista de Descarte", "Data Desarquivamento"]
 
-        sheets = pd.read_excel(io.BytesIO(content), sheet_name=None)
-        df          = sheets.get("Arquivos",    pd.DataFrame())
-        df_espacos  = sheets.get("Espaços",     pd.DataFrame())
-        df_selects  = sheets.get("Selectboxes", pd.DataFrame())
-        Retencao_df = sheets.get("Retenção",    pd.DataFrame())
-        df_hist     = sheets.get("Histórico",    pd.DataFrame())
+
+def _arquivos_tipado(snap: Snapshot) -> pd.DataFrame:
+    """Aba Arquivos da versão já tipada (ver schema.py); compartilhada: não altere."""
+    return snap.derived("arquivos_tipado", lambda s: typed_arquivos(s["Arquivos"]))
+
+
+# ===== Carregar Excel (só as abas pedidas; as demais voltam vazias) =====
+def carregar_excel(abas=ABAS_PRINCIPAIS):
+    try:
+        wb, etag = _workbook()
+        pendentes = _ops_pendentes()
+        # versão (+ operações ainda não enviadas) em que as edições desta sessão se baseiam
+        st.session_state["workbook_etag"] = etag
+        st.session_state["workbook_pendentes"] = pendentes
+        vista = _com_pendentes(wb, abas, pendentes)
+
+        def _aba(nome):
+            # cópia: o DataFrame memorizado é compartilhado entre sessões
+            return vista[nome].copy() if nome in vista else pd.DataFrame()
+
+        # Arquivos já tipada (datas, categorias, chaves normalizadas): uma vez por versão
+        if "Arquivos" not in vista:
+            df = pd.DataFrame()
+        elif any(op["sheet"] == "Arquivos" for op in pendentes):
+            df = typed_arquivos(vista["Arquivos"])
+        else:
+            df = _arquivos_tipado(wb).copy()
+        df_espacos  = _aba("Espaços")
+        df_selects  = _aba("Selectboxes")
+        Retencao_df = _aba("Retenção")
+        df_hist     = _aba("Histórico")
 
         faltando = [n for n, d in [
             ("Arquivos", df),
             ("Espaços", df_espacos),
             ("Selectboxes", df_selects),
             ("Retenção", Retencao_df),
-        ] if d.empty]
+        ] if n in abas and d.empty]
         if faltando:
             st.warning(f"A(s) aba(s) não encontrada(s) ou vazia(s): {', '.join(faltando)}")
 
@@ -67,6 +317,172 @@ def carregar_excel():
         return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
 
 
+# ===== Fila de escrita (uma por processo; junta as operações de todas as sessões) =====
+# Quanto a sessão espera a confirmação do upload antes de devolver a tela
+ESCRITA_TIMEOUT = 300
+
+
+def _gravar_ops(file_path: str, ops: list):
+    """
+    Executado pela thread da fila: aplica as operações (de uma ou várias sessões) sobre
+    a versão mais recente conhecida e envia com If-Match. Se outra instância salvou
+    antes (412), relê a versão nova e reaplica. Devolve o novo eTag.
+    No modo excel_api grava célula a célula (`write_ops`); só o que não coube ou não foi
+    concluído ali segue pelo envio do arquivo inteiro, sobre a versão relida.
+    Bloqueio/limite (423/429/503/504) já é tratado pela política de retry do conector.
+    Na chave HISTORY_DIR as operações são anexos ao histórico (ver `_enviar_do_diario`).
+    """
+    if file_path == HISTORY_DIR:
+        store = _historico()
+        for op in ops:
+            store.append(op["rows"], tag=op["tag"])
+        return None
+    sp = _sp()
+    principal = file_path == file_name
+    if principal and STORAGE_MODE == "excel_api":
+        novo_etag, ops = write_ops(sp, file_path, ops)
+        if not ops:
+            return novo_etag
+    etag = sp.cached_etag(file_path)
+    sheets = _versao_workbook(etag) if principal else None
+    if sheets is None:
+        try:
+            sheets, etag = _ler_versao(file_path, revalidate=False)
+        except FileNotFoundError:
+            sheets, etag = {}, None
+
+    for _ in range(MAX_REBASES + 1):
+        novas = apply_ops(sheets, ops)
+        try:
+            item = sp.upload(file_path, build_workbook(novas), overwrite=True, if_match=etag)
+        except PreconditionFailed:
+            sheets, etag = _ler_versao(file_path)
+            if principal:
+                _registrar_versao(etag, sheets)
+            continue
+        novo_etag = item.get("eTag")
+        if principal:
+            _registrar_versao(novo_etag, novas)
+            _espelhar(novo_etag, novas)
+        return novo_etag
+    raise PreconditionFailed(f"{file_path} mudou {MAX_REBASES + 1} vezes seguidas durante o envio")
+
+
+@st.cache_resource
+def _fila_escrita():
+    return WriteCoalescer(_gravar_ops)
+
+
+# ===== Diário de escritas (grava antes de enviar; reenvia o que ficou pendente) =====
+# Falhas seguidas de uma entrada antes de desistir dela (fica como "failed" no diário)
+DIARIO_MAX_TENTATIVAS = 20
+# Espera máxima entre reenvios (segundos)
+DIARIO_ATRASO_MAX = 300
+# Operação do diário com linhas de histórico (gravadas na fila HISTORY_DIR, depois do arquivo)
+OP_HISTORICO = "history"
+
+
+@st.cache_resource
+def _diario():
+    """Diário do processo (None se desligado); ao abrir, reenvia as entradas pendentes."""
+    if JOURNAL_PATH.lower() == "off":
+        return None
+    try:
+        j = WriteJournal.open(JOURNAL_PATH)
+    except Exception:
+        return None
+    _enviar_pendentes(j)
+    return j
+
+
+def _enviar_pendentes(j):
+    # por arquivo, as entradas liberadas vão juntas e na ordem em que foram feitas (FIFO estrito)
+    lotes = OrderedDict()
+    for entrada in j.claim_pending():
+        lotes.setdefault(entrada["file"], []).append(entrada)
+    for entradas in lotes.values():
+        _enviar_do_diario(j, entradas)
+
+
+def _enviar_do_diario(j, entradas: list):
+    """
+    Entrega as entradas (mesmo arquivo, em ordem) à fila de escrita num único envio — tudo
+    ou nada. As linhas de histórico delas só vão depois que o arquivo for confirmado (entrada
+    marcada `sent`; um novo envio não regrava o arquivo). Confirmado: marca todas e libera o
+    que chegou nesse meio-tempo. Falhou: o arquivo espera o novo envio (as entradas seguintes
+    também), que recomeça só pela mais antiga.
+    """
+    ops_arquivo = [op for entrada in entradas if not entrada.get("sent")
+                   for op in entrada["ops"] if op["op"] != OP_HISTORICO]
+    ops_hist = [op for entrada in entradas for op in entrada["ops"] if op["op"] == OP_HISTORICO]
+
+    def _falhou(e):
+        primeira = entradas[0]["id"]
+        falhas = j.failures(primeira) + 1
+        if falhas >= DIARIO_MAX_TENTATIVAS:
+            # desiste da mais antiga (fica como "failed"); as seguintes seguem sem ela
+            j.mark_failed(primeira, f"{type(e).__name__}: {e}")
+            for entrada in entradas[1:]:
+                j.release(entrada["id"])
+            _enviar_pendentes(j)
+            return
+        atraso = min(DIARIO_ATRASO_MAX, 2 ** falhas)
+        for entrada in entradas:
+            j.release(entrada["id"], retry_after=atraso)
+        t = threading.Timer(atraso, _enviar_pendentes, (j,))
+        t.daemon = True
+        t.start()
+
+    def _concluir(etag):
+        for entrada in entradas:
+            j.mark_done(entrada["id"], etag)
+        _enviar_pendentes(j)
+
+    def _fim_historico(fut, etag=None):
+        try:
+            fut.result()
+        except Exception as e:
+            _falhou(e)
+            return
+        _concluir(etag)
+
+    def _fim_arquivo(fut):
+        try:
+            etag = fut.result()
+        except Exception as e:
+            _falhou(e)
+            return
+        for entrada in entradas:
+            j.mark_sent(entrada["id"], etag)
+        try:
+            _etag_atual.clear()  # próximas leituras já pegam a versão com a alteração
+        except Exception:
+            pass
+        if ops_hist:
+            _fila_escrita().submit(HISTORY_DIR, ops_hist).add_done_callback(
+                lambda f: _fim_historico(f, etag))
+        else:
+            _concluir(etag)
+
+    if ops_arquivo:
+        _fila_escrita().submit(entradas[0]["file"], ops_arquivo).add_done_callback(_fim_arquivo)
+    else:
+        _fila_escrita().submit(HISTORY_DIR, ops_hist).add_done_callback(_fim_historico)
+
+
+def _ops_pendentes(file_path: str = file_name) -> list:
+    """Operações por linha do diário ainda não gravadas no arquivo (sem os anexos de histórico)."""
+    j = _diario()
+    return [op for op in j.pending_ops(file_path) if op["op"] != OP_HISTORICO] if j is not None else []
+
+
+def _com_pendentes(wb, abas, ops: list) -> dict:
+    """Abas pedidas da versão `wb` com as operações do diário aplicadas (a sessão vê o que salvou)."""
+    vista = {n: wb[n] for n in abas if n in wb}
+    ops = [op for op in ops if op["sheet"] in abas]
+    return apply_ops(vista, ops) if ops else vista
+
+
 def update_sharepoint_file(file_path: str,
                            updates: dict[str, pd.DataFrame] | None = None,
                            *,
@@ -76,10 +492,21 @@ def update_sharepoint_file(file_path: str,
                            df_hist: pd.DataFrame | None = None,
                            history_sheet_name: str | None = None,
                            keep_existing: bool = True,
-                           index: bool = False):
+                           index: bool = False,
+                           base_etag: str | None = None,
+                           extra_ops: list | None = None,
+                           historico: list[dict] | None = None):
     """
     Escreve várias abas de uma vez.
     Use EITHER `updates={"Aba1": df1, "Aba2": df2}` OR o par (df,sheet) + (df_hist,history_sheet_name).
+
+    Com `keep_existing=True` o que a sessão mudou é calculado linha a linha em relação
+    à versão `base_etag` (padrão: a última carregada por esta sessão) e entregue à fila
+    de escrita do processo, que junta as operações de todas as sessões num único
+    upload condicional (If-Match) — ver `_gravar_ops`.
+    `extra_ops` (operações por linha já prontas) vão no MESMO envio, depois das abas.
+    `historico` (linhas com as colunas de HISTORY_COLUMNS) vai na mesma entrada do diário e só é
+    gravado depois que o arquivo for confirmado; salvamento sem alteração não gera histórico.
     """
     # validação mínima
     if not isinstance(file_path, str) or not file_path:
@@ -102,71 +529,86 @@ def update_sharepoint_file(file_path: str,
         if df_hist is not None and history_sheet_name:
             write_map[_sanitize_sheet_name(history_sheet_name)] = df_hist
 
-    if not write_map:
+    if not write_map and not extra_ops and not historico:
         st.warning("Nada para salvar: nenhum dataframe fornecido.")
         return
+    if (extra_ops or historico) and not keep_existing:
+        st.error("extra_ops/historico exigem keep_existing=True")
+        return
 
-    attempts = 0
-    while True:
-        try:
-            # lê workbook atual (se existir) para preservar abas
-            existing_sheets = {}
-            if keep_existing:
+    try:
+        if not keep_existing:
+            # substitui o arquivo só com as abas informadas (sem fila nem If-Match)
+            if "Arquivos" in write_map:
+                write_map["Arquivos"] = to_excel_frame(write_map["Arquivos"])
+            item = _sp().upload(file_path, build_workbook(write_map, index=index), overwrite=True)
+            novo_etag = item.get("eTag")
+            if file_path == file_name:
+                _registrar_versao(novo_etag, write_map)
+                _espelhar(novo_etag, write_map)
+        else:
+            # base = versão em que a edição foi feita; sem ela, o que o conector já tem
+            if base_etag is None and file_path == file_name:
+                base_etag = st.session_state.get("workbook_etag")
+            base_sheets = _versao_workbook(base_etag) if file_path == file_name else None
+            if base_sheets is None:
                 try:
-                    content = _sp().download(file_path)
-                    existing_sheets = pd.read_excel(io.BytesIO(content), sheet_name=None) or {}
-                except Exception:
-                    existing_sheets = {}
-
-            # aplica apenas as abas pedidas
-            def _append_frames(existing, new):
-                if existing is None or (isinstance(existing, pd.DataFrame) and existing.empty):
-                    return new
-                # une colunas; o que faltar vira NaN
-                all_cols = list(dict.fromkeys(
-                    (list(existing.columns) if isinstance(existing, pd.DataFrame) else []) + list(new.columns)
-                ))
-                if isinstance(existing, pd.DataFrame):
-                    existing = existing.reindex(columns=all_cols)
+                    base_sheets, base_etag = _ler_versao(file_path, revalidate=False)
+                except FileNotFoundError:
+                    base_sheets, base_etag = {}, None
+            if file_path == file_name and st.session_state.get("workbook_pendentes"):
+                # a sessão editou a versão já com as operações pendentes que viu
+                base_sheets = apply_ops(base_sheets, st.session_state["workbook_pendentes"])
+            if "Arquivos" in write_map:
+                # os dois lados na mesma representação: só o que a sessão mudou vira operação
+                write_map["Arquivos"] = to_excel_frame(write_map["Arquivos"])
+                if isinstance(base_sheets, Snapshot) and "Arquivos" in base_sheets:
+                    base_arq = base_sheets.derived("arquivos_excel", lambda s: to_excel_frame(_arquivos_tipado(s)))
                 else:
-                    existing = pd.DataFrame(existing).reindex(columns=all_cols)
-                new = new.reindex(columns=all_cols)
-                return pd.concat([existing, new], ignore_index=True)
-
-            # depois (aplica append automático só na aba "Historico")
-            for sheet, data in write_map.items():
-                if _sanitize_sheet_name(sheet).lower() == "historico":
-                    prev = existing_sheets.get(sheet)
-                    existing_sheets[sheet] = _append_frames(prev if isinstance(prev, pd.DataFrame) else None, data)
-                else:
-                    existing_sheets[sheet] = data  # overwrite normal
-
-
-            # escreve de volta
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                for name, data in existing_sheets.items():
-                    (data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)) \
-                        .to_excel(writer, sheet_name=_sanitize_sheet_name(name), index=index)
-            output.seek(0)
-            _sp().upload_small(file_path, output.read(), overwrite=True)
+                    base_arq = base_sheets.get("Arquivos")
+                    if isinstance(base_arq, pd.DataFrame):
+                        base_arq = to_excel_frame(typed_arquivos(base_arq))
+                base_sheets = {**{n: base_sheets.get(n) for n in write_map}, "Arquivos": base_arq}
+            ops = diff_workbook(base_sheets, write_map) + list(extra_ops or [])
+            if not ops and (write_map or extra_ops or not historico):
+                st.info("Nenhuma alteração em relação à versão atual.")
+                return
+            ops_hist = [{"op": OP_HISTORICO, "tag": new_tag(), "rows": list(historico)}] if historico else []
+            j = _diario()
+            if j is not None:
+                # gravado no diário = não se perde; o envio ao SharePoint segue em segundo plano
+                j.append(file_path, ops + ops_hist, base_etag)
+                _enviar_pendentes(j)
+                try:
+                    st.cache_data.clear()
+                except Exception:
+                    pass
+                st.success("Salvo! A alteração está sendo enviada ao SharePoint.")
+                return
+            novo_etag = _fila_escrita().submit(file_path, ops).result(timeout=ESCRITA_TIMEOUT) if ops else None
+            if ops_hist:
+                try:
+                    _fila_escrita().submit(HISTORY_DIR, ops_hist).result(timeout=ESCRITA_TIMEOUT)
+                except Exception as e:
+                    st.warning(f"Alteração salva, mas não foi possível registrar o histórico: {e}")
 
-            try:
-                st.cache_data.clear()
-            except Exception:
-                pass
-            st.success("Salvo!")
-            break
+    except FuturesTimeout:
+        st.warning("O SharePoint está demorando para responder; a alteração continua na fila e será enviada.")
+        return
+    except PreconditionFailed:
+        st.error("Erro ao salvar: o arquivo está sendo alterado continuamente por outras sessões. Tente novamente.")
+        return
+    except Exception as e:
+        st.error(f"Erro ao salvar (Graph): {e}")
+        return
 
-        except Exception as e:
-            attempts += 1
-            msg = str(e)
-            if any(x in msg for x in ["409", "412", "429"]) and attempts < 5:
-                st.warning("Arquivo já em uso. Tentando novamente em 5s...")
-                time.sleep(5)
-                continue
-            st.error(f"Erro ao salvar (Graph): {msg}")
-            break
+    if file_path == file_name and novo_etag:
+        st.session_state["workbook_etag"] = novo_etag
+    try:
+        st.cache_data.clear()
+    except Exception:
+        pass
+    st.success("Salvo!")
 
 
 # ===== Utilitários de Histórico =====
@@ -186,46 +628,267 @@ def _normalize_history_df(df_hist: pd.DataFrame) -> pd.DataFrame:
     return df_hist[HISTORY_COLUMNS]
 
 
-def get_history_df() -> Tuple[pd.DataFrame, str]:
-    """Lê a planilha de histórico garantindo colunas padrão.
+@st.cache_resource
+def _historico():
+    """
+    Histórico na biblioteca (HISTORY_DIR). Se a migração nunca foi feita, importa as abas de
+    histórico do workbook; falha aqui não fica em cache e a próxima chamada tenta de novo.
+    """
+    store = HistoryStore(_sp(), HISTORY_DIR, HISTORY_COLUMNS, fetch_many=_baixar_varios)
+    if not store.is_migrated():
+        # leitura direta (fora do registro de versões, que depende deste histórico)
+        wb, _ = _ler_versao(file_name)
+        try:
+            store.import_once([_normalize_history_df(wb[n]) for n in HISTORY_SHEET_ALIASES if n in wb])
+        finally:
+            wb.close()
+    return store
+
+
+def get_history_df(inicio=None, fim=None, newest_first: bool = False) -> Tuple[pd.DataFrame, str]:
+    """Lê o histórico garantindo colunas padrão.
 
-    Retorna o DataFrame normalizado e o nome da aba utilizada (existente ou preferida).
+    Com `inicio`/`fim` só os meses do intervalo são lidos; `newest_first` já devolve
+    do mais novo para o mais antigo (índice de datas de cada mês). Vem do mesmo Snapshot que
+    `carregar_excel` usa: sem rede enquanto o arquivo remoto não muda.
+    Retorna o DataFrame normalizado e o nome da aba de histórico preferida.
     """
     sheet_name = HISTORY_SHEET_PREFERRED
     try:
-        content = _sp().download(file_name)
-        sheets = pd.read_excel(io.BytesIO(content), sheet_name=None) or {}
-        for possible in HISTORY_SHEET_ALIASES:
-            hist = sheets.get(possible)
-            if isinstance(hist, pd.DataFrame):
-                sheet_name = possible
-                return _normalize_history_df(hist), sheet_name
+        gravado = _snapshot().history(inicio, fim, newest_first=newest_first)
+        pendente = _historico_pendente(inicio, fim, newest_first)
+        partes = [pendente, gravado] if newest_first else [gravado, pendente]
+        partes = [p for p in partes if not p.empty]
+        return _normalize_history_df(pd.concat(partes, ignore_index=True) if partes else gravado), sheet_name
     except Exception:
         pass
-    return pd.DataFrame(columns=[
-        "Mudança", "Data", "ID", "Conteúdo da Caixa", "Responsável", "Observação"
-    ])
+    return pd.DataFrame(columns=HISTORY_COLUMNS), sheet_name
+
+
+def _historico_pendente(inicio=None, fim=None, newest_first: bool = False) -> pd.DataFrame:
+    """Linhas de histórico ainda no diário (a sessão já vê o que salvou), no formato gravado."""
+    j = _diario()
+    linhas = [linha for entrada in (j.pending(file_name) if j is not None else [])
+              for op in entrada["ops"] if op["op"] == OP_HISTORICO for linha in op["rows"]]
+    if not linhas:
+        return pd.DataFrame(columns=HISTORY_COLUMNS)
+    df = _historico().normalize(linhas)
+    datas = parse_dates(df["Data"])
+    if inicio is not None:
+        df, datas = df[datas >= pd.Timestamp(inicio)], datas[datas >= pd.Timestamp(inicio)]
+    if fim is not None:
+        limite = pd.Timestamp(fim).normalize() + pd.Timedelta(days=1)
+        df, datas = df[datas < limite], datas[datas < limite]
+    if newest_first:
+        df = df.iloc[datas.reset_index(drop=True).sort_values(ascending=False, na_position="last").index]
+    return df.reset_index(drop=True)
+
+
+# ===== Busca textual (Consultar) =====
+# Campos da aba Arquivos indexados (no histórico: "Observação")
+CAMPOS_BUSCA = ["Conteúdo da Caixa", "Observação Desarquivamento", "Codificação", "Tag", "Lacre", "Livro"]
+# Quantas caixas a busca devolve no máximo
+LIMITE_BUSCA = 200
+
+
+@st.cache_resource
+def _busca_textual():
+    """Índice invertido do processo + até onde ele já foi alimentado (versão de Arquivos, anexos do histórico por mês)."""
+    return {"lock": threading.Lock(), "indice": TextIndex(), "etag": None, "arquivos": None, "historico": {}}
+
+
+def _indice_texto() -> TextIndex:
+    """
+    Índice de texto em dia, atualizado de forma incremental: na primeira vez indexa a aba
+    inteira; a cada versão nova só as linhas que mudaram (diff por ID); do histórico só
+    os anexos que ainda não foram indexados. Alvo de cada documento = ID normalizado.
+    """
+    reg = _busca_textual()
+    snap, etag = _workbook()
+    with reg["lock"]:
+        indice = reg["indice"]
+        if reg["etag"] != etag:
+            novo = snap.get("Arquivos")
+            if not isinstance(novo, pd.DataFrame) or "ID" not in novo.columns:
+                novo = pd.DataFrame(columns=["ID"])
+            antigo = reg["arquivos"]
+            ops = diff_sheet("Arquivos", antigo, novo, key="ID") if antigo is not None else [{"op": "replace"}]
+            for op in ops:
+                if op["op"] == "delete":
+                    for i in op["ids"]:
+                        indice.remove(("arquivo", str(i)))
+                    continue
+                if op["op"] == "upsert":
+                    linhas = novo[novo["ID"].astype(str).isin({str(r["ID"]) for r in op["rows"]})]
+                else:
+                    # aba inteira: sai quem não existe mais, entra tudo
+                    if antigo is not None:
+                        for i in set(antigo["ID"].astype(str)) - set(novo["ID"].astype(str)):
+                            indice.remove(("arquivo", i))
+                    linhas = novo
+                indice.add_frame(linhas, [("arquivo", str(i)) for i in linhas["ID"]],
+                                 list(normalize_keys(linhas["ID"])), CAMPOS_BUSCA)
+            reg["etag"], reg["arquivos"] = etag, novo
+
+        try:
+            store = _historico()
+        except Exception:
+            store = None
+        meses = store.partitions() if store is not None else []
+        if meses:
+            # meses que mudaram, todos de uma vez (na primeira indexação, o histórico inteiro)
+            store.prefetch(meses)
+        for mes in meses:
+            feitos = reg["historico"].setdefault(mes, set())
+            for nome, anexo in store.chunks(mes):
+                if nome in feitos:
+                    continue
+                # uma linha pode citar vários IDs ("A, B"): um documento por ID
+                novas = anexo.reset_index().rename(columns={"index": "_linha"})
+                novas["ID"] = novas["ID"].astype(str).str.split(",")
+                novas = novas.explode("ID")
+                novas["ID"] = normalize_keys(novas["ID"])
+                novas = novas[novas["ID"] != ""]
+                indice.add_frame(novas, [("historico", mes, nome, l, i) for l, i in zip(novas["_linha"], novas["ID"])],
+                                 list(novas["ID"]), ["Observação"])
+                feitos.add(nome)
+    return indice
+
+
+# ===== IDs: autocompletar e validação =====
+# Selo exibido ao lado de cada ID sugerido, por status
+SELOS_STATUS = {"ARQUIVADO": "🟢", "DESARQUIVADO": "🔴"}
+# Quantas sugestões aparecem para um ID incompleto
+LIMITE_SUGESTOES = 8
+
+
+def _sugestoes_id(df: pd.DataFrame, prefixo: str, k: int = LIMITE_SUGESTOES) -> dict:
+    """{ID: rótulo com selo de status} dos k primeiros IDs (em ordem) que começam com `prefixo`."""
+    linhas = df.iloc[_indice_arquivos(df).suggest(prefixo, k)]
+    return {
+        i: f"{SELOS_STATUS.get(s, '⚪')} {i} · {s or 'SEM STATUS'}"
+        for i, s in zip(linhas["_ID"], linhas["_STATUS"])
+    }
+
+
+def campo_id(df: pd.DataFrame, rotulo: str, key: str, placeholder: str = "") -> str:
+    """
+    Campo de ID com autocompletar: se o texto digitado não é um ID existente, oferece
+    os IDs que começam com ele (com o status). Devolve o ID escolhido ou o digitado, normalizado.
+    """
+    digitado = st.text_input(rotulo, key=key, placeholder=placeholder).strip().upper()
+    if not digitado or _indice_arquivos(df).get(digitado) is not None:
+        return digitado
+    sugestoes = _sugestoes_id(df, digitado)
+    if not sugestoes:
+        return digitado
+    escolha = st.selectbox(
+        "IDs que começam com o texto digitado",
+        [""] + list(sugestoes),
+        format_func=lambda i: sugestoes.get(i, "— usar o que foi digitado —"),
+        key=f"{key}_sugestao",
+    )
+    return escolha or digitado
+
+
+def validar_ids(df: pd.DataFrame, texto: str) -> tuple:
+    """
+    Lista de IDs colada (vírgula, ponto e vírgula, espaço ou quebra de linha) ->
+    (todos, conhecidos, desconhecidos, desarquivados), numa passada sobre o índice de IDs.
+    """
+    todos = parse_id_list(texto)
+    conhecidos, desconhecidos, desarquivados = _indice_arquivos(df).partition(todos, df["_STATUS"].to_numpy())
+    return todos, conhecidos, desconhecidos, desarquivados
+
+
+# ===== Tabelas paginadas =====
+def _controles_pagina(df: pd.DataFrame, key: str, colunas=None, colunas_data=(), ordenar: bool = True) -> tuple:
+    """
+    Controles de ordenação/paginação de uma tabela e a página atual já fatiada e formatada.
+    Só as linhas da página são formatadas e enviadas ao navegador.
+    Devolve (página, número da página).
+    """
+    colunas = [c for c in colunas if c in df.columns] if colunas else list(df.columns)
+    k_pag, k_tam, k_ord, k_asc = f"{key}_pagina", f"{key}_tamanho", f"{key}_ordem", f"{key}_crescente"
+
+    def _voltar_inicio():
+        st.session_state[k_pag] = 1
+
+    ordem, crescente = None, True
+    if ordenar:
+        col_ord, col_dir, col_tam = st.columns([2, 1, 1])
+        with col_ord:
+            ordem = st.selectbox("Ordenar por", [""] + colunas, key=k_ord, on_change=_voltar_inicio,
+                                 format_func=lambda c: c or "— ordem atual —")
+        with col_dir:
+            crescente = st.radio("Sentido", ["Crescente", "Decrescente"], key=k_asc, horizontal=True,
+                                 on_change=_voltar_inicio) == "Crescente"
+    else:
+        col_tam = st.container()
+    with col_tam:
+        tamanho = st.selectbox("Linhas por página", PAGE_SIZES, index=1, key=k_tam, on_change=_voltar_inicio)
+
+    # o total pode ter diminuído (filtro novo): a página guardada volta para o intervalo válido
+    n_paginas = page_count(len(df), tamanho)
+    st.session_state[k_pag] = min(max(1, int(st.session_state.get(k_pag, 1))), n_paginas)
+
+    def _mover(passo):
+        st.session_state[k_pag] = min(max(1, st.session_state[k_pag] + passo), n_paginas)
+
+    pagina_df, pagina, _ = paginate(df, st.session_state[k_pag], tamanho, ordem or None, crescente,
+                                    colunas, colunas_data)
+    col_ant, col_num, col_prox, col_total = st.columns([1, 2, 1, 4])
+    with col_ant:
+        st.button("◀", key=f"{key}_anterior", on_click=_mover, args=(-1,), disabled=pagina <= 1)
+    with col_num:
+        st.number_input("Página", min_value=1, max_value=n_paginas, step=1, key=k_pag,
+                        label_visibility="collapsed")
+    with col_prox:
+        st.button("▶", key=f"{key}_proxima", on_click=_mover, args=(1,), disabled=pagina >= n_paginas)
+    with col_total:
+        inicio = (pagina - 1) * tamanho
+        st.caption(f"{inicio + 1 if len(df) else 0}–{inicio + len(pagina_df)} de {len(df)} registro(s) · "
+                   f"página {pagina} de {n_paginas}")
+    return pagina_df, pagina
+
+
+def tabela_paginada(df: pd.DataFrame, key: str, colunas=None, colunas_data=(), ordenar: bool = True):
+    """`st.dataframe` só com a página visível (ordenação e fatia feitas aqui, no servidor)."""
+    pagina_df, _ = _controles_pagina(df, key, colunas, colunas_data, ordenar)
+    st.dataframe(pagina_df, use_container_width=True, hide_index=True)
+
+
+def _linha_historico(evento: str, id_val: str, responsavel_val: str,
+                     data_val: datetime, observacao_val: str = "",
+                     conteudo_val: str = "") -> dict:
+    return {
+        "Data": pd.to_datetime(data_val),
+        "Mudança": str(evento).upper(),
+        "ID": id_val,
+        "Conteúdo da Caixa": conteudo_val,
+        "Observação": observacao_val or "",
+        "Responsável": responsavel_val,
+    }
+
+
+def log_history_many(entries: list[dict], updates: dict[str, pd.DataFrame] | None = None):
+    """
+    Acrescenta várias linhas no histórico de uma vez (cada entrada com os parâmetros
+    de `log_history`). Com `updates`, as abas alteradas e o histórico vão num único
+    salvamento (o histórico só é gravado se houve alteração e depois dela).
+    """
+    linhas = [_linha_historico(**e) for e in entries]
+    update_sharepoint_file(file_name, updates=updates, keep_existing=True, historico=linhas)
 
 
 def log_history(evento: str, id_val: str, responsavel_val: str,
                 data_val: datetime, observacao_val: str = "",
                 conteudo_val: str = ""):
-    """Acrescenta uma linha no histórico e salva na sheet Historico mantendo abas existentes."""
-    try:
-        hist_df, hist_sheet = get_history_df()
-        nova_linha = {
-            "Mudança": str(evento).upper(),
-            "Data": pd.to_datetime(data_val),
-            "ID": id_val,
-            "Conteúdo da Caixa": conteudo_val,
-            "Responsável": responsavel_val,
-            "Observação": observacao_val or ""
-        }
-        novo_hist = pd.concat([hist_df, pd.DataFrame([nova_linha])], ignore_index=True)
-        novo_hist = _normalize_history_df(novo_hist)
-        update_sharepoint_file(file_name, novo_hist, sheet_name=hist_sheet, keep_existing=True)
-    except Exception as e:
-        st.warning(f"Não foi possível registrar histórico: {e}")
+    """Acrescenta uma linha no histórico."""
+    log_history_many([dict(
+        evento=evento, id_val=id_val, responsavel_val=responsavel_val, data_val=data_val,
+        observacao_val=observacao_val, conteudo_val=conteudo_val,
+    )])
 
 
 
@@ -245,7 +908,19 @@ with st.sidebar:
         st.rerun()  
 
 
-    df, df_espacos, df_selects, Retencao_df, df_hist = carregar_excel()
+    # Só lê as abas que a aba escolhida usa (Arquivos não é necessária em Histórico/Opções)
+    abas_usadas = ("Espaços", "Selectboxes", "Retenção")
+    if aba not in ("Histórico", "⚙️ Opções"):
+        abas_usadas += ("Arquivos",)
+    df, df_espacos, df_selects, Retencao_df, df_hist = carregar_excel(abas_usadas)
+
+    # Escritas ainda no diário (aguardando o SharePoint)
+    _j = _diario()
+    if _j is not None:
+        if _j.pending(file_name):
+            st.caption(f"⏳ {len(_j.pending(file_name))} alteração(ões) aguardando envio ao SharePoint")
+        if _j.failed():
+            st.error(f"{len(_j.failed())} alteração(ões) não puderam ser enviadas ao SharePoint (ver {JOURNAL_PATH}).")
     # Estruturas (Espaços)
     estruturas = {
         f"ARQUIVO {str(row['Arquivo']).strip().upper()}": {
@@ -374,10 +1049,9 @@ if aba == "Cadastrar":
         return f"{abrev_tipo(tipo_doc)}{letras}"  # 4 letras
     
     # --------------------------------
-    # Capacidade do sufixo (AUMENTADA)
+    # Capacidade do sufixo: NUM_DIGITS / CAP_MAX vêm de id_index
+    # (3 dígitos -> 000A..999Z = 26.000 IDs por prefixo)
     # --------------------------------
-    NUM_DIGITS = 3  # 3 -> 000..999  (se precisar mais, use 4 -> 0000..9999)
-    CAP_MAX = (10 ** NUM_DIGITS) * 26  # 26.000 IDs por prefixo
 
     # -----------------------------
     # Conversões N..NL <-> índice (000A..999Z)
@@ -397,125 +1071,12 @@ if aba == "Cadastrar":
         letra = chr(ord('A') + letra_idx)
         return f"{num:0{NUM_DIGITS}d}{letra}"
 
-    def sufixo_to_idx(nnletra: str) -> int:
-        m = re.fullmatch(rf"(\d{{{NUM_DIGITS}}})([A-Z])", nnletra)
-        if not m:
-            raise ValueError(f"Sufixo inválido: {nnletra}")
-        num = int(m.group(1))
-        letra = m.group(2)
-        return num * 26 + (ord(letra) - ord('A'))
-
-    def extrair_prefixo_e_idx(id_str: str):
-        """
-        De PPPP + N..NL (ex.: ESA7 000A) -> (prefixo='ESA7', idx=int).
-        Ignora formatos fora do padrão.
-        """
-        if not isinstance(id_str, str):
-            return None
-        s = id_str.strip().upper()
-        m = re.fullmatch(rf"([A-Z0-9]{{4}})(\d{{{NUM_DIGITS}}}[A-Z])", s)
-        if not m:
-            return None
-        prefixo = m.group(1)
-        sufixo = m.group(2)
-        try:
-            idx = sufixo_to_idx(sufixo)
-        except Exception:
-            return None
-        return prefixo, idx
-
-
-    @st.cache_data(show_spinner=False)
-    def ler_arquivos_existentes(path):
-        try:
-            return pd.read_excel(path, sheet_name="Arquivos")
-        except FileNotFoundError:
-            return pd.DataFrame()
-
-    def carregar_ultimo_idx_por_prefixo():
-        if "ultimo_idx_por_prefixo" in st.session_state:
-            return st.session_state["ultimo_idx_por_prefixo"]
-
-        # prioriza df que você salvou em session_state dentro do update_sharepoint_file
-        base_df = st.session_state.get("df_Arquivos", df)
-
-        ultimo = {}
-        if base_df is not None and not base_df.empty and "ID" in base_df.columns:
-            for val in base_df["ID"].astype(str):
-                parsed = extrair_prefixo_e_idx(val)
-                if parsed:
-                    prefixo, idx = parsed
-                    if prefixo not in ultimo or idx > ultimo[prefixo]:
-                        ultimo[prefixo] = idx
-
-        st.session_state["ultimo_idx_por_prefixo"] = ultimo
-        return ultimo
-
-
-
-    def proximo_idx_para_prefixo(prefixo: str, df_mem: pd.DataFrame = None) -> int:
-        """
-        Calcula o próximo índice (0..CAP_MAX-1) para um prefixo, considerando:
-          1) cache de 'ultimo_idx_por_prefixo' (do DataFrame em memória)
-          2) opcionalmente o df em memória adicional (para prévia)
-        """
-        ultimo = carregar_ultimo_idx_por_prefixo()
-        base = ultimo.get(prefixo, -1)
-
-        # também olha o df em memória (IDs desta sessão já carregados em df, antes de salvar)
-        if df_mem is not None and not df_mem.empty and "ID" in df_mem.columns:
-            padrao = re.compile(rf"^{re.escape(prefixo)}(\d{{{NUM_DIGITS}}}[A-Z])$")
-            for _id in df_mem["ID"].astype(str):
-                m = padrao.match(_id)
-                if m:
-                    try:
-                        idx_local = sufixo_to_idx(m.group(1))
-                        if idx_local > base:
-                            base = idx_local
-                    except Exception:
-                        pass
-
-        proximo = base + 1
-        if proximo >= CAP_MAX:
-            raise ValueError(
-                f"Capacidade esgotada para o prefixo {prefixo} "
-                f"(000A..{10**NUM_DIGITS - 1:0{NUM_DIGITS}d}Z)."
-            )
-        return proximo
-
-
-
-
-
     def garantir_id_definitivo_prefixado(origem_depto: str, tipo_doc: str, df_mem: pd.DataFrame):
-        # zera o cache de último índice para recomputar com df atualizado
-        st.session_state.pop("ultimo_idx_por_prefixo", None)
-        ultimo = carregar_ultimo_idx_por_prefixo() or {}
-
+        # reserva no controle central (nunca abaixo do maior sufixo já na planilha)
         prefixo = montar_prefixo(origem_depto, tipo_doc)
-        base = ultimo.get(prefixo, -1)
-
-        # procura o maior índice já usado para esse prefixo no df em memória
-        if df_mem is not None and not df_mem.empty and "ID" in df_mem.columns:
-            padrao = re.compile(rf"^{re.escape(prefixo)}(\d{{{NUM_DIGITS}}}[A-Z])$")
-            for _id in df_mem["ID"].astype(str):
-                m = padrao.match(_id)
-                if m:
-                    try:
-                        base = max(base, sufixo_to_idx(m.group(1)))
-                    except Exception:
-                        pass
-
-        proximo = base + 1
-        if proximo >= CAP_MAX:
-            raise ValueError(
-                f"Capacidade esgotada para o prefixo {prefixo} "
-                f"(000A..{10**NUM_DIGITS - 1:0{NUM_DIGITS}d}Z)."
-            )
-
-        ultimo[prefixo] = proximo
-        st.session_state["ultimo_idx_por_prefixo"] = ultimo
-
+        indice = _indice_ids()
+        proximo = _alocador().allocate(prefixo, floor=indice.max_idx(prefixo))
+        indice.observe(prefixo, proximo)
         return f"{prefixo}{idx_to_sufixo(proximo)}", df_mem
 
 
@@ -595,6 +1156,10 @@ if aba == "Cadastrar":
     col7, col8 = st.columns(2)
     with col7:
         caixa = st.text_input("Caixa*", key="tx_caixa")
+        if local and estante and prateleira and caixa:
+            na_caixa = _indice_locais(df).count(local, estante, prateleira, caixa)
+            if na_caixa:
+                st.caption(f"📦 Esta caixa já tem {na_caixa} documento(s) cadastrado(s)")
     with col8:
 
         codificacao = st.text_input("Codificação", key="tx_codificacao") or "N/A"
@@ -637,29 +1202,28 @@ if aba == "Cadastrar":
         try:
             prefixo_atual = montar_prefixo(origem_depto, tipo_doc)
 
-            # Pega do cache/disco o último índice usado por prefixo
-            ultimo_idx_por_prefixo = carregar_ultimo_idx_por_prefixo()
-            base = ultimo_idx_por_prefixo.get(prefixo_atual, -1)  # -1 significa que ainda não existe
-
-            proximo_idx = base + 1
-            # 000A..999Z => (10**NUM_DIGITS)*26 possibilidades
+            # Prévia do próximo índice (lease local / último reservado; sem ida ao SharePoint)
+            proximo_idx = _alocador().peek(prefixo_atual, floor=_indice_ids().max_idx(prefixo_atual))
             if proximo_idx >= CAP_MAX:
-                raise ValueError(
-                    f"Capacidade esgotada para o prefixo {prefixo_atual} "
-                    f"(000A..{10**NUM_DIGITS - 1:0{NUM_DIGITS}d}Z)."
-                )
+                raise ValueError(f"Capacidade esgotada para o prefixo {prefixo_atual}.")
 
             id_atual = f"{prefixo_atual}{idx_to_sufixo(proximo_idx)}"
 
             # Guarda em sessão para manter consistente com o ID definitivo no salvar
             st.session_state.id_preview = id_atual
 
-            # Mostra somente o ID atual
-            st.caption(f"ID atual: **{id_atual}**")
+            # Mostra somente o ID atual (e quanto do prefixo já foi usado)
+            st.caption(f"ID atual: **{id_atual}** · prefixo {proximo_idx / CAP_MAX:.1%} usado")
 
         except Exception as e:
             st.error(f"Erro ao calcular o ID: {e}")
 
+    with st.expander("📊 Capacidade de IDs por prefixo"):
+        try:
+            st.dataframe(_indice_ids().capacity(), use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.caption(f"Não foi possível calcular a capacidade: {e}")
+
 
     # Fluxo: Cadastrar
     if cadastrar and not st.session_state.ja_salvou:
@@ -683,6 +1247,9 @@ if aba == "Cadastrar":
             except ValueError as e:
                 st.error(str(e))
                 st.stop()
+            except Exception as e:
+                st.error(f"Não foi possível reservar o ID: {e}")
+                st.stop()
 
             novo_doc = {
                 "ID": unique_id,
@@ -740,34 +1307,24 @@ if aba == "Cadastrar":
 elif aba == "Movimentar":
     st.header("📦 Movimentar Documento(s) de Lugar")
 
-    # Entrada múltipla de IDs, separados por vírgula
-    ids_raw = st.text_input(
+    # Entrada múltipla de IDs (lista colada: vírgula, espaço ou um por linha)
+    ids_raw = st.text_area(
         "Informe um ou mais IDs para movimentação",
         placeholder="Ex: GQES00, GQES01, EQOT12"
     )
 
-    # Parse dos IDs: remove espaços, força maiúsculas e deduplica mantendo ordem
-    def parse_ids(s: str):
-        if not s:
-            return []
-        vistos = set()
-        ids = []
-        for part in s.split(","):
-            p = part.strip().upper()
-            if p and p not in vistos:
-                vistos.add(p)
-                ids.append(p)
-        return ids
-
-    ids_list = parse_ids(ids_raw)
+    # IDs normalizados e deduplicados, já separados em conhecidos / desconhecidos / desarquivados
+    ids_list, ids_elegiveis, faltando, ids_desarquivados = validar_ids(df, ids_raw)
 
     # Filtra no DF
     if ids_list:
-        # DF com ID_UP para facilitar comparações em maiúsculas
-        df_ids_upper = df.assign(ID_UP=df["ID"].astype(str).str.upper())
-        encontrados_df = df_ids_upper[df_ids_upper["ID_UP"].isin(ids_list)].copy()
-        encontrados = encontrados_df["ID_UP"].tolist()
-        faltando = [i for i in ids_list if i not in encontrados]
+        # linhas pelo índice de IDs (_ID = ID já normalizado pelo schema)
+        encontrados_df = _indice_arquivos(df).rows(df, ids_list).copy()
+        encontrados = encontrados_df["_ID"].tolist()
+        st.caption(
+            f"{len(ids_list)} ID(s) informado(s): {len(ids_elegiveis)} elegível(eis) · "
+            f"{len(faltando)} não encontrado(s) · {len(ids_desarquivados)} desarquivado(s)"
+        )
 
         # Feedback ao usuário
         if encontrados:
@@ -775,11 +1332,7 @@ elif aba == "Movimentar":
 
             # --------- BLOQUEIO: Status = DESARQUIVADO ---------
             # Separa bloqueados e movíveis
-            status_col = "Status" if "Status" in encontrados_df.columns else None
-            if status_col:
-                bloqueados_mask = encontrados_df[status_col].astype(str).str.upper().eq("DESARQUIVADO")
-            else:
-                bloqueados_mask = pd.Series([False] * len(encontrados_df), index=encontrados_df.index)
+            bloqueados_mask = encontrados_df["_ID"].isin(ids_desarquivados)
 
             bloqueados_df = encontrados_df[bloqueados_mask].copy()
             moveis_df    = encontrados_df[~bloqueados_mask].copy()
@@ -790,7 +1343,7 @@ elif aba == "Movimentar":
                 # Formata Data Desarquivamento se existir
                 if "Data Desarquivamento" in bloqueados_df.columns:
                     try:
-                        bloqueados_df["Data Desarquivamento"] = pd.to_datetime(bloqueados_df["Data Desarquivamento"]).dt.strftime("%d/%m/%Y")
+                        bloqueados_df["Data Desarquivamento"] = bloqueados_df["Data Desarquivamento"].dt.strftime("%d/%m/%Y")
                     except Exception:
                         pass
 
@@ -815,10 +1368,10 @@ elif aba == "Movimentar":
                         "ID", "Local", "Estante", "Prateleira",
                         "Data Arquivamento", "Responsável Arquivamento"
                     ]
-                    atual_df = df[df["ID"].astype(str).str.upper().isin(moveis_df["ID_UP"])].copy()
+                    atual_df = df.loc[moveis_df.index].copy()
                     if "Data Arquivamento" in atual_df.columns:
                         try:
-                            atual_df["Data Arquivamento"] = pd.to_datetime(atual_df["Data Arquivamento"]).dt.strftime("%d/%m/%Y")
+                            atual_df["Data Arquivamento"] = atual_df["Data Arquivamento"].dt.strftime("%d/%m/%Y")
                         except Exception:
                             pass
                     colunas_existentes = [c for c in show_cols if c in atual_df.columns]
@@ -832,7 +1385,7 @@ elif aba == "Movimentar":
             st.warning(f"Não encontrado(s): {', '.join(faltando)}")
 
         # ---------- UI para movimentar APENAS os elegíveis ----------
-        moveis_ids = moveis_df["ID_UP"].tolist() if encontrados else []
+        moveis_ids = moveis_df["_ID"].tolist() if encontrados else []
 
         if moveis_ids:
             st.info(f"{len(moveis_ids)} documento(s) elegível(eis) para movimentação.")
@@ -846,6 +1399,9 @@ elif aba == "Movimentar":
                 estante = st.selectbox("Nova Estante", estantes_disp)
             with col2:
                 prateleira = st.selectbox("Nova Prateleira", prateleiras_disp)
+            # ocupação do destino pelo índice de posições
+            ocupados_destino = _indice_locais(df).count(local, estante, prateleira)
+            st.caption(f"📦 {local}/{estante}/{prateleira}: {ocupados_destino} documento(s) já nesta prateleira")
             col3 = responsavel_operacao = st.selectbox(
                     "Responsável pela Operação", 
                     responsaveis,
@@ -854,7 +1410,7 @@ elif aba == "Movimentar":
 
             # Confirmar movimentação para TODOS os elegíveis
             if st.button("Confirmar Movimentação"):
-                idxs = df[df["ID"].astype(str).str.upper().isin(moveis_ids)].index
+                idxs = moveis_df.index
 
                 # --- (opcional) pegar origem antes de mudar, para registrar na observação ---
                 cols_prev = [c for c in ["Local", "Estante", "Prateleira"] if c in df.columns]
@@ -897,34 +1453,14 @@ elif aba == "Movimentar":
                     "Observação": observacao,
                 }
 
-                # === 2) OPÇÃO A: CARREGA/CRIA 'Historico' E APENDA UMA LINHA PRESERVANDO O QUE JÁ EXISTE ===
-                try:
-                    df_hist = carregar_excel(file_name, sheet_name="Historico")
-                    if df_hist is None or not isinstance(df_hist, pd.DataFrame):
-                        raise Exception("Historico inexistente")
-                except Exception:
-                    df_hist = pd.DataFrame(columns=[
-                        "Data", "Responsável", "Mudança", "ID", "Conteúdo da Caixa", "Observação"
-                    ])
-
-                # adiciona 1 linha ao final (sem reescrever as anteriores)
-                df_hist.loc[len(df_hist)] = registro_hist
-
-                
-                
-
-                # === 3) APLICAR AS MUDANÇAS NA PLANILHA PRINCIPAL E SALVAR ===
-                df.loc[idxs, "Local"] = local
+                # === 2) APLICAR AS MUDANÇAS NA PLANILHA PRINCIPAL E SALVAR ===
+                assign(df, idxs, "Local", local)
                 df.loc[idxs, "Estante"] = estante
                 df.loc[idxs, "Prateleira"] = prateleira
 
-                # salva a aba 'Historico' mantendo o resto do arquivo
-                update_sharepoint_file(file_name, updates={
-                    "Historico": df_hist,
-                    "Arquivos": df
-                    },
-                    keep_existing=True
-                )
+                # salva a aba 'Arquivos' mantendo o resto do arquivo; a linha do histórico vai junto
+                update_sharepoint_file(file_name, updates={"Arquivos": df}, keep_existing=True,
+                                       historico=[registro_hist])
 
                 # Feedback pós-movimentação
                 st.success(f"Movimentação concluída para: {', '.join(ids_movidos)}")
@@ -942,11 +1478,11 @@ elif aba == "Status":
     st.header("📤 Gerenciar Status do Documento")
     
     # Passo 1: Seleção do ID
-    id_input = st.text_input("Digite o ID do Documento", placeholder="Ex: GQES00A")
+    id_input = campo_id(df, "Digite o ID do Documento", "tx_status_id", placeholder="Ex: GQES00A")
     
     if id_input:
-        id_input = id_input.strip().upper()
-        resultado = df[df["ID"] == id_input].copy()
+        pos_status = _indice_arquivos(df).get(id_input)
+        resultado = df.iloc[[pos_status]].copy() if pos_status is not None else df.iloc[0:0]
         
         if not resultado.empty:
             # Mostra informações do documento
@@ -959,9 +1495,7 @@ elif aba == "Status":
             ]].copy()
             
             if "Data Arquivamento" in resultado_display.columns:
-                resultado_display["Data Arquivamento"] = pd.to_datetime(
-                    resultado_display["Data Arquivamento"]
-                ).dt.strftime("%d/%m/%Y")
+                resultado_display["Data Arquivamento"] = resultado_display["Data Arquivamento"].dt.strftime("%d/%m/%Y")
             
             st.dataframe(resultado_display, use_container_width=True)
             
@@ -1016,7 +1550,7 @@ elif aba == "Status":
                         st.warning("⚠️ Selecione o responsável pela operação")
                     else:
                         try:
-                            idx = df[df["ID"] == id_input].index[0]
+                            idx = df.index[pos_status]
                             status_atual = str(df.at[idx, "Status"]).strip().upper()
 
                             if operacao_desarquivar:
@@ -1026,9 +1560,9 @@ elif aba == "Status":
                                     st.stop()
 
                                 # Desarquivar: ARQUIVADO → DESARQUIVADO
-                                df.at[idx, "Status"] = "DESARQUIVADO"
+                                assign(df, idx, "Status", "DESARQUIVADO")
                                 df.at[idx, "Responsável Desarquivamento"] = responsavel_operacao
-                                df.at[idx, "Data Desarquivamento"] = data_operacao.strftime("%d/%m/%Y")
+                                assign(df, idx, "Data Desarquivamento", data_operacao)
 
                                 # Inicializa colunas se não existirem
                                 if "Observação Desarquivamento" not in df.columns:
@@ -1039,15 +1573,15 @@ elif aba == "Status":
 
                             elif operacao_rearquivar:
                                 # Rearquivar: DESARQUIVADO → ARQUIVADO
-                                df.at[idx, "Status"] = "ARQUIVADO"
+                                assign(df, idx, "Status", "ARQUIVADO")
                                 df.at[idx, "Responsável Arquivamento"] = responsavel_operacao
-                                df.at[idx, "Data Arquivamento"] = data_operacao.strftime("%d/%m/%Y")
+                                assign(df, idx, "Data Arquivamento", data_operacao)
 
                                 # Limpa campos de desarquivamento
                                 if "Responsável Desarquivamento" in df.columns:
                                     df.at[idx, "Responsável Desarquivamento"] = ""
                                 if "Data Desarquivamento" in df.columns:
-                                    df.at[idx, "Data Desarquivamento"] = ""
+                                    assign(df, idx, "Data Desarquivamento", "")
                                 if "Observação Desarquivamento" in df.columns:
                                     df.at[idx, "Observação Desarquivamento"] = ""
                             
@@ -1078,32 +1612,9 @@ elif aba == "Status":
                                 "Observação": observacao,
                             }
 
-                            # === utilitário de leitura da planilha "Historico" ===
-                            # Troque `load_sharepoint_file` pelo leitor que você já usa no app para ler sheets.
-                            try:
-                                df_hist = carregar_excel(file_name, sheet_name="Historico")
-                                # Se vier vazio/None por alguma razão, inicializa
-                                if df_hist is None or not isinstance(df_hist, pd.DataFrame):
-                                    raise Exception("Historico inexistente")
-                            except Exception:
-                                df_hist = pd.DataFrame(columns=[
-                                    "Data",
-                                    "Responsável",
-                                    "Mudança",
-                                    "ID",
-                                    "Conteúdo da Caixa",
-                                    "Observação",
-                                ])
-
-                            # Anexa a nova linha e salva a aba Historico
-                            df_hist = pd.concat([df_hist, pd.DataFrame([registro_hist])], ignore_index=True)
-
-                            update_sharepoint_file(
-                                file_name,
-                                df=df, sheet_name="Arquivos",
-                                df_hist=df_hist, history_sheet_name="Historico",
-                                keep_existing=True
-                            )
+                            # Salva a aba Arquivos; a linha do histórico vai no mesmo salvamento
+                            update_sharepoint_file(file_name, df=df, sheet_name="Arquivos", keep_existing=True,
+                                                   historico=[registro_hist])
 
 
 
@@ -1129,27 +1640,21 @@ elif aba == "Status":
             st.warning(f"⚠️ Documento com ID '{id_input}' não encontrado!")
 
     # Seção de documentos desarquivados
-    desarquivados = df[df["Status"] == "DESARQUIVADO"].copy()
+    desarquivados = df[df["_STATUS"] == "DESARQUIVADO"].copy()
     total_desarquivados = len(desarquivados)
     with st.expander(f"📄 Ver Documentos Desarquivados ({total_desarquivados})"):
         if not desarquivados.empty:
-            desarquivados["Data Desarquivamento"] = pd.to_datetime(
-            desarquivados["Data Desarquivamento"],
-            format="%d/%m/%Y",
-            errors="coerce",
-        )
-
-
             # Inicializa a coluna se estiver faltando
             if "Observação Desarquivamento" not in desarquivados.columns:
                 desarquivados["Observação Desarquivamento"] = ""
 
-            st.dataframe(desarquivados[[
+            # só a página visível é formatada (Data Desarquivamento já é datetime64 pelo schema)
+            tabela_paginada(desarquivados, "tab_desarquivados", [
                 "Status","ID","Conteúdo da Caixa", "Tipo de Documento", "Local", 
                 "Estante", "Prateleira", "Caixa", "Solicitante",
                 "Responsável Arquivamento", "Data Desarquivamento", 
                 "Observação Desarquivamento"
-            ]])
+            ], ["Data Desarquivamento"])
 
             # Destaque visual para desarquivamentos parciais (opcional)
             parciais = desarquivados[desarquivados["Observação Desarquivamento"].astype("string").fillna("").str.contains("parcial", case=False)]
@@ -1287,47 +1792,88 @@ elif aba == "Consultar":
         st.subheader("🔎 Consulta de Documentos")
         st.markdown("<br>", unsafe_allow_html=True)
 
+    st.subheader("🔤 Buscar por conteúdo")
+    st.caption("Procura em Conteúdo da Caixa, Codificação, Tag, Lacre, Livro e observações (inclusive do histórico). "
+               "Sem diferença de acento ou maiúsculas; palavras incompletas também valem.")
+    termo_busca = st.text_input("Palavras", key="tx_busca_texto", placeholder="Ex: CRF estudo 123")
+    if termo_busca.strip():
+        with st.spinner("Buscando..."):
+            achados = _indice_texto().search(termo_busca, limit=LIMITE_BUSCA)
+        relevancia = dict(achados)
+        resultado_busca = _indice_arquivos(df).rows(df, [i for i, _ in achados]).copy()
+        if resultado_busca.empty:
+            st.info("Nenhum documento encontrado para essas palavras.")
+        else:
+            resultado_busca.insert(0, "Relevância", resultado_busca["_ID"].map(relevancia).round(1))
+            colunas_busca = ["Relevância", "ID", "Status", "Conteúdo da Caixa", "Codificação", "Tag", "Lacre", "Livro",
+                             "Local", "Estante", "Prateleira", "Caixa", "Data Arquivamento"]
+            st.caption(f"{len(resultado_busca)} documento(s), do mais relevante para o menos"
+                       + (f" (mostrando os {LIMITE_BUSCA} primeiros)" if len(achados) >= LIMITE_BUSCA else ""))
+            tabela_paginada(resultado_busca, "tab_busca_texto", colunas_busca, ["Data Arquivamento"])
+    st.markdown("<br>", unsafe_allow_html=True)
+
     st.subheader("📄 Buscar por Codificação")
     opcoes_cod = sorted(df["Codificação"].dropna().unique())
     opcoes_cod = sorted(df["Codificação"].dropna().unique())
     cod_select = st.selectbox("Selecione a Codificação do Documento", [""] + list(opcoes_cod))
 
+    # a busca fica guardada na sessão para a paginação (cada clique de página é um novo run)
     if st.button("Buscar por Codificação") and cod_select:
-        resultado = df[df["Codificação"] == cod_select].copy()
+        st.session_state["consulta_codificacao"] = cod_select
+    cod_buscada = st.session_state.get("consulta_codificacao")
+    if cod_buscada:
+        resultado = df[df["Codificação"] == cod_buscada]
         if not resultado.empty:
-            resultado["Data Arquivamento"] = pd.to_datetime(resultado["Data Arquivamento"]).dt.strftime("%d/%m/%Y")
-            st.dataframe(resultado[["ID","Status", "Conteúdo da Caixa", "Tipo de Documento","Departamento Origem", "Local", "Estante", "Prateleira", "Caixa", "Responsável Arquivamento", "Data Arquivamento"]])
+            st.markdown(f"**Codificação {cod_buscada}:**")
+            tabela_paginada(resultado, "tab_codificacao",
+                            ["ID","Status", "Conteúdo da Caixa", "Tipo de Documento","Departamento Origem", "Local",
+                             "Estante", "Prateleira", "Caixa", "Responsável Arquivamento", "Data Arquivamento"],
+                            ["Data Arquivamento"])
         else:
             st.warning("Nenhum documento encontrado com esta codificação.")
     st.markdown("<br>", unsafe_allow_html=True)
 
     st.subheader("📅 Buscar por Período")
-    col1, col2 = st.columns(2)
-    with col1:
-        data_ini = st.date_input("Data Inicial", value=date.today(), format="DD/MM/YYYY")
-    with col2:
-        data_fim = st.date_input("Data Final", value=date.today(), format="DD/MM/YYYY")
+    col_campo, col_atalho = st.columns(2)
+    with col_campo:
+        campo_data = st.selectbox("Data considerada", CAMPOS_DATA, key="sb_periodo_campo")
+    with col_atalho:
+        atalho = st.selectbox("Período", ATALHOS_PERIODO, key="sb_periodo_atalho")
+    if atalho == "Personalizado":
+        col1, col2 = st.columns(2)
+        with col1:
+            data_ini = st.date_input("Data Inicial", value=date.today(), format="DD/MM/YYYY")
+        with col2:
+            data_fim = st.date_input("Data Final", value=date.today(), format="DD/MM/YYYY")
+    else:
+        data_ini, data_fim = _periodo_atalho(atalho, date.today())
+        st.caption(f"De {data_ini:%d/%m/%Y} a {data_fim:%d/%m/%Y}")
 
     if st.button("Buscar por Período"):
-        filtrado = df[
-            (df["Data Arquivamento"] >= pd.to_datetime(data_ini)) &
-            (df["Data Arquivamento"] <= pd.to_datetime(data_fim))
-        ].copy()
+        st.session_state["consulta_periodo"] = (campo_data, data_ini, data_fim)
+    if st.session_state.get("consulta_periodo"):
+        campo_buscado, ini_buscado, fim_buscado = st.session_state["consulta_periodo"]
+        # índice ordenado da coluna de data: busca binária, fim inclusivo (o dia inteiro)
+        filtrado = df.iloc[_indice_datas(df, campo_buscado).between(ini_buscado, fim_buscado)]
 
         if filtrado.empty:
             st.info("Nenhum documento encontrado no período especificado.")
         else:
-            filtrado["Data Arquivamento"] = pd.to_datetime(filtrado["Data Arquivamento"]).dt.strftime("%d/%m/%Y")
-            st.dataframe(filtrado[["Status", "ID", "Codificação", "Conteúdo da Caixa", "Tipo de Documento", "Local", "Estante", "Prateleira", "Caixa", "Responsável Arquivamento", "Data Arquivamento"]])
+            colunas_periodo = ["Status", "ID", "Codificação", "Conteúdo da Caixa", "Tipo de Documento", "Local",
+                               "Estante", "Prateleira", "Caixa", "Responsável Arquivamento", "Data Arquivamento"]
+            if campo_buscado not in colunas_periodo:
+                colunas_periodo.append(campo_buscado)
+            st.caption(f"{campo_buscado} de {ini_buscado:%d/%m/%Y} a {fim_buscado:%d/%m/%Y}")
+            tabela_paginada(filtrado, "tab_periodo", colunas_periodo, CAMPOS_DATA)
         
     st.markdown("<br>", unsafe_allow_html=True)
 
     # ===== Consulta específica por ID =====
     st.subheader("🎯 Consulta específica")
     st.text("Veja toda informação referente ao documento")
-    id_consulta = st.text_input("Informe o ID do documento", key="tx_consulta_id").strip().upper()
+    id_consulta = campo_id(df, "Informe o ID do documento", "tx_consulta_id")
     if id_consulta:
-        registro = df[df["ID"].astype(str).str.upper() == id_consulta].copy()
+        registro = to_excel_frame(_indice_arquivos(df).rows(df, [id_consulta]))
         if registro.empty:
             st.warning("ID não encontrado.")
         else:
@@ -1415,6 +1961,13 @@ elif aba == "Editar":
         if filtered_df.empty:
             st.info("Nenhum documento encontrado com os filtros selecionados.")
             return
+        # 🔒 Somente estas colunas poderão ser editadas
+        COLS_EDITAVEIS = {"Status", "Conteúdo da Caixa"}
+
+        # só a página visível vai para o editor (as edições valem para as linhas da página)
+        filtered_df, pagina = _controles_pagina(filtered_df, f"{key_prefix}_paginas", ordenar=False)
+        # sem as colunas derivadas do schema; categorias viram texto livre no editor
+        filtered_df = to_excel_frame(filtered_df)
 
         colunas_visiveis = _colunas_preenchidas(filtered_df, COLS_EDITAVEIS)
         if "ID" in filtered_df.columns and "ID" not in colunas_visiveis:
@@ -1424,9 +1977,6 @@ elif aba == "Editar":
         editor_df.insert(0, "__df_index", filtered_df.index)
         editor_df.reset_index(drop=True, inplace=True)
 
-        # 🔒 Somente estas colunas poderão ser editadas
-        COLS_EDITAVEIS = {"Status", "Conteúdo da Caixa"}
-
         # (opcional) lista de status para select — ajuste conforme seu domínio
         lista_status = ["Pendente", "Arquivado", "Em processamento", "Rearquivar", "Conferido"]
 
@@ -1461,7 +2011,7 @@ elif aba == "Editar":
                 editor_df,
                 use_container_width=True,
                 num_rows="fixed",
-                key=f"{key_prefix}_editor",
+                key=f"{key_prefix}_editor_{pagina}",
                 column_config=column_config,
                 hide_index=True,
                 # não use disabled=True aqui, senão trava tudo
@@ -1520,9 +2070,10 @@ elif aba == "Editar":
                 return
 
             momento_alteracao = datetime.now()
+            entradas_hist = []
             for idx, mudancas in alteracoes.items():
                 for coluna, _, valor_novo in mudancas:
-                    df.at[idx, coluna] = valor_novo
+                    assign(df, idx, coluna, valor_novo)
 
                 linha_final = edited_df.loc[idx]
                 descricao_alteracoes = "; ".join(
@@ -1533,27 +2084,22 @@ elif aba == "Editar":
                 if observacao_alt and observacao_alt.strip():
                     observacao_hist += f". Observação do usuário: {observacao_alt.strip()}"
 
-                log_history(
+                entradas_hist.append(dict(
                     evento="EDIÇÃO",
                     id_val=str(linha_final.get("ID", "")),
-                    solicitante_val=str(linha_final.get("Solicitante", "")),
                     responsavel_val=str(resp_alt),
                     data_val=momento_alteracao,
                     observacao_val=observacao_hist,
                     conteudo_val=str(linha_final.get("Conteúdo da Caixa", "")),
-                    local_val=str(linha_final.get("Local", "")),
-                    prateleira_val=str(linha_final.get("Prateleira", "")),
-                    estante_val=str(linha_final.get("Estante", "")),
-                )
+                ))
 
-            update_sharepoint_file(df, file_name, sheet_name="Arquivos", keep_existing=True)
+            # edições + histórico num único salvamento
+            log_history_many(entradas_hist, updates={"Arquivos": df})
             st.success(f"{len(alteracoes)} registro(s) atualizado(s).")
 
     id_busca = st.text_input("Pesquisar por ID", key="editar_busca_id").strip().upper()
     if id_busca:
-        id_series = _get_series(df, "ID").astype(str).str.upper()
-        filtro_id = id_series.str.contains(id_busca, na=False)
-        resultados_id = df[filtro_id].copy() if hasattr(filtro_id, "__len__") else pd.DataFrame()
+        resultados_id = df.iloc[_indice_arquivos(df).contains(id_busca)].copy()
         if resultados_id.empty:
             st.info("Nenhum documento encontrado para o ID informado.")
         else:
@@ -1563,34 +2109,32 @@ elif aba == "Editar":
     local_sel = ""
     estante_sel = ""
     prateleira_sel = ""
+    locais_idx = _indice_locais(df)
     with st.expander("Pesquisar por Local, Estante e Prateleira"):
         col_local, col_estante, col_prateleira = st.columns(3)
-        locais_disponiveis = [""] + sorted(_get_series(df, "Local").dropna().astype(str).str.strip().unique().tolist())
+        # opções em cascata direto do índice de posições (sem varrer a aba)
+        locais_disponiveis = [""] + locais_idx.children()
         with col_local:
             local_sel = st.selectbox("Local", locais_disponiveis, key="editar_local")
 
-        base_estantes = df
-        if local_sel:
-            mask_local = _get_series(df, "Local").fillna("").astype(str).str.strip().str.upper() == local_sel.strip().upper()
-            base_estantes = df[mask_local].copy()
-        estantes_disponiveis = [""] + sorted(_get_series(base_estantes, "Estante").dropna().astype(str).str.strip().unique().tolist())
+        estantes_disponiveis = [""] + (locais_idx.children(local_sel) if local_sel else
+                                       sorted({e for l in locais_idx.children() for e in locais_idx.children(l)}))
         with col_estante:
             estante_sel = st.selectbox("Estante", estantes_disponiveis, key="editar_estante")
 
-        base_prateleiras = base_estantes
-        if estante_sel:
-            mask_estante = _get_series(base_estantes, "Estante").fillna("").astype(str).str.strip().str.upper() == estante_sel.strip().upper()
-            base_prateleiras = base_estantes[mask_estante].copy()
-        prateleiras_disponiveis = [""] + sorted(_get_series(base_prateleiras, "Prateleira").dropna().astype(str).str.strip().unique().tolist())
+        if local_sel and estante_sel:
+            prateleiras_disponiveis = [""] + locais_idx.children(local_sel, estante_sel)
+        else:
+            prateleiras_disponiveis = [""] + sorted({
+                p for l in ([local_sel] if local_sel else locais_idx.children())
+                for e in locais_idx.children(l) if not estante_sel or e.upper() == estante_sel.upper()
+                for p in locais_idx.children(l, e)
+            })
         with col_prateleira:
             prateleira_sel = st.selectbox("Prateleira", prateleiras_disponiveis, key="editar_prateleira")
 
     if local_sel and estante_sel and prateleira_sel:
-        mask_local = _get_series(df, "Local").fillna("").astype(str).str.strip().str.upper() == local_sel.strip().upper()
-        mask_estante = _get_series(df, "Estante").fillna("").astype(str).str.strip().str.upper() == estante_sel.strip().upper()
-        mask_prateleira = _get_series(df, "Prateleira").fillna("").astype(str).str.strip().str.upper() == prateleira_sel.strip().upper()
-        mask_combinado = mask_local & mask_estante & mask_prateleira
-        resultados_combo = df[mask_combinado].copy()
+        resultados_combo = df.iloc[locais_idx.rows(local_sel, estante_sel, prateleira_sel)].copy()
         if resultados_combo.empty:
             st.info("Nenhum documento encontrado para a combinação selecionada.")
         else:
@@ -1640,11 +2184,16 @@ elif aba == "Desarquivar":
 elif aba == "Histórico":
     st.header("🕓 Histórico de Operações")
 
+    # Período (opcional): só os meses do intervalo são lidos
+    periodo = st.date_input("Período", value=(), format="DD/MM/YYYY")
+    inicio = periodo[0] if len(periodo) >= 1 else None
+    fim = periodo[1] if len(periodo) == 2 else inicio
+
     # Carrega histórico
-    hist, _ = get_history_df()
+    hist, _ = get_history_df(inicio, fim, newest_first=True)
 
     if hist.empty:
-        st.info("Nenhum histórico registrado ainda.")
+        st.info("Nenhum registro no período." if inicio else "Nenhum histórico registrado ainda.")
     else:
         # Normalização leve dos nomes (sem alias/renomeação)
         hist.columns = (
@@ -1683,23 +2232,6 @@ elif aba == "Histórico":
             filtro_id = f_id.strip().upper()
             filtrado = filtrado[filtrado["ID"].astype(str).str.upper().str.contains(filtro_id, na=False)]
 
-        # --- Ordenação por data e formatação robusta, cobrindo 2 formatos ---
-        if date_col is not None:
-            raw = filtrado[date_col].astype(str).str.strip()
-            # parse tolerante a "2025-10-21 00:00:00" e "21/10/2025"
-            dt = pd.to_datetime(raw, dayfirst=True, errors="coerce")
-
-            # Ordena usando coluna temporária
-            filtrado["_dt_tmp"] = dt
-            filtrado = filtrado.sort_values("_dt_tmp", ascending=False, na_position="last")
-
-            # Formata: onde parseou -> "dd/mm/YYYY HH:MM"; onde não parseou -> mantém texto original
-            fmt = dt.dt.strftime("%d/%m/%Y")
-            filtrado[date_col] = fmt.where(dt.notna(), raw)
-
-            # Remove coluna temporária
-            filtrado = filtrado.drop(columns=["_dt_tmp"])
-
         # --- Exibir SOMENTE as colunas do preferred_cols, na ordem, usando o nome de data que existir ---
         preferred_cols_base = ["Mudança", "ID", "Conteúdo da Caixa", "Responsável", "Observação"]
         if date_col is not None:
@@ -1709,5 +2241,8 @@ elif aba == "Histórico":
 
         cols_to_show = [c for c in preferred_cols if c in filtrado.columns]
 
-        st.dataframe(filtrado[cols_to_show] if cols_to_show else filtrado.iloc[0:0], use_container_width=True)
+        # Paginado: já vem do mais novo para o mais antigo; a data (ISO ou dd/mm/aaaa) é
+        # formatada só nas linhas da página, e o que não for data fica como texto original
+        tabela_paginada(filtrado if cols_to_show else filtrado.iloc[0:0], "tab_historico", cols_to_show,
+                        [date_col] if date_col is not None else ())
 
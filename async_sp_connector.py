@@ -0,0 +1,224 @@
+# async_sp_connector.py
+import io, time, random, asyncio, threading, httpx, pandas as pd
+from sp_connector import (
+    SPConnectorBase, PreconditionFailed, GRAPH,
+    RETRY_STATUSES, RETRY_TOTAL, RETRY_BACKOFF, RETRY_BACKOFF_MAX, POOL_SIZE, CONNECT_TIMEOUT,
+)
+
+# Quantas requisições ao Graph em voo ao mesmo tempo, por conector
+MAX_CONCURRENCY = 8
+
+
+class AsyncSPConnector(SPConnectorBase):
+    """
+    Variante assíncrona do SPConnector (mesma superfície: download, upload_small,
+    read_excel, write_excel, normalize_path), sobre `httpx.AsyncClient`.
+      - no máximo `max_concurrency` requisições simultâneas (semáforo)
+      - mesma política de retry do conector síncrono (Retry-After, backoff + jitter)
+      - `gather`, `download_many`, `get_metadata_many` para buscar vários itens em paralelo
+    O parse de Excel roda em thread (`asyncio.to_thread`) para não travar o loop.
+    Use como `async with AsyncSPConnector(...) as sp:` ou chame `aclose()` no fim.
+    """
+
+    def __init__(self, tenant_id, client_id, client_secret,
+                 hostname=None, site_path=None, library_name=None, user_upn=None,
+                 graph_url=GRAPH, max_concurrency=MAX_CONCURRENCY, pool_size=POOL_SIZE,
+                 retries=RETRY_TOTAL, connect_timeout=CONNECT_TIMEOUT,
+                 token_cache_path=None, refresh_in_background=False):
+        super().__init__(tenant_id, client_id, client_secret,
+                         hostname=hostname, site_path=site_path, library_name=library_name,
+                         user_upn=user_upn, graph_url=graph_url,
+                         token_cache_path=token_cache_path,
+                         refresh_in_background=refresh_in_background)
+        self.retries = retries
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(30, connect=connect_timeout),
+            follow_redirects=True,
+        )
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._discovery_lock = asyncio.Lock()
+        self._file_cache = {}                   # chave -> {"eTag", "content"}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    # -------- HTTP --------
+    async def _headers(self):
+        # MSAL é síncrono: busca/renova o token fora do loop
+        if not (self._tok and time.time() < self._exp):
+            await asyncio.to_thread(self._token)
+        return {"Authorization": f"Bearer {self._token()}"}
+
+    async def _request(self, method: str, url: str, *, auth: bool = True, headers=None, **kw):
+        """Requisição com semáforo + retry em 423/429/503/504 e falhas de conexão."""
+        attempt = 0
+        while True:
+            h = dict(headers or {})
+            if auth:
+                h.update(await self._headers())
+            try:
+                async with self._sem:
+                    r = await self._client.request(method, url, headers=h, **kw)
+            except httpx.TransportError:
+                if attempt >= self.retries:
+                    raise
+                r = None
+            if r is not None and (r.status_code not in RETRY_STATUSES or attempt >= self.retries):
+                return r
+            attempt += 1
+            await asyncio.sleep(self._retry_delay(r, attempt))
+
+    @staticmethod
+    def _retry_delay(r, attempt: int) -> float:
+        retry_after = r.headers.get("Retry-After") if r is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_BACKOFF_MAX)
+            except ValueError:
+                pass
+        delay = RETRY_BACKOFF * (2 ** (attempt - 1)) + random.uniform(0, RETRY_BACKOFF)
+        return min(delay, RETRY_BACKOFF_MAX)
+
+    # -------- Descoberta (apenas p/ SharePoint Site) --------
+    async def _drive_id(self):
+        if self.is_onedrive:
+            return None
+        async with self._discovery_lock:
+            if self._drive_id_cache:
+                return self._drive_id_cache
+            if not self._site_id_cache:
+                r = await self._request("GET", self._site_url())
+                r.raise_for_status()
+                self._site_id_cache = r.json()["id"]
+            r = await self._request("GET", f"{self.graph_url}/sites/{self._site_id_cache}/drives")
+            r.raise_for_status()
+            self._drive_id_cache = self._pick_drive(r.json().get("value", []))
+            return self._drive_id_cache
+
+    async def _item_url(self, path: str) -> str:
+        return self._item_url_for(path, await self._drive_id())
+
+    # -------- Metadados / Download / Upload --------
+    async def get_metadata(self, path: str) -> dict:
+        r = await self._request("GET", await self._item_url(path))
+        if r.status_code == 404:
+            raise FileNotFoundError(path)
+        r.raise_for_status()
+        return r.json()
+
+    async def download(self, path: str) -> bytes:
+        key = self._cache_key(path)
+        cached = self._file_cache.get(key)
+        headers = {"If-None-Match": cached["eTag"]} if cached else None
+        r = await self._request("GET", f"{await self._item_url(path)}:/content",
+                                headers=headers, timeout=180)
+        if r.status_code == 304 and cached:
+            return cached["content"]
+        if r.status_code == 404:
+            self._file_cache.pop(key, None)
+            raise FileNotFoundError(path)
+        r.raise_for_status()
+        etag = r.headers.get("ETag")
+        if etag:
+            self._file_cache[key] = {"eTag": etag, "content": r.content}
+        return r.content
+
+    async def upload_small(self, path: str, content: bytes, overwrite: bool = True, if_match: str = None):
+        params = {"@microsoft.graph.conflictBehavior": "replace" if overwrite else "fail"}
+        headers = {"If-Match": if_match} if if_match else None
+        r = await self._request("PUT", f"{await self._item_url(path)}:/content",
+                                headers=headers, params=params, content=content, timeout=300)
+        if r.status_code == 412:
+            raise PreconditionFailed(f"{path} foi alterado por outra sessão (eTag {if_match} desatualizado)")
+        r.raise_for_status()
+        item = r.json()
+        if item.get("eTag"):
+            self._file_cache[self._cache_key(path)] = {"eTag": item["eTag"], "content": content}
+        return item
+
+    # -------- Paralelismo --------
+    @staticmethod
+    async def gather(*aws, return_exceptions: bool = True):
+        """`asyncio.gather` com exceções devolvidas no lugar do resultado (padrão)."""
+        return await asyncio.gather(*aws, return_exceptions=return_exceptions)
+
+    async def download_many(self, paths) -> dict:
+        """{caminho: bytes | Exception} — baixa todos em paralelo (limitado pelo semáforo)."""
+        paths = list(paths)
+        return dict(zip(paths, await self.gather(*(self.download(p) for p in paths))))
+
+    async def get_metadata_many(self, paths) -> dict:
+        """{caminho: metadados | Exception} — útil p/ checar eTags de vários arquivos."""
+        paths = list(paths)
+        return dict(zip(paths, await self.gather(*(self.get_metadata(p) for p in paths))))
+
+    # -------- Conveniências DataFrame --------
+    async def read_excel(self, path: str, **kw) -> pd.DataFrame:
+        content = await self.download(path)
+        return await asyncio.to_thread(pd.read_excel, io.BytesIO(content), **kw)
+
+    async def read_csv(self, path: str, **kw) -> pd.DataFrame:
+        content = await self.download(path)
+        return await asyncio.to_thread(pd.read_csv, io.BytesIO(content), **kw)
+
+    async def write_excel(self, df: pd.DataFrame, path: str, overwrite: bool = True):
+        def _build():
+            bio = io.BytesIO()
+            df.to_excel(bio, index=False)
+            return bio.getvalue()
+        return await self.upload_small(path, await asyncio.to_thread(_build), overwrite=overwrite)
+
+
+class BackgroundLoop:
+    """
+    Event loop em thread própria, para disparar corrotinas a partir do script do
+    Streamlit sem bloqueá-lo: `submit(coro)` devolve um `concurrent.futures.Future`.
+    O AsyncSPConnector deve ser criado e usado dentro deste mesmo loop
+    (p.ex. `loop.submit(_criar())` ou `loop.call(AsyncSPConnector, ...)`).
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True,
+                                        name="async-sp-connector")
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, fn, *args, **kwargs):
+        """Executa `fn` (síncrona) dentro do loop e espera o resultado."""
+        async def _run():
+            return fn(*args, **kwargs)
+        return self.submit(_run()).result()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+# -------- Instância única por processo --------
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_connector(*args, **kwargs):
+    """
+    (BackgroundLoop, AsyncSPConnector) únicos no processo para estes parâmetros.
+    Ficam fora dos caches do Streamlit: limpar o `cache_resource` ("🔄 Atualizar")
+    reaproveita o mesmo loop e o mesmo cliente httpx em vez de abrir outros.
+    """
+    key = (args, tuple(sorted(kwargs.items())))
+    with _shared_lock:
+        pair = _shared.get(key)
+        if pair is None:
+            loop = BackgroundLoop()
+            pair = _shared[key] = (loop, loop.call(AsyncSPConnector, *args, **kwargs))
+        return pair
@@ -0,0 +1,67 @@
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from schema import parse_dates
+
+
+def _as_datetime64(values) -> np.ndarray:
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    if not pd.api.types.is_datetime64_any_dtype(s):
+        s = parse_dates(s)
+    elif getattr(s.dt, "tz", None) is not None:
+        s = s.dt.tz_localize(None)
+    return s.to_numpy(dtype="datetime64[ns]")
+
+
+class DateIndex:
+    """
+    Índice ordenado de uma coluna de datas: vetor datetime64 ordenado + posição (iloc)
+    de cada data na origem. Consultas por intervalo com `searchsorted`: O(log n + k).
+      - `between(inicio, fim)`: posições das linhas no intervalo, da data mais antiga para a mais nova
+      - `count(inicio, fim)`: quantas linhas no intervalo (sem montar a lista)
+      - `order(newest_first)`: posições de todas as linhas com data, ordenadas
+    `fim` do tipo `date` inclui o dia inteiro; datetime/Timestamp é inclusivo até o instante.
+    Linhas sem data (NaT) ficam fora das consultas (`missing` diz quantas são).
+    """
+
+    def __init__(self, values):
+        arr = _as_datetime64(values)
+        self.size = len(arr)
+        valid = np.flatnonzero(~np.isnat(arr))
+        order = np.argsort(arr[valid], kind="stable")
+        self._dates = arr[valid][order]
+        self._pos = valid[order]
+        self.missing = self.size - len(valid)
+
+    def __len__(self):
+        return self.size
+
+    def _bounds(self, inicio=None, fim=None):
+        lo = 0
+        hi = len(self._dates)
+        if inicio is not None:
+            lo = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(inicio), "ns"), side="left")
+        if fim is not None:
+            if isinstance(fim, date) and not isinstance(fim, datetime):
+                end = np.datetime64(pd.Timestamp(fim) + pd.Timedelta(days=1), "ns")
+                hi = np.searchsorted(self._dates, end, side="left")
+            else:
+                hi = np.searchsorted(self._dates, np.datetime64(pd.Timestamp(fim), "ns"), side="right")
+        return lo, max(lo, hi)
+
+    def between(self, inicio=None, fim=None) -> np.ndarray:
+        lo, hi = self._bounds(inicio, fim)
+        return self._pos[lo:hi]
+
+    def count(self, inicio=None, fim=None) -> int:
+        lo, hi = self._bounds(inicio, fim)
+        return int(hi - lo)
+
+    def order(self, newest_first: bool = False) -> np.ndarray:
+        return self._pos[::-1] if newest_first else self._pos
+
+    def min(self):
+        return pd.Timestamp(self._dates[0]) if len(self._dates) else pd.NaT
+
+    def max(self):
+        return pd.Timestamp(self._dates[-1]) if len(self._dates) else pd.NaT
@@ -0,0 +1,312 @@
+# graph_workbook.py
+from datetime import date, datetime, time
+from urllib.parse import quote
+import pandas as pd
+from sp_connector import PreconditionFailed
+
+# Quantas vezes reler cabeçalho/chaves quando o arquivo muda durante a leitura
+MAX_REREADS = 3
+
+
+class UnsupportedOp(Exception):
+    """Operação que não dá para fazer célula a célula (replace, coluna nova, aba inexistente...)."""
+
+
+class PartialWrite(RuntimeError):
+    """Falha no meio do `apply`: as `done` primeiras operações foram gravadas, as demais não."""
+
+    def __init__(self, done: int, cause: Exception):
+        super().__init__(f"Gravação interrompida após {done} operação(ões): {cause}")
+        self.done = done
+        self.cause = cause
+
+
+class WorkbookConflict(RuntimeError):
+    """O arquivo mudou por fora durante a sessão (outra instância enviou o arquivo inteiro)."""
+
+
+def _col_letter(n: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA ..."""
+    s = ""
+    n += 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def _cell_value(v):
+    """Valor Python/pandas -> valor aceito em `values` do Graph ("" limpa a célula)."""
+    if v is None or v is pd.NaT:
+        return ""
+    try:
+        if pd.isna(v):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    if isinstance(v, (pd.Timestamp, datetime)):
+        return v.strftime("%Y-%m-%d") if v.time() == time(0) else v.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, time):
+        return v.strftime("%H:%M:%S")
+    if hasattr(v, "item"):               # numpy int/float/bool
+        return v.item()
+    return v
+
+
+class ExcelSession:
+    """
+    Sessão da API de workbook do Graph (`/workbook/...`) sobre um .xlsx do SharePoint:
+    altera só as células/linhas afetadas, sem baixar nem reenviar o arquivo.
+      - `createSession` com persistChanges (fechada no `close`/`with`)
+      - upsert: PATCH da faixa da linha (null = célula não muda); linhas novas no fim
+        (com `existing_only`, chave que não existe mais é ignorada)
+      - append: `tables/{id}/rows/add` se a aba tiver tabela; senão PATCH logo abaixo do usado
+      - delete: `range(...)/delete` com shift Up, de baixo para cima
+    `replace`, colunas inexistentes ou aba inexistente levantam `UnsupportedOp`
+    (quem chama volta para o envio do arquivo inteiro).
+    Concorrência (`apply`): o eTag do item é conferido antes de gravar (e as leituras
+    refeitas se ele mudou no meio delas); depois de gravar, a coluna-chave e o tamanho
+    de cada aba alterada são relidos e comparados com o esperado.
+    """
+
+    def __init__(self, sp, path: str):
+        self.sp = sp
+        self.path = path
+        self._base = f"{sp._item_url(path)}:/workbook"
+        self._session_id = None
+        self._layout = {}                       # aba -> (cabeçalho, última linha usada)
+        self._keys = {}                         # (aba, chave) -> valores da coluna-chave (linha 2 em diante)
+        self.writes = 0                         # requisições de escrita já enviadas
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -------- HTTP --------
+    def _request(self, method: str, endpoint: str, json=None, params=None):
+        headers = self.sp._headers()
+        if self._session_id:
+            headers["workbook-session-id"] = self._session_id
+        r = self.sp._http.request(method, f"{self._base}{endpoint}", headers=headers, json=json,
+                                  params=params, timeout=self.sp._timeout(120))
+        if r.status_code == 404:
+            raise UnsupportedOp(f"{endpoint}: não encontrado")
+        r.raise_for_status()
+        return r.json() if r.content else {}
+
+    def open(self):
+        self._session_id = self._request("POST", "/createSession", json={"persistChanges": True})["id"]
+
+    def _write(self, method: str, endpoint: str, json=None):
+        self.writes += 1
+        return self._request(method, endpoint, json=json)
+
+    def etag(self) -> str:
+        return self.sp.get_metadata(self.path).get("eTag")
+
+    def close(self):
+        if not self._session_id:
+            return
+        try:
+            self._request("POST", "/closeSession")
+        except Exception:
+            pass                                # sessão expira sozinha no servidor
+        self._session_id = None
+
+    def _sheet(self, sheet: str) -> str:
+        return f"/worksheets('{quote(sheet.replace(chr(39), chr(39) * 2), safe='')}')"
+
+    def _range(self, sheet: str, address: str) -> str:
+        return f"{self._sheet(sheet)}/range(address='{address}')"
+
+    # -------- Leitura mínima --------
+    def layout(self, sheet: str):
+        """(cabeçalho, última linha usada) da aba — só o cabeçalho é lido."""
+        if sheet not in self._layout:
+            used = self._request("GET", f"{self._sheet(sheet)}/usedRange(valuesOnly=true)",
+                                 params={"$select": "rowIndex,rowCount,columnIndex,columnCount"})
+            last_col = _col_letter(used.get("columnIndex", 0) + max(used.get("columnCount", 1), 1) - 1)
+            header = self._request("GET", self._range(sheet, f"A1:{last_col}1"),
+                                   params={"$select": "values"})["values"][0]
+            last_row = used.get("rowIndex", 0) + used.get("rowCount", 1)
+            self._layout[sheet] = ([str(h) for h in header], last_row)
+        return self._layout[sheet]
+
+    def _read_keys(self, sheet: str, key: str) -> list:
+        header, last_row = self.layout(sheet)
+        if key not in header:
+            raise UnsupportedOp(f"{sheet}: coluna-chave {key} inexistente")
+        if last_row < 2:
+            return []
+        col = _col_letter(header.index(key))
+        values = self._request("GET", self._range(sheet, f"{col}2:{col}{last_row}"),
+                               params={"$select": "values"})["values"]
+        return ["" if v is None else str(v) for (v,) in values]
+
+    def key_rows(self, sheet: str, key: str) -> dict:
+        """{valor da chave (str): nº da linha no Excel} — lê só a coluna da chave (uma vez por sessão)."""
+        if (sheet, key) not in self._keys:
+            self._keys[(sheet, key)] = self._read_keys(sheet, key)
+        rows = {}
+        for i, v in enumerate(self._keys[(sheet, key)]):
+            if v:
+                rows.setdefault(v, i + 2)
+        return rows
+
+    def _positions(self, sheet: str, columns) -> dict:
+        header, _ = self.layout(sheet)
+        missing = [c for c in columns if str(c) not in header]
+        if missing:
+            raise UnsupportedOp(f"{sheet}: coluna(s) inexistente(s) {missing}")
+        return {c: header.index(str(c)) for c in columns}
+
+    # -------- Escrita --------
+    def patch_row(self, sheet: str, row: int, changes: dict):
+        """Altera só as colunas de `changes` na linha `row` (as do meio ficam como estão)."""
+        pos = self._positions(sheet, changes)
+        lo, hi = min(pos.values()), max(pos.values())
+        values = [None] * (hi - lo + 1)
+        for col, v in changes.items():
+            values[pos[col] - lo] = _cell_value(v)
+        address = f"{_col_letter(lo)}{row}:{_col_letter(hi)}{row}"
+        self._write("PATCH", self._range(sheet, address), json={"values": [values]})
+
+    def add_rows(self, sheet: str, rows: list):
+        """Acrescenta linhas completas no fim da aba (na ordem do cabeçalho)."""
+        if not rows:
+            return
+        header, last_row = self.layout(sheet)
+        self._positions(sheet, {c for r in rows for c in r})
+        values = [[_cell_value(r.get(h)) for h in header] for r in rows]
+        tables = self._request("GET", f"{self._sheet(sheet)}/tables", params={"$select": "id"}).get("value", [])
+        if len(tables) == 1:
+            self._write("POST", f"/tables/{tables[0]['id']}/rows/add", json={"values": values})
+        else:
+            address = f"A{last_row + 1}:{_col_letter(len(header) - 1)}{last_row + len(values)}"
+            self._write("PATCH", self._range(sheet, address), json={"values": values})
+        self._layout[sheet] = (header, last_row + len(values))
+        for (s, key), keys in self._keys.items():
+            if s == sheet:
+                keys.extend("" if _cell_value(r.get(key)) in ("", None) else str(_cell_value(r.get(key)))
+                            for r in rows)
+
+    def delete_rows(self, sheet: str, rows):
+        header, last_row = self.layout(sheet)
+        for row in sorted(set(rows), reverse=True):
+            self._write("POST", f"{self._range(sheet, f'{row}:{row}')}/delete", json={"shift": "Up"})
+            last_row -= 1
+            for (s, _), keys in self._keys.items():
+                if s == sheet:
+                    del keys[row - 2]
+        self._layout[sheet] = (header, last_row)
+
+    # -------- Operações por linha (mesmo formato de workbook.apply_ops) --------
+    def check(self, ops: list):
+        """Levanta `UnsupportedOp` ANTES de alterar qualquer célula, se algo não der para fazer aqui."""
+        for op in ops:
+            sheet, kind = op["sheet"], op["op"]
+            if kind not in ("upsert", "delete", "append"):
+                raise UnsupportedOp(f"{sheet}: operação {kind}")
+            header, _ = self.layout(sheet)
+            if kind != "append" and op["key"] not in header:
+                raise UnsupportedOp(f"{sheet}: coluna-chave {op['key']} inexistente")
+            if kind != "delete":
+                self._positions(sheet, {c for r in op["rows"] for c in r})
+
+    def _prepare(self, ops: list, if_match: str | None):
+        """
+        Lê cabeçalhos e colunas-chave e confere o eTag antes e depois da leitura: se o arquivo
+        mudou no meio, relê (até MAX_REREADS vezes). Nada é gravado aqui.
+        """
+        for _ in range(MAX_REREADS):
+            before = self.etag()
+            if if_match and before != if_match:
+                raise PreconditionFailed(f"{self.path}: eTag {before} difere de {if_match}")
+            self._layout, self._keys = {}, {}
+            self.check(ops)
+            for op in ops:
+                if op["op"] != "append":
+                    self.key_rows(op["sheet"], op["key"])
+            if self.etag() == before:
+                return
+        raise WorkbookConflict(f"{self.path} mudou durante a leitura {MAX_REREADS} vezes seguidas")
+
+    def _apply_op(self, op: dict):
+        sheet, kind = op["sheet"], op["op"]
+        if kind == "append":
+            self.add_rows(sheet, op["rows"])
+            return
+        rows_by_key = self.key_rows(sheet, op["key"])
+        if kind == "delete":
+            self.delete_rows(sheet, [rows_by_key[str(i)] for i in op["ids"] if str(i) in rows_by_key])
+            return
+        novos = []
+        for r in op["rows"]:
+            row = rows_by_key.get(str(r.get(op["key"])))
+            if row is None:
+                if not op.get("existing_only"):
+                    novos.append(r)
+            else:
+                self.patch_row(sheet, row, {c: v for c, v in r.items() if c != op["key"]} or r)
+        self.add_rows(sheet, novos)
+
+    def verify(self, sheets):
+        """Relê tamanho e colunas-chave das abas `sheets` e compara com o esperado depois das escritas."""
+        expected = {s: self._layout[s] for s in sheets if s in self._layout}
+        keys = {k: v for k, v in self._keys.items() if k[0] in expected}
+        self._layout, self._keys = {}, {}
+        for sheet, (header, last_row) in expected.items():
+            if self.layout(sheet) != (header, last_row):
+                raise WorkbookConflict(f"{sheet}: tamanho/cabeçalho diferente do esperado após gravar")
+        for (sheet, key), values in keys.items():
+            if self._read_keys(sheet, key) != values:
+                raise WorkbookConflict(f"{sheet}: coluna {key} diferente do esperado após gravar")
+
+    def apply(self, ops: list, if_match: str | None = None) -> str:
+        """
+        Grava `ops` e devolve o eTag resultante.
+          - `UnsupportedOp` / `PreconditionFailed` (eTag ≠ `if_match`): nada foi gravado
+          - `PartialWrite`: falhou no meio; `done` = operações concluídas
+          - `WorkbookConflict`: gravado, mas a conferência final não bateu
+        """
+        self._prepare(ops, if_match)
+        for done, op in enumerate(ops):
+            try:
+                self._apply_op(op)
+            except Exception as e:
+                raise PartialWrite(done, e) from e
+        self.verify({op["sheet"] for op in ops})
+        return self.etag()
+
+
+def write_ops(sp, path: str, ops: list, if_match: str | None = None) -> tuple:
+    """
+    Grava `ops` pela API de workbook. Devolve (novo eTag | None, operações que faltam);
+    o que faltar vai pelo envio do arquivo inteiro, sobre uma versão relida:
+      - nada gravado (sem suporte a sessão/arquivo, replace, coluna/aba nova, eTag ≠ `if_match`,
+        erro antes da primeira escrita): todas as operações
+      - falha no meio: as operações não concluídas
+      - conferência final não bateu (outra instância gravou junto): as operações por chave
+        (upsert/delete), que podem ser reaplicadas sem duplicar; anexos já estão no fim da aba
+    Se algo foi gravado, o cache do arquivo no conector é descartado (a próxima leitura baixa de novo).
+    """
+    xs = ExcelSession(sp, path)
+    try:
+        with xs:
+            etag = xs.apply(ops, if_match=if_match)
+    except PartialWrite as e:
+        sp.invalidate(path)
+        return None, ops[e.done:]
+    except Exception:
+        if not xs.writes:
+            return None, ops
+        # tudo enviado, mas a conferência não bateu (ou não pôde ser feita)
+        sp.invalidate(path)
+        return None, [op for op in ops if op["op"] != "append"]
+    sp.invalidate(path)
+    return etag, []
@@ -0,0 +1,283 @@
+import codecs
+import io
+import json
+import posixpath
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+import numpy as np
+import pandas as pd
+import requests
+from date_index import DateIndex
+
+# Partição das linhas cuja data não pôde ser interpretada
+UNDATED = "sem-data"
+_MONTH_RE = re.compile(r"^(\d{4}-\d{2}|sem-data)$")
+_FILE_RE = re.compile(r"^(.+)\.csv$")
+# Marca (na biblioteca) de que a importação das abas antigas já foi feita
+MARKER = "migracao.json"
+# Nome dos arquivos da importação (ordena antes de qualquer anexo; repetir não duplica)
+IMPORT_TAG = "00000000T000000000000-importacao"
+# Quanto tempo (s) uma listagem de pasta vale antes de ser refeita
+LISTING_TTL = 10.0
+
+
+def new_tag() -> str:
+    """Nome de um anexo novo: instante UTC (ordena na ordem de criação) + sufixo aleatório."""
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+
+
+def _parse_date(v):
+    """Timestamp da linha (aceita Timestamp/datetime, ISO e dd/mm/aaaa) ou NaT."""
+    if isinstance(v, (pd.Timestamp, datetime, date)):
+        return pd.Timestamp(v)
+    s = str(v or "").strip()
+    if not s:
+        return pd.NaT
+    ts = pd.to_datetime(s, format="ISO8601", errors="coerce")
+    if pd.isna(ts):
+        ts = pd.to_datetime(s, dayfirst=True, errors="coerce")
+    return ts
+
+
+def _is_blank(v) -> bool:
+    try:
+        return bool(pd.isna(v)) or not str(v).strip()
+    except (TypeError, ValueError):
+        return False
+
+
+def _month_key(ts) -> str:
+    return UNDATED if pd.isna(ts) else f"{ts.year:04d}-{ts.month:02d}"
+
+
+class HistoryStore:
+    """
+    Histórico fora do workbook, numa pasta da biblioteca: uma subpasta por mês (`AAAA-MM`,
+    `sem-data`) e, dentro dela, um CSV pequeno por anexo, que nunca é reescrito.
+      - `append(rows, tag)`: cria um arquivo por mês tocado, só com as linhas novas (nada é
+        baixado); o nome vem de `tag`, então reenviar o mesmo anexo não duplica linhas
+      - `read(inicio, fim)`: lista só as pastas dos meses do intervalo e baixa só os arquivos
+        ainda não vistos — arquivos não mudam, então o que foi baixado vale para sempre
+      - cada mês montado fica memorizado com um `DateIndex` da coluna de data
+      - `fetch_many` (opcional, caminhos -> {caminho: bytes | Exception}): arquivos que faltam
+        são baixados todos de uma vez (p.ex. `AsyncSPConnector.download_many`)
+    A coluna de data é gravada em ISO (AAAA-MM-DD HH:MM:SS); as demais como texto.
+    """
+
+    def __init__(self, sp, folder: str, columns: list, date_col: str = "Data", fetch_many=None):
+        self.sp = sp
+        self.fetch_many = fetch_many
+        self.folder = folder.strip("/")
+        self.columns = list(columns)
+        self.date_col = date_col
+        self._files = {}                        # (mês, nome) -> DataFrame (arquivos imutáveis)
+        self._months = {}                       # mês -> (nomes, DataFrame, DateIndex)
+        self._listings = {}                     # pasta -> (instante, [nomes])
+        self._lock = threading.Lock()
+
+    def _month_dir(self, key: str) -> str:
+        return posixpath.join(self.folder, key)
+
+    def _path(self, key: str, name: str) -> str:
+        return posixpath.join(self._month_dir(key), f"{name}.csv")
+
+    def _list(self, folder: str, pattern, folders: bool) -> list:
+        """Nomes (ordenados) dos itens de `folder` que casam com `pattern`; listagem reaproveitada por LISTING_TTL."""
+        with self._lock:
+            hit = self._listings.get(folder)
+            if hit and time.monotonic() - hit[0] < LISTING_TTL:
+                return hit[1]
+        try:
+            items = self.sp.list_children(folder)
+        except FileNotFoundError:
+            items = []
+        names = sorted(m.group(1) for it in items
+                       if ("folder" in it) == folders and (m := pattern.match(it.get("name", ""))))
+        with self._lock:
+            self._listings[folder] = (time.monotonic(), names)
+        return names
+
+    def _forget_listings(self, keys):
+        with self._lock:
+            self._listings.pop(self.folder, None)
+            for key in keys:
+                self._listings.pop(self._month_dir(key), None)
+
+    def partitions(self) -> list:
+        """Meses com anexos gravados ("AAAA-MM", em ordem; `sem-data` por último)."""
+        keys = self._list(self.folder, _MONTH_RE, folders=True)
+        return [k for k in keys if k != UNDATED] + ([UNDATED] if UNDATED in keys else [])
+
+    def files(self, key: str) -> list:
+        """Nomes dos anexos do mês `key`, na ordem de criação."""
+        return self._list(self._month_dir(key), _FILE_RE, folders=False)
+
+    def is_empty(self) -> bool:
+        return not self.partitions()
+
+    # -------- Escrita --------
+    def _frame(self, rows) -> pd.DataFrame:
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+        df = df.reindex(columns=self.columns)
+        raw = df[self.date_col]
+        ts = raw.map(_parse_date)
+        # data interpretável vira ISO; sem data, mantém o texto original
+        df[self.date_col] = [
+            ("" if _is_blank(r) else str(r)) if pd.isna(t) else t.strftime("%Y-%m-%d %H:%M:%S")
+            for r, t in zip(raw, ts)
+        ]
+        df["_mes"] = [_month_key(t) for t in ts]
+        return df.fillna("")
+
+    def normalize(self, rows) -> pd.DataFrame:
+        """Linhas como ficam gravadas (colunas de `columns`, data em ISO)."""
+        return self._frame(rows)[self.columns]
+
+    def append(self, rows, tag: str | None = None) -> int:
+        """
+        Acrescenta as linhas (dicts ou DataFrame): um arquivo `<tag>.csv` na pasta de cada mês.
+        Arquivo que já existe (409) é o mesmo anexo enviado antes: não é regravado.
+        """
+        df = self._frame(rows)
+        if df.empty:
+            return 0
+        tag = tag or new_tag()
+        try:
+            for key, part in df.groupby("_mes", sort=True):
+                # BOM: o Excel abre os acentos direito
+                body = codecs.BOM_UTF8 + part[self.columns].to_csv(index=False, lineterminator="\n").encode("utf-8")
+                try:
+                    self.sp.upload_small(self._path(key, tag), body, overwrite=False)
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code != 409:
+                        raise
+        finally:
+            self._forget_listings(df["_mes"].unique())
+        return len(df)
+
+    def is_migrated(self) -> bool:
+        try:
+            self.sp.get_metadata(posixpath.join(self.folder, MARKER))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def import_once(self, frames) -> int:
+        """
+        Migração: grava `frames` (p.ex. a aba antiga do workbook) se a marca ainda não existe.
+        Os arquivos da importação têm nome fixo (IMPORT_TAG): duas instâncias importando ao mesmo
+        tempo, ou uma importação interrompida e refeita, não duplicam linhas. A marca fica na
+        biblioteca e só é gravada no fim, então perder o disco local não reimporta nada.
+        """
+        if self.is_migrated():
+            return 0
+        frames = [f for f in frames if isinstance(f, pd.DataFrame) and not f.empty]
+        total = self.append(pd.concat(frames, ignore_index=True), tag=IMPORT_TAG) if frames else 0
+        info = {"fim": datetime.now().isoformat(timespec="seconds"), "linhas": total}
+        self.sp.upload_small(posixpath.join(self.folder, MARKER), json.dumps(info).encode("utf-8"))
+        return total
+
+    # -------- Leitura --------
+    def _parse(self, content: bytes) -> pd.DataFrame:
+        df = pd.read_csv(io.BytesIO(content), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        return df.reindex(columns=self.columns).fillna("")
+
+    def prefetch(self, keys=None):
+        """
+        Baixa de uma vez, via `fetch_many`, os anexos ainda não vistos dos meses `keys`
+        (padrão: todos). O que falhar fica para o download individual de `chunks`/`read`.
+        """
+        if self.fetch_many is None:
+            return
+        keys = self.partitions() if keys is None else keys
+        with self._lock:
+            known = set(self._files)
+        missing = [(k, n) for k in keys for n in self.files(k) if (k, n) not in known]
+        if len(missing) < 2:
+            return
+        try:
+            got = self.fetch_many([self._path(k, n) for k, n in missing])
+        except Exception:
+            return
+        for key, name in missing:
+            content = got.get(self._path(key, name))
+            if isinstance(content, (bytes, bytearray)):
+                df = self._parse(bytes(content))
+                with self._lock:
+                    self._files[(key, name)] = df
+
+    def chunks(self, key: str) -> list:
+        """[(nome, DataFrame)] dos anexos do mês `key`, na ordem de criação."""
+        out = []
+        for name in self.files(key):
+            with self._lock:
+                df = self._files.get((key, name))
+            if df is None:
+                try:
+                    df = self._parse(self.sp.download(self._path(key, name)))
+                except FileNotFoundError:
+                    continue
+                with self._lock:
+                    self._files[(key, name)] = df
+            out.append((name, df))
+        return out
+
+    def _month(self, key: str):
+        """(DataFrame, DateIndex) do mês, remontado só quando entra anexo novo."""
+        names = tuple(self.files(key))
+        with self._lock:
+            hit = self._months.get(key)
+        if hit and hit[0] == names:
+            return hit[1], hit[2]
+        frames = [df for _, df in self.chunks(key)]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.columns)
+        index = DateIndex(df[self.date_col])
+        with self._lock:
+            self._months[key] = (names, df, index)
+        return df, index
+
+    def segment(self, key: str) -> pd.DataFrame:
+        """Linhas do mês `key` ("AAAA-MM" ou `sem-data`), na ordem de gravação."""
+        return self._month(key)[0]
+
+    def read(self, inicio=None, fim=None, newest_first: bool = False) -> pd.DataFrame:
+        """
+        Linhas do histórico (por mês; dentro do mês, na ordem de gravação). Com `inicio`/`fim` (datas, inclusivas)
+        só os meses do intervalo são lidos e as linhas saem do índice de datas de cada mês.
+        `newest_first`: ordenadas da data mais nova para a mais antiga (sem data por último).
+        """
+        keys = self.partitions()
+        ini = pd.Timestamp(inicio) if inicio is not None else None
+        fim_dia = pd.Timestamp(fim).date() if fim is not None else None
+        filtered = ini is not None or fim_dia is not None
+        if filtered:
+            end = pd.Timestamp(fim_dia) + pd.Timedelta(days=1) if fim_dia is not None else None
+            lo = _month_key(ini) if ini is not None else "0000-00"
+            hi = _month_key(end - pd.Timedelta(microseconds=1)) if end is not None else "9999-99"
+            keys = [k for k in keys if k != UNDATED and lo <= k <= hi]
+        self.prefetch(keys)
+        if newest_first:
+            keys = [k for k in reversed(keys) if k != UNDATED] + [k for k in keys if k == UNDATED]
+        frames = []
+        for key in keys:
+            df, index = self._month(key)
+            if df.empty:
+                continue
+            if filtered:
+                pos = index.between(ini, fim_dia)
+                pos = pos[::-1] if newest_first else np.sort(pos)
+            elif newest_first and key != UNDATED:
+                pos = index.order(newest_first=True)
+                # linhas do segmento cuja data não foi interpretada vão para o fim dele
+                pos = np.concatenate([pos, np.setdiff1d(np.arange(len(df)), pos)]) if index.missing else pos
+            else:
+                frames.append(df)
+                continue
+            frames.append(df.iloc[pos])
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)
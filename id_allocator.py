@@ -0,0 +1,109 @@
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from requests import HTTPError
+from sp_connector import PreconditionFailed
+from id_index import CAP_MAX
+
+# IDs reservados de uma vez por prefixo para cada processo (lease)
+LEASE_SIZE = 5
+# Validade do lease; depois disso o que sobrou é abandonado (vira lacuna, nunca reuso)
+LEASE_TTL = 120
+# Tentativas de gravação condicional do arquivo de controle antes de desistir
+ALLOC_MAX_RETRIES = 10
+
+
+class IdAllocator:
+    """
+    Alocador central de sufixos por prefixo, compartilhado por todas as sessões,
+    processos e instâncias. Um arquivo JSON de controle na biblioteca guarda o maior
+    índice já RESERVADO por prefixo; cada reserva relê o arquivo e grava o novo
+    limite com If-Match (412 -> relê e tenta de novo), então duas reservas nunca se sobrepõem.
+      - `allocate(prefixo)`: um índice, servido de um lease local de `lease_size`
+        índices válido por `lease_ttl` segundos (uma ida ao SharePoint a cada lease)
+      - `reserve(prefixo, n)`: n índices consecutivos numa única gravação (importação em lote)
+      - `peek(prefixo)`: prévia do próximo índice, sem rede
+    `floor` = maior índice já presente na planilha (o controle nunca fica abaixo dele).
+    """
+
+    def __init__(self, sp, path: str, lease_size: int = LEASE_SIZE, lease_ttl: float = LEASE_TTL,
+                 cap_max: int = CAP_MAX, max_retries: int = ALLOC_MAX_RETRIES):
+        self.sp = sp
+        self.path = path
+        self.lease_size = max(1, lease_size)
+        self.lease_ttl = lease_ttl
+        self.cap_max = cap_max
+        self.max_retries = max_retries
+        self._leases = {}                       # prefixo -> {"next", "end", "expires"}
+        self._known = {}                        # prefixo -> último limite lido do controle
+        self._lock = threading.Lock()
+
+    # -------- Arquivo de controle --------
+    def _read(self):
+        try:
+            content, etag = self.sp.download_with_etag(self.path)
+        except FileNotFoundError:
+            return {"prefixos": {}}, None
+        data = json.loads(content.decode("utf-8") or "{}")
+        data.setdefault("prefixos", {})
+        return data, etag
+
+    def _write(self, data: dict, etag: str | None):
+        data["atualizado_em"] = datetime.now(timezone.utc).isoformat()
+        body = json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        # sem eTag = arquivo ainda não existe: cria sem sobrescrever (409 se outro criou antes)
+        self.sp.upload_small(self.path, body, overwrite=etag is not None, if_match=etag)
+
+    def _reserve_block(self, prefix: str, n: int, floor: int) -> int:
+        """Reserva [início, início + n) no controle; devolve o início."""
+        for _ in range(self.max_retries):
+            data, etag = self._read()
+            start = max(int(data["prefixos"].get(prefix, -1)), floor) + 1
+            end = start + n
+            if end > self.cap_max:
+                raise ValueError(f"Capacidade esgotada para o prefixo {prefix} ({self.cap_max} IDs).")
+            data["prefixos"][prefix] = end - 1
+            try:
+                self._write(data, etag)
+            except PreconditionFailed:
+                continue
+            except HTTPError as e:
+                if e.response is not None and e.response.status_code == 409:
+                    continue
+                raise
+            self._known[prefix] = end - 1
+            return start
+        raise RuntimeError(f"Não foi possível reservar IDs para {prefix}: controle alterado continuamente")
+
+    # -------- API --------
+    def allocate(self, prefix: str, floor: int = -1) -> int:
+        with self._lock:
+            lease = self._leases.get(prefix)
+            if (not lease or time.time() >= lease["expires"]
+                    or max(lease["next"], floor + 1) >= lease["end"]):
+                # novo lease; o restante do anterior (se houver) é abandonado
+                start = self._reserve_block(prefix, self.lease_size, floor)
+                lease = self._leases[prefix] = {
+                    "next": start, "end": start + self.lease_size,
+                    "expires": time.time() + self.lease_ttl,
+                }
+            idx = max(lease["next"], floor + 1)
+            lease["next"] = idx + 1
+            return idx
+
+    def reserve(self, prefix: str, n: int, floor: int = -1) -> list:
+        """n índices consecutivos, exclusivos deste chamador (uma gravação no controle)."""
+        if n <= 0:
+            return []
+        with self._lock:
+            start = self._reserve_block(prefix, n, floor)
+        return list(range(start, start + n))
+
+    def peek(self, prefix: str, floor: int = -1) -> int:
+        """Provável próximo índice (lease vigente ou último limite conhecido); não reserva."""
+        with self._lock:
+            lease = self._leases.get(prefix)
+            if lease and lease["next"] < lease["end"] and time.time() < lease["expires"]:
+                return max(lease["next"], floor + 1)
+            return max(self._known.get(prefix, -1), floor) + 1
@@ -0,0 +1,66 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# Sufixo NNNL: NUM_DIGITS dígitos + 1 letra -> (10 ** NUM_DIGITS) * 26 IDs por prefixo
+NUM_DIGITS = 3
+CAP_MAX = (10 ** NUM_DIGITS) * 26
+PREFIX_LEN = 4
+
+
+def extract_prefix_idx(ids: pd.Series, num_digits: int = NUM_DIGITS) -> pd.DataFrame:
+    """
+    Vetorizado: IDs PPPP + N..NL -> DataFrame {"prefixo", "idx"} só com os IDs válidos
+    (mesmo padrão de `extrair_prefixo_e_idx`, sem laço em Python).
+    """
+    s = pd.Series(ids, dtype=object).dropna().astype(str).str.strip().str.upper()
+    parts = s.str.extract(rf"^([A-Z0-9]{{{PREFIX_LEN}}})(\d{{{num_digits}}})([A-Z])$").dropna()
+    if parts.empty:
+        return pd.DataFrame({"prefixo": pd.Series(dtype=object), "idx": pd.Series(dtype="int64")})
+    num = parts[1].astype("int64").to_numpy()
+    # 'U1' vista como int32 = código da letra
+    letra = parts[2].to_numpy(dtype="U1").view(np.int32) - ord("A")
+    return pd.DataFrame({"prefixo": parts[0].to_numpy(), "idx": num * 26 + letra})
+
+
+class IdIndex:
+    """
+    Índice prefixo -> maior índice de sufixo já usado (e quantos IDs existem), montado
+    uma vez a partir da coluna ID e atualizado a cada ID alocado (`observe`).
+    `max_idx` é O(1) por prefixo (piso das reservas do `IdAllocator`); `capacity()` mostra
+    o uso de cada prefixo frente a CAP_MAX.
+    """
+
+    def __init__(self, ids=(), num_digits: int = NUM_DIGITS):
+        self.num_digits = num_digits
+        self.cap_max = (10 ** num_digits) * 26
+        parsed = extract_prefix_idx(pd.Series(list(ids), dtype=object), num_digits)
+        grouped = parsed.groupby("prefixo")["idx"].agg(["max", "size"])
+        self._max = {p: int(v) for p, v in grouped["max"].items()}
+        self._count = {p: int(v) for p, v in grouped["size"].items()}
+        self._lock = threading.Lock()
+
+    def max_idx(self, prefix: str) -> int:
+        """Maior índice usado no prefixo (-1 se nenhum)."""
+        return self._max.get(prefix, -1)
+
+    def observe(self, prefix: str, idx: int):
+        """Registra um índice recém-alocado/gravado para o prefixo."""
+        with self._lock:
+            if idx > self._max.get(prefix, -1):
+                self._max[prefix] = idx
+            self._count[prefix] = self._count.get(prefix, 0) + 1
+
+    def observe_ids(self, ids):
+        parsed = extract_prefix_idx(pd.Series(list(ids), dtype=object), self.num_digits)
+        for prefix, idx in zip(parsed["prefixo"], parsed["idx"]):
+            self.observe(prefix, int(idx))
+
+    def capacity(self) -> pd.DataFrame:
+        """Uso por prefixo: IDs existentes, maior índice, próximos livres e % de CAP_MAX já consumido."""
+        with self._lock:
+            rows = [(p, self._count.get(p, 0), m) for p, m in self._max.items()]
+        df = pd.DataFrame(rows, columns=["Prefixo", "IDs", "Maior índice"])
+        df["Livres"] = self.cap_max - (df["Maior índice"] + 1)
+        df["Uso (%)"] = ((df["Maior índice"] + 1) / self.cap_max * 100).round(2)
+        return df.sort_values("Uso (%)", ascending=False, ignore_index=True)
@@ -0,0 +1,235 @@
+import os
+import json
+import uuid
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timezone
+from time import monotonic
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:                      # Windows: sem flock; o diário segue sem dono exclusivo
+    fcntl = None
+
+# Acima disso (bytes), o arquivo é reescrito só com as entradas pendentes
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+
+
+# -------- Serialização das operações --------
+# Datas viram {"$dt": "..."} / {"$date": "..."} / {"$time": "..."}; escalares numpy viram nativos.
+
+def _json_default(v):
+    if v is None or v is pd.NaT:
+        return None
+    if isinstance(v, (pd.Timestamp, datetime)):
+        return {"$dt": v.isoformat()}
+    if isinstance(v, date):
+        return {"$date": v.isoformat()}
+    if isinstance(v, time):
+        return {"$time": v.isoformat()}
+    if hasattr(v, "item"):               # numpy int/bool/...
+        return v.item()
+    return str(v)
+
+
+def _json_hook(d: dict):
+    if len(d) == 1:
+        if "$dt" in d:
+            return pd.Timestamp(d["$dt"])
+        if "$date" in d:
+            return date.fromisoformat(d["$date"])
+        if "$time" in d:
+            return time.fromisoformat(d["$time"])
+    return d
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, default=_json_default, ensure_ascii=False)
+
+
+class WriteJournal:
+    """
+    Diário local (append-only, JSON por linha) das escritas ainda não confirmadas
+    pelo SharePoint. Cada salvamento é gravado aqui (com fsync) ANTES do envio:
+      {"type": "op", "id", "file", "ops", "base_etag", "ts"}
+    e recebe depois {"type": "done", "id", "etag"} ou {"type": "failed", "id", "error"}.
+    Entrada enviada em duas etapas (arquivo, depois o que depende da confirmação dele) recebe
+    {"type": "sent", "id", "etag"} entre as duas: um novo envio refaz só a segunda etapa.
+    Ao abrir, as entradas sem desfecho voltam como pendentes (replay).
+    Um único processo por arquivo de diário é o dono (flock em `<path>.owner`);
+    `WriteJournal.open` devolve sempre a mesma instância por caminho no processo.
+    Envio em ordem estrita por arquivo: `claim_pending` só libera entradas de um arquivo
+    quando nenhuma anterior dele está em envio ou esperando novo envio.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str) -> "WriteJournal":
+        path = os.path.abspath(path)
+        with cls._instances_lock:
+            inst = cls._instances.get(path)
+            if inst is None:
+                inst = cls._instances[path] = cls(path)
+            return inst
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()           # id -> entrada "op"
+        self._failed = OrderedDict()            # id -> entrada "op" + "error"
+        self._claimed = set()                   # ids já entregues para envio
+        self._attempts = {}                     # id -> envios que falharam (só em memória)
+        self._held = {}                         # arquivo -> instante (monotonic) até o qual não há envio
+        self._owner = self._acquire_owner()
+        self._load()
+        self._compact()
+
+    def _acquire_owner(self):
+        if fcntl is None:
+            return None
+        fh = open(self.path + ".owner", "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            raise RuntimeError(f"Diário {self.path} já está em uso por outro processo")
+        return fh
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line, object_hook=_json_hook)
+                except ValueError:
+                    continue                    # linha truncada (queda no meio da escrita)
+                kind, eid = rec.get("type"), rec.get("id")
+                if kind == "op":
+                    self._pending[eid] = rec
+                elif kind == "sent" and eid in self._pending:
+                    self._pending[eid]["sent"] = rec.get("etag") or True
+                elif kind == "done":
+                    self._pending.pop(eid, None)
+                    self._failed.pop(eid, None)
+                elif kind == "failed" and eid in self._pending:
+                    self._failed[eid] = {**self._pending.pop(eid), "error": rec.get("error")}
+
+    def _append(self, record: dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(_dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self):
+        """Reescreve o arquivo só com o que ainda importa (pendentes e falhas)."""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in self._pending.values():
+                f.write(_dumps(rec) + "\n")
+            for rec in self._failed.values():
+                op = {k: v for k, v in rec.items() if k != "error"}
+                f.write(_dumps(op) + "\n")
+                f.write(_dumps({"type": "failed", "id": rec["id"], "error": rec["error"]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    # -------- Escrita --------
+    def append(self, file: str, ops: list, base_etag: str | None = None) -> dict:
+        """Registra as operações (durável ao retornar) e devolve a entrada; o envio sai de `claim_pending`."""
+        rec = {
+            "type": "op", "id": uuid.uuid4().hex, "file": file, "ops": ops,
+            "base_etag": base_etag, "ts": datetime.now(timezone.utc).isoformat(),
+        }
+        with self._lock:
+            self._append(rec)
+            # relido do JSON: a entrada em memória fica igual à que um replay veria
+            rec = json.loads(_dumps(rec), object_hook=_json_hook)
+            self._pending[rec["id"]] = rec
+        return rec
+
+    def mark_done(self, entry_id: str, etag: str | None = None):
+        with self._lock:
+            self._append({"type": "done", "id": entry_id, "etag": etag})
+            self._pending.pop(entry_id, None)
+            self._claimed.discard(entry_id)
+            self._attempts.pop(entry_id, None)
+            if not self._pending and os.path.getsize(self.path) > JOURNAL_COMPACT_SIZE:
+                self._compact()
+
+    def mark_sent(self, entry_id: str, etag: str | None = None):
+        """A primeira etapa (o arquivo) foi confirmada; a entrada continua pendente."""
+        with self._lock:
+            rec = self._pending.get(entry_id)
+            if rec is None or rec.get("sent"):
+                return
+            self._append({"type": "sent", "id": entry_id, "etag": etag})
+            rec["sent"] = etag or True
+
+    def mark_failed(self, entry_id: str, error: str):
+        """Desiste da entrada (fica registrada em `failed()` para conferência manual)."""
+        with self._lock:
+            self._append({"type": "failed", "id": entry_id, "error": error})
+            rec = self._pending.pop(entry_id, None)
+            if rec is not None:
+                self._failed[entry_id] = {**rec, "error": error}
+            self._claimed.discard(entry_id)
+            self._attempts.pop(entry_id, None)
+
+    def release(self, entry_id: str, retry_after: float = 0.0) -> int:
+        """
+        Devolve a entrada para `claim_pending` (envio falhou); retorna quantas falhas ela já teve.
+        Com `retry_after` (s), nada do arquivo dela é liberado antes disso — nem as entradas seguintes.
+        """
+        with self._lock:
+            self._claimed.discard(entry_id)
+            self._attempts[entry_id] = self._attempts.get(entry_id, 0) + 1
+            rec = self._pending.get(entry_id)
+            if rec is not None and retry_after > 0:
+                until = monotonic() + retry_after
+                self._held[rec["file"]] = max(self._held.get(rec["file"], 0), until)
+            return self._attempts[entry_id]
+
+    def failures(self, entry_id: str) -> int:
+        with self._lock:
+            return self._attempts.get(entry_id, 0)
+
+    # -------- Consulta --------
+    def claim_pending(self) -> list:
+        """
+        Pendentes que podem ser enviadas agora, na ordem em que foram feitas. Por arquivo:
+          - nenhuma, se alguma entrada dele já está em envio ou o arquivo espera novo envio (`release`)
+          - só a mais antiga, se ela já falhou (isola a entrada problemática)
+          - senão, todas as pendentes dele
+        """
+        now = monotonic()
+        with self._lock:
+            blocked = {rec["file"] for eid, rec in self._pending.items() if eid in self._claimed}
+            blocked.update(f for f, until in self._held.items() if until > now)
+            out, seen = [], set()
+            for eid, rec in self._pending.items():
+                file = rec["file"]
+                if file in blocked:
+                    continue
+                if file not in seen and self._attempts.get(eid):
+                    blocked.add(file)
+                seen.add(file)
+                out.append(rec)
+            self._claimed.update(rec["id"] for rec in out)
+        return out
+
+    def pending(self, file: str | None = None) -> list:
+        with self._lock:
+            return [rec for rec in self._pending.values() if file is None or rec["file"] == file]
+
+    def pending_ops(self, file: str) -> list:
+        """Operações ainda não gravadas no arquivo (entradas sem `sent`), na ordem em que foram feitas."""
+        return [op for rec in self.pending(file) if not rec.get("sent") for op in rec["ops"]]
+
+    def failed(self) -> list:
+        with self._lock:
+            return list(self._failed.values())
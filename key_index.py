@@ -0,0 +1,151 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Separadores aceitos numa lista de IDs colada (vírgula, ponto e vírgula, espaço, quebra de linha)
+_ID_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+def normalize_keys(values) -> np.ndarray:
+    """Chaves como texto sem espaços nas pontas e em maiúsculas ("" para vazio/NaN)."""
+    s = pd.Series(values, dtype=object)
+    return s.where(s.notna(), "").astype(str).str.strip().str.upper().to_numpy(dtype=object)
+
+
+def normalize_key(key) -> str:
+    """Uma chave normalizada como em `normalize_keys`."""
+    return "" if key is None or key is pd.NA or (isinstance(key, float) and key != key) \
+        else str(key).strip().upper()
+
+
+def parse_id_list(text) -> list:
+    """IDs de um texto colado, normalizados e sem repetir (na ordem em que aparecem)."""
+    keys = normalize_keys([p for p in _ID_SEPARATORS.split(str(text or "")) if p])
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+class KeyIndex:
+    """
+    Índice chave normalizada -> posição da linha (iloc) no DataFrame de origem,
+    montado uma vez por versão e compartilhado entre as abas:
+      - `get(chave)` / `get_many(chaves)`: busca exata em O(1) (dict)
+      - `prefix(p)`: chaves que começam com `p` (busca binária no vetor ordenado de chaves)
+      - `contains(s)`: chaves que contêm `s` (busca binária no vetor ordenado de sufixos,
+        montado na primeira consulta)
+      - `suggest(p, k)`: as k primeiras chaves (em ordem) que começam com `p`, para autocompletar
+      - `lookup(chaves)` / `partition(chaves, status)`: validação em lote de uma lista colada
+    As posições valem para o DataFrame com que o índice foi montado (mesmas linhas, mesma ordem).
+    Chave repetida: `get` devolve a primeira linha; `prefix`/`contains` devolvem todas.
+    """
+
+    def __init__(self, values):
+        keys = normalize_keys(values)
+        self.size = len(keys)
+        # primeira ocorrência de cada chave (mesmo comportamento de `.index[0]`)
+        self._pos = dict(zip(keys[::-1], range(self.size - 1, -1, -1)))
+        self._pos.pop("", None)
+        valid = np.flatnonzero(keys != "")
+        order = np.argsort(keys[valid].astype(str), kind="stable")
+        self._sorted = keys[valid][order].astype(str)      # chaves ordenadas (U)
+        self._sorted_pos = valid[order]                     # posição de cada chave ordenada
+        self._suffixes = None                               # (sufixos ordenados, posição) sob demanda
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    # -------- Busca exata --------
+    def get(self, key):
+        """Posição da linha da chave (None se não existe)."""
+        return self._pos.get(normalize_key(key))
+
+    def get_many(self, keys) -> np.ndarray:
+        """Posições das chaves, na ordem pedida (-1 para as que não existem)."""
+        pos = self._pos
+        return np.fromiter((pos.get(normalize_key(k), -1) for k in keys), dtype=np.int64)
+
+    def rows(self, df: pd.DataFrame, keys) -> pd.DataFrame:
+        """Linhas de `df` das chaves encontradas (na ordem pedida, sem repetir)."""
+        pos = self.get_many(keys)
+        pos = pos[pos >= 0]
+        _, first = np.unique(pos, return_index=True)
+        return df.iloc[pos[np.sort(first)]]
+
+    def lookup(self, keys) -> np.ndarray:
+        """
+        Como `get_many`, mas numa passada vetorizada (busca binária no vetor ordenado):
+        melhor para listas grandes.
+        """
+        keys = normalize_keys(keys).astype(str)
+        if not len(self._sorted) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        at = np.minimum(np.searchsorted(self._sorted, keys, side="left"), len(self._sorted) - 1)
+        hit = (self._sorted[at] == keys) & (keys != "")
+        return np.where(hit, self._sorted_pos[at], -1).astype(np.int64)
+
+    def partition(self, keys, row_status, blocked=("DESARQUIVADO",)) -> tuple:
+        """
+        Separa `keys` em (conhecidas, desconhecidas, bloqueadas), cada uma uma lista de
+        chaves normalizadas na ordem pedida. `row_status` é o status normalizado de cada
+        linha (mesma ordem da origem); chave cujo status está em `blocked` vai para as bloqueadas.
+        """
+        keys = np.asarray(list(dict.fromkeys(k for k in normalize_keys(keys) if k)), dtype=object)
+        pos = self.lookup(keys)
+        found = pos >= 0
+        status = np.full(len(keys), "", dtype=object)
+        status[found] = np.asarray(row_status, dtype=object)[pos[found]]
+        is_blocked = found & np.isin(status, list(blocked))
+        return (keys[found & ~is_blocked].tolist(), keys[~found].tolist(), keys[is_blocked].tolist())
+
+    # -------- Prefixo / trecho --------
+    @staticmethod
+    def _range(sorted_keys: np.ndarray, prefix: str):
+        lo = np.searchsorted(sorted_keys, prefix, side="left")
+        hi = np.searchsorted(sorted_keys, prefix + "\U0010ffff", side="left")
+        return lo, hi
+
+    def prefix(self, prefix: str) -> np.ndarray:
+        """Posições (em ordem crescente) das linhas cuja chave começa com `prefix`."""
+        prefix = normalize_key(prefix)
+        if not prefix:
+            return np.arange(self.size)
+        lo, hi = self._range(self._sorted, prefix)
+        return np.sort(self._sorted_pos[lo:hi])
+
+    def suggest(self, prefix: str, k: int = 10) -> np.ndarray:
+        """Posições das `k` primeiras chaves distintas (em ordem alfabética) que começam com `prefix`."""
+        prefix = normalize_key(prefix)
+        if not prefix:
+            return np.array([], dtype=np.int64)
+        lo, hi = self._range(self._sorted, prefix)
+        # chaves repetidas ficam juntas no vetor ordenado: pega uma folga e tira as repetidas
+        keys = self._sorted[lo:min(hi, lo + 4 * k)]
+        _, first = np.unique(keys, return_index=True)
+        return self._sorted_pos[lo + np.sort(first)[:k]]
+
+    def _suffix_array(self):
+        if self._suffixes is None:
+            keys = pd.Series(self._sorted, dtype=object)
+            width = int(keys.str.len().max()) if len(keys) else 0
+            parts, owners = [], []
+            for i in range(width):
+                suf = keys.str[i:]
+                keep = (suf != "").to_numpy()
+                parts.append(suf.to_numpy()[keep])
+                owners.append(self._sorted_pos[keep])
+            suf = np.concatenate(parts).astype(str) if parts else np.array([], dtype=str)
+            own = np.concatenate(owners) if owners else np.array([], dtype=np.int64)
+            order = np.argsort(suf, kind="stable")
+            self._suffixes = (suf[order], own[order])
+        return self._suffixes
+
+    def contains(self, text: str) -> np.ndarray:
+        """Posições (em ordem crescente) das linhas cuja chave contém `text`."""
+        text = normalize_key(text)
+        if not text:
+            return np.arange(self.size)
+        suf, own = self._suffix_array()
+        lo, hi = self._range(suf, text)
+        return np.unique(own[lo:hi])
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from key_index import normalize_key, normalize_keys
+
+# Níveis da posição física, do mais amplo ao mais específico
+LOCATION_LEVELS = ("Local", "Estante", "Prateleira", "Caixa")
+
+
+class LocationIndex:
+    """
+    Índice da posição física (Local / Estante / Prateleira / Caixa) -> linhas,
+    montado uma vez por versão. Um caminho é um prefixo dos níveis, p.ex.
+    ("ARQUIVO 1", "002") = estante 002 do ARQUIVO 1; a comparação ignora
+    espaços nas pontas e maiúsculas/minúsculas.
+      - `rows(*caminho)`: posições (iloc, em ordem crescente) das linhas nesse ponto
+      - `count(*caminho)` / `is_occupied(*caminho)`: ocupação sem varrer a aba
+      - `children(*caminho)`: valores distintos do nível seguinte (para os selects em cascata)
+      - `occupancy(*caminho)`: quantos documentos há em cada valor do nível seguinte
+    """
+
+    def __init__(self, df: pd.DataFrame, levels=LOCATION_LEVELS):
+        self.levels = tuple(levels)
+        self.size = len(df)
+        raw = {
+            c: (df[c].astype(object) if c in df.columns else pd.Series([""] * self.size, index=df.index))
+            for c in self.levels
+        }
+        norm = pd.DataFrame({c: normalize_keys(raw[c]) for c in self.levels})
+        self._groups = {(): np.arange(self.size)}
+        self._children = {}
+        for depth in range(1, len(self.levels) + 1):
+            cols = list(self.levels[:depth])
+            level = self.levels[depth - 1]
+            # rótulo exibido: o primeiro valor original (sem espaços nas pontas) de cada chave
+            labels = raw[level].where(raw[level].notna(), "").astype(str).str.strip().to_numpy(dtype=object)
+            for key, pos in norm.groupby(cols, sort=False).indices.items():
+                key = key if isinstance(key, tuple) else (key,)
+                self._groups[key] = pos
+                if key[-1]:
+                    self._children.setdefault(key[:-1], []).append((labels[pos[0]], len(pos)))
+        for parent in self._children:
+            self._children[parent].sort(key=lambda item: item[0])
+
+    def __len__(self):
+        return self.size
+
+    def _key(self, path) -> tuple:
+        if len(path) > len(self.levels):
+            raise ValueError(f"Caminho com mais de {len(self.levels)} níveis: {path}")
+        return tuple(normalize_key(p) for p in path)
+
+    # -------- Consultas --------
+    def rows(self, *path) -> np.ndarray:
+        return self._groups.get(self._key(path), np.array([], dtype=np.int64))
+
+    def count(self, *path) -> int:
+        return len(self.rows(*path))
+
+    def is_occupied(self, *path) -> bool:
+        return self.count(*path) > 0
+
+    def children(self, *path) -> list:
+        """Valores distintos (não vazios, em ordem) do nível abaixo de `path`."""
+        return [label for label, _ in self._children.get(self._key(path), [])]
+
+    def occupancy(self, *path) -> pd.DataFrame:
+        """Documentos por valor do nível abaixo de `path` (vazio se `path` já é o último nível)."""
+        depth = len(path)
+        if depth >= len(self.levels):
+            return pd.DataFrame(columns=["Documentos"])
+        items = self._children.get(self._key(path), [])
+        return pd.DataFrame(
+            {self.levels[depth]: [label for label, _ in items], "Documentos": [n for _, n in items]}
+        )
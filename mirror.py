@@ -0,0 +1,304 @@
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+
+# Quantas versões (eTags) de cada arquivo manter no espelho
+MIRROR_KEEP_VERSIONS = 6
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versoes (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    fonte     TEXT NOT NULL,
+    etag      TEXT NOT NULL,
+    criado_em TEXT NOT NULL,
+    UNIQUE (fonte, etag)
+);
+CREATE TABLE IF NOT EXISTS colunas (
+    versao   INTEGER NOT NULL,
+    aba      TEXT NOT NULL,
+    aba_pos  INTEGER NOT NULL,
+    pos      INTEGER NOT NULL,
+    nome     TEXT,
+    tipo     TEXT NOT NULL,
+    PRIMARY KEY (versao, aba, pos)
+);
+"""
+
+
+class StaleMirror(KeyError):
+    """A versão pedida não está (mais) no espelho."""
+
+
+# -------- Conversão coluna <-> SQLite --------
+# tipo gravado em `colunas.tipo`:
+#   datetime -> TEXT ISO 8601 | int/float/bool -> nativos | text -> TEXT
+#   datetext -> data como INTEGER (ns desde 1970) e texto como TEXT na mesma coluna
+#               (colunas de data com algumas células em texto, comuns nas planilhas)
+#   object   -> BLOB (pickle por célula; demais colunas com tipos misturados)
+
+def _column_kind(s: pd.Series) -> str:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return "datetime"
+    if pd.api.types.is_bool_dtype(s):
+        return "bool"
+    if pd.api.types.is_integer_dtype(s):
+        return "int"
+    if pd.api.types.is_float_dtype(s):
+        return "float"
+    if s.dtype == object:
+        values = s.dropna()
+        if all(isinstance(v, str) for v in values):
+            return "text"
+        if all(isinstance(v, (str, datetime)) for v in values):
+            return "datetext"
+    return "object"
+
+
+def _to_sql_values(s: pd.Series, kind: str) -> list:
+    if kind == "datetime":
+        return [None if pd.isna(v) else v.isoformat() for v in s]
+    if kind == "bool":
+        return [int(v) for v in s]
+    if kind == "int":
+        return [int(v) for v in s]
+    if kind == "float":
+        return [None if pd.isna(v) else float(v) for v in s]
+    if kind == "text":
+        return [None if _is_missing(v) else v for v in s]
+    if kind == "datetext":
+        return [None if _is_missing(v) else v if isinstance(v, str) else pd.Timestamp(v).value for v in s]
+    return [None if _is_missing(v) else sqlite3.Binary(pickle.dumps(v)) for v in s]
+
+
+def _from_sql_values(s: pd.Series, kind: str) -> pd.Series:
+    if kind == "datetime":
+        return pd.to_datetime(s, format="ISO8601")
+    if kind == "bool":
+        return s.astype(bool)
+    if kind == "int":
+        return s.astype("int64")
+    if kind == "float":
+        return s.astype("float64")
+    if kind == "text":
+        return s.astype(object).where(s.notna(), float("nan"))
+    if kind == "datetext":
+        return s.map(lambda v: float("nan") if v is None else v if isinstance(v, str)
+                     else pd.Timestamp(int(v))).astype(object)
+    return s.map(lambda v: float("nan") if v is None else pickle.loads(v)).astype(object)
+
+
+def _is_missing(v) -> bool:
+    try:
+        return bool(pd.isna(v))
+    except (TypeError, ValueError):
+        return False
+
+
+def _table(version_id: int, sheet_pos: int) -> str:
+    return f"v{version_id}_aba{sheet_pos}"
+
+
+class SheetMirror:
+    """
+    Espelho local (SQLite) das abas do workbook, por arquivo de origem e eTag.
+    Cada versão guarda suas abas como tabelas (colunas c0..cN; nomes/tipos em `colunas`),
+    então ler uma aba é um SELECT — sem abrir o .xlsx nem passar pelo openpyxl.
+    O Excel no SharePoint continua sendo a fonte da verdade: o espelho só é
+    (re)preenchido quando aparece um eTag novo, e mantém as `keep` versões mais recentes.
+    `store_later` grava numa thread de fundo: a leitura de uma versão nova não espera o SQLite.
+    Seguro para várias threads/processos (uma conexão por operação, WAL).
+    """
+
+    def __init__(self, path: str, source: str, keep: int = MIRROR_KEEP_VERSIONS):
+        self.path = path
+        self.source = source
+        self.keep = max(1, keep)
+        self._write_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._worker = None
+        self._queue_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:                          # commit/rollback da transação
+                yield conn
+
+    def _version_id(self, conn, etag: str):
+        row = conn.execute("SELECT id FROM versoes WHERE fonte = ? AND etag = ?",
+                           (self.source, etag)).fetchone()
+        return row[0] if row else None
+
+    # -------- Consulta --------
+    def has_version(self, etag: str | None) -> bool:
+        if not etag:
+            return False
+        with self._connect() as conn:
+            return self._version_id(conn, etag) is not None
+
+    def latest_etag(self):
+        """eTag da versão espelhada mais recente deste arquivo (ou None)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT etag FROM versoes WHERE fonte = ? ORDER BY id DESC LIMIT 1",
+                               (self.source,)).fetchone()
+        return row[0] if row else None
+
+    def sheet_names(self, etag: str) -> list:
+        with self._connect() as conn:
+            vid = self._version_id(conn, etag)
+            if vid is None:
+                raise StaleMirror(etag)
+            rows = conn.execute("SELECT DISTINCT aba, aba_pos FROM colunas WHERE versao = ? ORDER BY aba_pos",
+                                (vid,)).fetchall()
+        return [r[0] for r in rows]
+
+    def read_sheet(self, etag: str, sheet: str) -> pd.DataFrame:
+        """DataFrame da aba naquela versão, com os mesmos nomes/tipos de coluna do parse original."""
+        with self._connect() as conn:
+            vid = self._version_id(conn, etag)
+            if vid is None:
+                raise StaleMirror(etag)
+            cols = conn.execute("SELECT aba_pos, pos, nome, tipo FROM colunas "
+                                "WHERE versao = ? AND aba = ? ORDER BY pos", (vid, sheet)).fetchall()
+            if not cols:
+                raise KeyError(sheet)
+            raw = pd.read_sql_query(f'SELECT * FROM "{_table(vid, cols[0][0])}" ORDER BY rowid', conn)
+        data = {}
+        for _, pos, nome, tipo in cols:
+            if pos < 0:                         # marcador de aba sem colunas
+                continue
+            data[pickle.loads(nome)] = _from_sql_values(raw[f"c{pos}"], tipo)
+        return pd.DataFrame(data, index=pd.RangeIndex(len(raw)))
+
+    def workbook(self, etag: str) -> "MirrorWorkbook":
+        return MirrorWorkbook(self, etag)
+
+    # -------- Escrita --------
+    def store(self, etag: str, sheets: Mapping):
+        """Grava todas as abas da versão `etag` (lê cada uma de `sheets`) e descarta as versões antigas."""
+        if not etag:
+            return
+        frames = [(name, sheets[name]) for name in sheets]
+        with self._write_lock, self._connect() as conn:
+            if self._version_id(conn, etag) is not None:
+                return
+            vid = conn.execute("INSERT INTO versoes (fonte, etag, criado_em) VALUES (?, ?, ?)",
+                               (self.source, etag, datetime.now(timezone.utc).isoformat())).lastrowid
+            for sheet_pos, (name, df) in enumerate(frames):
+                self._store_sheet(conn, vid, sheet_pos, name, df)
+            self._prune(conn)
+
+    def store_later(self, etag: str, sheets: Mapping):
+        """Agenda `store` na thread de fundo e volta na hora (cada eTag entra na fila uma vez)."""
+        if not etag:
+            return
+        with self._queue_lock:
+            if etag in self._queued:
+                return
+            self._queued.add(etag)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="sheet-mirror", daemon=True)
+                self._worker.start()
+        self._queue.put((etag, sheets))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Espera as gravações agendadas (testes/encerramento); False se o tempo acabou."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._queue_lock:
+                if not self._queued:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+
+    def _run(self):
+        while True:
+            etag, sheets = self._queue.get()
+            try:
+                self.store(etag, sheets)
+            except Exception:
+                pass  # espelho é só cache: a versão volta a ser lida do .xlsx
+            finally:
+                with self._queue_lock:
+                    self._queued.discard(etag)
+
+    def _store_sheet(self, conn, vid: int, sheet_pos: int, name: str, df: pd.DataFrame):
+        table = _table(vid, sheet_pos)
+        kinds = [_column_kind(df.iloc[:, i]) for i in range(df.shape[1])]
+        col_defs = ", ".join(f"c{i}" for i in range(len(kinds))) or "c0"
+        conn.execute(f'CREATE TABLE "{table}" ({col_defs})')
+        # nomes via pickle: o parse pode gerar nomes não-texto (números, datas)
+        meta = [(vid, name, sheet_pos, i, pickle.dumps(df.columns[i]), k) for i, k in enumerate(kinds)]
+        conn.executemany("INSERT INTO colunas VALUES (?, ?, ?, ?, ?, ?)",
+                         meta or [(vid, name, sheet_pos, -1, None, "text")])
+        if not kinds or df.empty:
+            return
+        columns = [_to_sql_values(df.iloc[:, i], k) for i, k in enumerate(kinds)]
+        marks = ", ".join("?" for _ in kinds)
+        conn.executemany(f'INSERT INTO "{table}" VALUES ({marks})', zip(*columns))
+
+    def _prune(self, conn):
+        old = conn.execute("SELECT id FROM versoes WHERE fonte = ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+                           (self.source, self.keep)).fetchall()
+        for (vid,) in old:
+            positions = conn.execute("SELECT DISTINCT aba_pos FROM colunas WHERE versao = ?", (vid,)).fetchall()
+            for (sheet_pos,) in positions:
+                conn.execute(f'DROP TABLE IF EXISTS "{_table(vid, sheet_pos)}"')
+            conn.execute("DELETE FROM colunas WHERE versao = ?", (vid,))
+            conn.execute("DELETE FROM versoes WHERE id = ?", (vid,))
+
+
+class MirrorWorkbook(Mapping):
+    """
+    Mesma interface do `LazyWorkbook`, lendo do espelho: cada aba vem do SQLite
+    no primeiro acesso e fica memorizada. Os DataFrames são compartilhados: copie antes de alterar.
+    """
+
+    def __init__(self, mirror: SheetMirror, etag: str):
+        self.version = etag
+        self._mirror = mirror
+        self._names = mirror.sheet_names(etag)
+        self._sheets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def sheet_names(self) -> list:
+        return list(self._names)
+
+    @property
+    def parsed_sheets(self) -> list:
+        return [n for n in self._names if n in self._sheets]
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        df = self._sheets.get(name)
+        if df is not None:
+            return df
+        if name not in self._names:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._sheets:
+                self._sheets[name] = self._mirror.read_sheet(self.version, name)
+            return self._sheets[name]
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name) -> bool:
+        return name in self._names
+
+    def close(self):
+        pass
@@ -0,0 +1,60 @@
+import math
+import numpy as np
+import pandas as pd
+from schema import parse_dates
+
+# Opções de linhas por página
+PAGE_SIZES = (25, 50, 100, 250)
+DATE_FORMAT = "%d/%m/%Y"
+
+
+def page_count(total: int, page_size: int) -> int:
+    """Quantas páginas para `total` linhas (no mínimo 1, mesmo sem linhas)."""
+    return max(1, math.ceil(total / max(1, page_size)))
+
+
+def sort_order(df: pd.DataFrame, column: str | None, ascending: bool = True, date_columns=()) -> np.ndarray:
+    """
+    Posições (iloc) de `df` ordenadas por `column`, sem reordenar o DataFrame.
+    Coluna de data guardada como texto é ordenada como data; vazios ficam no fim.
+    """
+    if not column or column not in df.columns:
+        return np.arange(len(df))
+    s = df[column].reset_index(drop=True)
+    if column in date_columns and not pd.api.types.is_datetime64_any_dtype(s):
+        s = parse_dates(s)
+    try:
+        ordered = s.sort_values(ascending=ascending, kind="stable", na_position="last")
+    except TypeError:
+        # tipos misturados numa coluna de texto: compara como texto
+        ordered = s.sort_values(ascending=ascending, kind="stable", na_position="last",
+                                key=lambda c: c.astype(str))
+    return ordered.index.to_numpy()
+
+
+def format_dates(page: pd.DataFrame, date_columns=(), fmt: str = DATE_FORMAT) -> pd.DataFrame:
+    """Datas das colunas `date_columns` como texto `fmt`; o que não é data fica como está."""
+    for col in date_columns:
+        if col not in page.columns:
+            continue
+        raw = page[col]
+        dt = raw if pd.api.types.is_datetime64_any_dtype(raw) else parse_dates(raw)
+        text = dt.dt.strftime(fmt)
+        page[col] = text.where(dt.notna(), raw.where(raw.notna(), "").astype(str).str.strip())
+    return page
+
+
+def paginate(df: pd.DataFrame, page: int, page_size: int, sort_by: str | None = None,
+             ascending: bool = True, columns=None, date_columns=()) -> tuple:
+    """
+    Uma página de `df`: ordena (só as posições), fatia e formata apenas as linhas da página.
+    Devolve (página, número da página efetiva, total de páginas); `page` começa em 1 e é
+    limitado ao intervalo válido.
+    """
+    n_pages = page_count(len(df), page_size)
+    page = min(max(1, int(page)), n_pages)
+    order = sort_order(df, sort_by, ascending, date_columns)
+    start = (page - 1) * page_size
+    cols = [c for c in columns if c in df.columns] if columns else list(df.columns)
+    out = df.iloc[order[start:start + page_size]][cols].copy()
+    return format_dates(out, date_columns), page, n_pages
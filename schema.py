@@ -0,0 +1,92 @@
+from datetime import date, datetime
+import pandas as pd
+from key_index import normalize_keys
+
+# ===== Tipos da aba Arquivos =====
+# Datas gravadas ora como data real (Cadastrar), ora como texto dd/mm/aaaa (Status/Movimentar)
+DATE_COLUMNS = ("Data Arquivamento", "Data Desarquivamento", "Data Prevista de Descarte")
+# Poucos valores distintos, repetidos em muitas linhas
+CATEGORY_COLUMNS = ("Status", "Local", "Tipo de Documento", "Departamento Origem")
+# Coluna original -> coluna derivada já normalizada (sem espaços nas pontas, maiúsculas).
+# As derivadas começam com "_" e nunca vão para o Excel.
+KEY_COLUMNS = {"ID": "_ID", "Status": "_STATUS", "Local": "_LOCAL"}
+
+
+def parse_dates(values) -> pd.Series:
+    """
+    Datas misturadas -> datetime64: datas reais passam direto; texto ISO (aaaa-mm-dd...)
+    e texto brasileiro (dd/mm/aaaa [hh:mm[:ss]]) são interpretados cada um no seu formato.
+    O que não for data vira NaT.
+    """
+    s = pd.Series(values).astype(object)
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    real = s.map(lambda v: isinstance(v, (datetime, date)) and v is not pd.NaT)
+    if real.any():
+        out[real] = pd.to_datetime(s[real], errors="coerce")
+    txt = s[~real & s.notna()].astype(str).str.strip()
+    txt = txt[txt != ""]
+    if not txt.empty:
+        iso = txt.str.match(r"^\d{4}-\d{2}-\d{2}")
+        if iso.any():
+            out[iso[iso].index] = pd.to_datetime(txt[iso], format="ISO8601", errors="coerce")
+        br = txt[~iso]
+        if not br.empty:
+            out[br.index] = pd.to_datetime(br, dayfirst=True, format="mixed", errors="coerce")
+    return out
+
+
+def _category(values) -> pd.Series:
+    s = pd.Series(values).astype(object)
+    return s.where(s.isna(), s.astype(str).str.strip()).astype("category")
+
+
+def typed_arquivos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aba Arquivos com tipos: datas em datetime64, colunas repetitivas como categoria
+    e colunas-chave normalizadas (`KEY_COLUMNS`). Devolve uma cópia.
+    """
+    df = df.copy()
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = parse_dates(df[col]).to_numpy()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = _category(df[col])
+    for col, key_col in KEY_COLUMNS.items():
+        if col in df.columns:
+            df[key_col] = normalize_keys(df[col])
+    return df
+
+
+def to_excel_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Volta ao formato gravado no Excel: sem colunas derivadas, categorias como texto
+    e datas (inclusive as atribuídas como texto) como datas reais.
+    """
+    df = df.drop(columns=[c for c in KEY_COLUMNS.values() if c in df.columns])
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = parse_dates(df[col]).to_numpy()
+    return df
+
+
+def assign(df: pd.DataFrame, labels, column: str, value):
+    """
+    `df.loc[labels, column] = value` respeitando o tipo da coluna: valor novo em
+    coluna de categoria entra como categoria, texto em coluna de data vira data, e a
+    coluna-chave normalizada acompanha.
+    """
+    if column in DATE_COLUMNS:
+        value = parse_dates([value]).iloc[0]
+    elif column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+        if not pd.isna(value):
+            value = str(value).strip()
+            if value not in df[column].cat.categories:
+                df[column] = df[column].cat.add_categories([value])
+    df.loc[labels, column] = value
+    key_col = KEY_COLUMNS.get(column)
+    if key_col and key_col in df.columns:
+        df.loc[labels, key_col] = normalize_keys([value])[0]
@@ -1,24 +1,179 @@
 # sp_connector.py
-import io, time, requests, msal, pandas as pd
+import io, os, json, time, random, hashlib, tempfile, threading, weakref, requests, msal, pandas as pd
+from contextlib import contextmanager
 from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 GRAPH = "https://graph.microsoft.com/v1.0"
 
-class SPConnector:
+# Limite do PUT simples do Graph; acima disso, sessão de upload
+SIMPLE_UPLOAD_MAX = 4 * 1024 * 1024
+# Fatias da sessão de upload precisam ser múltiplas de 320 KiB
+UPLOAD_CHUNK_ALIGN = 320 * 1024
+UPLOAD_CHUNK_SIZE = 16 * UPLOAD_CHUNK_ALIGN     # 5 MiB
+# Fatia de leitura do download em streaming (e limite do spool em memória)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Política única de retry para todas as chamadas HTTP
+# (423 = arquivo bloqueado no SharePoint; 429/503 costumam trazer Retry-After)
+RETRY_STATUSES = (423, 429, 503, 504)
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 1.0          # 1s, 2s, 4s, ... + jitter (limitado a RETRY_BACKOFF_MAX)
+RETRY_BACKOFF_MAX = 60
+POOL_SIZE = 10
+CONNECT_TIMEOUT = 10
+
+# Limite do Graph de sub-requisições por chamada JSON $batch
+BATCH_MAX = 20
+
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+# Token é considerado vencido este tanto antes do expires_in real
+TOKEN_SKEW = 60
+# Renovação em segundo plano acontece este tanto antes de vencer
+TOKEN_REFRESH_MARGIN = 300
+
+try:
+    import fcntl
+except ImportError:                      # Windows: sem flock; cache segue funcionando sem trava
+    fcntl = None
+
+
+def _build_http_session(pool_size: int = POOL_SIZE, retries: int = RETRY_TOTAL,
+                        backoff: float = RETRY_BACKOFF) -> requests.Session:
+    """Session com pool keep-alive e retry central (Retry-After + backoff exponencial com jitter)."""
+    retry_kw = dict(
+        total=retries, connect=retries, read=retries, status=retries,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,               # PUT/POST também: uploads são idempotentes por faixa
+        backoff_factor=backoff,
+        respect_retry_after_header=True,
+        raise_on_status=False,              # devolve a última resposta; quem chama faz raise_for_status
+    )
+    try:
+        retry = Retry(backoff_jitter=backoff, backoff_max=RETRY_BACKOFF_MAX, **retry_kw)
+    except TypeError:
+        # urllib3 < 2 não tem jitter/backoff_max configuráveis
+        retry = Retry(**retry_kw)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PreconditionFailed(RuntimeError):
+    """Escrita condicional recusada (HTTP 412): o arquivo mudou desde o eTag informado."""
+
+
+def _retry_after_seconds(headers: dict, attempt: int) -> float:
+    """Espera indicada pelo servidor (Retry-After) ou backoff exponencial com jitter."""
+    for k, v in (headers or {}).items():
+        if k.lower() == "retry-after":
+            try:
+                return min(float(v), RETRY_BACKOFF_MAX)
+            except (TypeError, ValueError):
+                break
+    return min(RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, RETRY_BACKOFF), RETRY_BACKOFF_MAX)
+
+
+def _raise_for_batch_item(res: dict | None, what: str):
+    """Converte a resposta de um item do $batch em exceção, como faria raise_for_status."""
+    if res is None:
+        raise RuntimeError(f"Sem resposta no $batch para {what}")
+    status = res["status"]
+    if status == 404:
+        raise FileNotFoundError(what)
+    if status == 412:
+        raise PreconditionFailed(what)
+    if status >= 400:
+        err = (res.get("body") or {}).get("error", {}) if isinstance(res.get("body"), dict) else {}
+        raise RuntimeError(f"HTTP {status} em {what}: {err.get('message') or err.get('code') or ''}".strip())
+
+
+class TokenFileCache:
     """
-    Conecta no SharePoint/OneDrive via Microsoft Graph (app-only).
-    Suporta:
-      - SharePoint Site: hostname + site_path + library_name
-      - OneDrive do usuário: user_upn (ex: "susanna.bernardes@synvia.com")
-    Caminho do arquivo:
-      - OneDrive: RELATIVO a Documents (ex: "Pasta/arquivo.xlsx")
-        (aceita tb /personal/<upn>/Documents/... que será normalizado)
-      - SharePoint: RELATIVO à biblioteca (ex: "Pasta/arquivo.xlsx")
-        (aceita tb server-relative /sites/<site>/<lib>/... que será normalizado)
+    Cache de access token em arquivo JSON, compartilhado pelos processos do host.
+    Chave = tenant + client; acesso serializado com flock em `<arquivo>.lock`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+
+    @contextmanager
+    def locked(self, exclusive: bool = True):
+        with open(f"{self.path}.lock", "a") as lf:
+            if fcntl is not None:
+                fcntl.flock(lf, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _read_all(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key: str):
+        """-> (token, expira_em) ou None. Chame dentro de `locked()`."""
+        entry = self._read_all().get(key) or {}
+        if entry.get("access_token") and entry.get("expires_at"):
+            return entry["access_token"], float(entry["expires_at"])
+        return None
+
+    def put(self, key: str, token: str, expires_at: float):
+        """Grava atomicamente. Chame dentro de `locked(exclusive=True)`."""
+        data = self._read_all()
+        data[key] = {"access_token": token, "expires_at": expires_at}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.chmod(tmp, 0o600)             # é credencial: só o dono lê
+        os.replace(tmp, self.path)
+
+
+def _refresh_loop(conn_ref, stop: threading.Event, margin: float):
+    """Thread de renovação: acorda `margin` s antes do vencimento e renova o token."""
+    while not stop.is_set():
+        conn = conn_ref()
+        if conn is None:
+            return
+        wait = max(conn._tok_expires_at - margin - time.time(), 5)
+        del conn                                    # não segura o conector enquanto dorme
+        if stop.wait(wait):
+            return
+        conn = conn_ref()
+        if conn is None:
+            return
+        try:
+            conn._refresh_token(min_validity=margin)
+        except Exception:
+            stop.wait(30)                           # falha transitória: tenta de novo em breve
+        del conn
+
+
+class SPConnectorBase:
+    """
+    Parte comum aos conectores síncrono e assíncrono: identidade do tenant/site,
+    token app-only (MSAL), modo (SharePoint x OneDrive) e normalização de caminho.
+    Não faz HTTP.
+    Token:
+      - `token_cache_path`: arquivo (com trava) compartilhado entre processos do host;
+        quem encontra um token válido ali não vai ao login.microsoftonline.com
+      - `refresh_in_background=True`: thread renova o token antes de vencer,
+        de modo que nenhuma requisição de usuário paga a aquisição
     """
 
     def __init__(self, tenant_id, client_id, client_secret,
-                 hostname=None, site_path=None, library_name=None, user_upn=None):
+                 hostname=None, site_path=None, library_name=None, user_upn=None,
+                 graph_url=GRAPH, token_cache_path=None, refresh_in_background=False):
         self.tenant_id = tenant_id
         self.client_id = client_id
         self.client_secret = client_secret
@@ -27,31 +182,94 @@ class SPConnector:
         self.site_path = site_path or ""
         self.library_name = library_name or ""
         self.user_upn = user_upn or ""          # se presente, opera em OneDrive
+        self.graph_url = graph_url.rstrip("/")   # troque por um servidor local em testes
 
-        self._app = msal.ConfidentialClientApplication(
-            client_id=self.client_id,
-            authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-            client_credential=self.client_secret,
-        )
+        self._msal_app = None                   # criado na primeira aquisição de token
         self._tok = None
         self._exp = 0
+        self._tok_expires_at = 0
+        self._tok_lock = threading.Lock()
+        self._token_cache = TokenFileCache(token_cache_path) if token_cache_path else None
+        self._token_key = f"{self.tenant_id}:{self.client_id}"
+        self._refresh_stop = None
         self._site_id_cache = None
         self._drive_id_cache = None
+        if refresh_in_background:
+            self.start_token_refresher()
 
     # -------- Auth --------
+    @property
+    def _app(self):
+        # o construtor do MSAL já vai à rede (descoberta do tenant): só quando precisar de token
+        if self._msal_app is None:
+            self._msal_app = msal.ConfidentialClientApplication(
+                client_id=self.client_id,
+                authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+                client_credential=self.client_secret,
+            )
+        return self._msal_app
+
     def _token(self):
         now = time.time()
         if self._tok and now < self._exp:
             return self._tok
-        res = self._app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
+        with self._tok_lock:
+            if self._tok and time.time() < self._exp:
+                return self._tok
+            return self._refresh_token(min_validity=TOKEN_SKEW, locked=True)
+
+    def _set_token(self, token: str, expires_at: float):
+        self._tok = token
+        self._tok_expires_at = expires_at
+        self._exp = expires_at - TOKEN_SKEW
+
+    def _acquire_token(self, force: bool = False):
+        if force and hasattr(self._app, "remove_tokens_for_client"):
+            # o MSAL devolveria o token do próprio cache em memória; renovação forçada
+            self._app.remove_tokens_for_client()
+        res = self._app.acquire_token_for_client(scopes=[GRAPH_SCOPE])
         if "access_token" not in res:
             raise RuntimeError(res.get("error_description") or res)
-        self._tok = res["access_token"]
-        self._exp = now + int(res.get("expires_in", 3600)) - 60
+        return res["access_token"], time.time() + int(res.get("expires_in", 3600))
+
+    def _refresh_token(self, min_validity: float = TOKEN_SKEW, locked: bool = False):
+        """
+        Garante um token válido por pelo menos `min_validity` s: reaproveita o do
+        arquivo compartilhado (se outro processo já renovou) ou adquire um novo.
+        """
+        if not locked:
+            with self._tok_lock:
+                return self._refresh_token(min_validity, locked=True)
+        force = self._tok is not None
+        if self._token_cache is None:
+            self._set_token(*self._acquire_token(force=force))
+            return self._tok
+        with self._token_cache.locked(exclusive=True):
+            shared = self._token_cache.get(self._token_key)
+            if shared and shared[1] - min_validity > time.time():
+                self._set_token(*shared)
+                return self._tok
+            token, expires_at = self._acquire_token(force=force)
+            self._token_cache.put(self._token_key, token, expires_at)
+        self._set_token(token, expires_at)
         return self._tok
 
-    def _headers(self):
-        return {"Authorization": f"Bearer {self._token()}"}
+    def start_token_refresher(self, margin: float = TOKEN_REFRESH_MARGIN):
+        """Inicia a thread (daemon) que renova o token `margin` s antes de vencer."""
+        if self._refresh_stop is not None:
+            return
+        self._refresh_token()
+        stop = threading.Event()
+        self._refresh_stop = stop
+        # thread só guarda referência fraca: encerra quando o conector é descartado
+        weakref.finalize(self, stop.set)
+        threading.Thread(target=_refresh_loop, args=(weakref.ref(self), stop, margin),
+                         daemon=True, name="sp-token-refresh").start()
+
+    def stop_token_refresher(self):
+        if self._refresh_stop is not None:
+            self._refresh_stop.set()
+            self._refresh_stop = None
 
     # -------- Modo --------
     @property
@@ -59,34 +277,16 @@ class SPConnector:
         return bool(self.user_upn)
 
     # -------- Descoberta (apenas p/ SharePoint Site) --------
-    def _site_id(self):
-        if self.is_onedrive:
-            return None
-        if self._site_id_cache:
-            return self._site_id_cache
-        url = f"{GRAPH}/sites/{self.hostname}:/{self.site_path}"
-        r = requests.get(url, headers=self._headers(), timeout=30)
-        r.raise_for_status()
-        self._site_id_cache = r.json()["id"]
-        return self._site_id_cache
+    def _site_url(self) -> str:
+        return f"{self.graph_url}/sites/{self.hostname}:/{self.site_path}"
 
-    def _drive_id(self):
-        if self.is_onedrive:
-            return None
-        if self._drive_id_cache:
-            return self._drive_id_cache
-        url = f"{GRAPH}/sites/{self._site_id()}/drives"
-        r = requests.get(url, headers=self._headers(), timeout=30)
-        r.raise_for_status()
-        drives = r.json().get("value", [])
+    def _pick_drive(self, drives: list) -> str:
         for d in drives:
             if d.get("name", "").lower() == self.library_name.lower():
-                self._drive_id_cache = d["id"]
-                return self._drive_id_cache
+                return d["id"]
         for d in drives:
             if d.get("driveType") == "documentLibrary":
-                self._drive_id_cache = d["id"]
-                return self._drive_id_cache
+                return d["id"]
         raise RuntimeError(f"Biblioteca '{self.library_name}' não encontrada em {self.site_path}")
 
     # -------- Normalização de caminho --------
@@ -122,38 +322,499 @@ class SPConnector:
                 return path[len(prefix):]
             return path
 
-    # -------- Download / Upload --------
-    def download(self, path: str) -> bytes:
+    # -------- URL / chave de item --------
+    def _item_url_for(self, path: str, drive_id) -> str:
         rel = quote(self.normalize_path(path), safe="/")
         if self.is_onedrive:
-            url = f"{GRAPH}/users/{self.user_upn}/drive/root:/{rel}:/content"
-        else:
-            url = f"{GRAPH}/drives/{self._drive_id()}/root:/{rel}:/content"
-        r = requests.get(url, headers=self._headers(), timeout=180)
+            return f"{self.graph_url}/users/{self.user_upn}/drive/root:/{rel}"
+        return f"{self.graph_url}/drives/{drive_id}/root:/{rel}"
+
+    def _cache_key(self, path: str) -> str:
+        rel = self.normalize_path(path)
+        if self.is_onedrive:
+            return f"onedrive:{self.user_upn.lower()}:{rel}"
+        return f"site:{self.hostname}/{self.site_path}/{self.library_name}:{rel}"
+
+
+class SPConnector(SPConnectorBase):
+    """
+    Conecta no SharePoint/OneDrive via Microsoft Graph (app-only).
+    Suporta:
+      - SharePoint Site: hostname + site_path + library_name
+      - OneDrive do usuário: user_upn (ex: "susanna.bernardes@synvia.com")
+    Caminho do arquivo:
+      - OneDrive: RELATIVO a Documents (ex: "Pasta/arquivo.xlsx")
+        (aceita tb /personal/<upn>/Documents/... que será normalizado)
+      - SharePoint: RELATIVO à biblioteca (ex: "Pasta/arquivo.xlsx")
+        (aceita tb server-relative /sites/<site>/<lib>/... que será normalizado)
+    Upload:
+      - `upload` escolhe PUT simples ou sessão de upload (`upload_large`) pelo tamanho
+      - `upload_large` envia em fatias, retoma da última faixa confirmada e aceita
+        bytes, caminho de arquivo, objeto arquivo ou iterador de bytes
+    Download:
+      - `open_download` lê o corpo em streaming e devolve um arquivo (com seek),
+        que `pd.read_excel` consome direto — pico de memória ~ tamanho da fatia
+    Cache de download:
+      - guarda eTag/cTag + conteúdo do último download de cada caminho
+      - com `cache_dir` o conteúdo fica em disco (sobrevive a restart do processo);
+        sem ele, uma cópia em memória (desligável com `memory_cache=False`)
+      - revalida com `If-None-Match`; em 304 devolve o conteúdo do cache
+    HTTP:
+      - uma `requests.Session` com pool keep-alive por conector
+      - retry central em 423/429/503/504 respeitando `Retry-After`, com backoff + jitter
+      - `batch` agrupa até 20 sub-requisições num único POST /$batch
+        (descoberta de site/biblioteca e `get_metadata_many` já usam)
+    """
+
+    def __init__(self, tenant_id, client_id, client_secret,
+                 hostname=None, site_path=None, library_name=None, user_upn=None,
+                 cache_dir=None, memory_cache=True, graph_url=GRAPH,
+                 pool_size=POOL_SIZE, retries=RETRY_TOTAL, connect_timeout=CONNECT_TIMEOUT,
+                 token_cache_path=None, refresh_in_background=False):
+        super().__init__(tenant_id, client_id, client_secret,
+                         hostname=hostname, site_path=site_path, library_name=library_name,
+                         user_upn=user_upn, graph_url=graph_url,
+                         token_cache_path=token_cache_path,
+                         refresh_in_background=refresh_in_background)
+        self.connect_timeout = connect_timeout
+        # conexões TCP/TLS reaproveitadas entre chamadas (e entre sessões do Streamlit)
+        self._http = _build_http_session(pool_size=pool_size, retries=retries)
+
+        self.cache_dir = cache_dir or ""
+        self.memory_cache = memory_cache
+        self._file_cache = {}                   # chave -> {"eTag", "cTag", "content", "file"}
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    # -------- HTTP --------
+    def _timeout(self, read: float):
+        return (self.connect_timeout, read)
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self._token()}"}
+
+    # -------- Descoberta (apenas p/ SharePoint Site) --------
+    def _site_id(self):
+        if self.is_onedrive:
+            return None
+        if self._site_id_cache:
+            return self._site_id_cache
+        url = self._site_url()
+        r = self._http.get(url, headers=self._headers(), timeout=self._timeout(30))
+        r.raise_for_status()
+        self._site_id_cache = r.json()["id"]
+        return self._site_id_cache
+
+    def _drive_id(self):
+        if self.is_onedrive:
+            return None
+        if self._drive_id_cache:
+            return self._drive_id_cache
+        if not self._site_id_cache:
+            # partida a frio: site e bibliotecas numa única ida ao servidor
+            site_url = self._relative_url(self._site_url())
+            site, drives = self.batch([
+                {"method": "GET", "url": site_url},
+                {"method": "GET", "url": f"{site_url}:/drives"},
+            ])
+            _raise_for_batch_item(site, self._site_url())
+            _raise_for_batch_item(drives, f"{self._site_url()}:/drives")
+            self._site_id_cache = site["body"]["id"]
+            self._drive_id_cache = self._pick_drive(drives["body"].get("value", []))
+            return self._drive_id_cache
+        url = f"{self.graph_url}/sites/{self._site_id()}/drives"
+        r = self._http.get(url, headers=self._headers(), timeout=self._timeout(30))
+        r.raise_for_status()
+        self._drive_id_cache = self._pick_drive(r.json().get("value", []))
+        return self._drive_id_cache
+
+    # -------- JSON $batch --------
+    def _relative_url(self, url: str) -> str:
+        """URL absoluta do Graph -> relativa (formato exigido dentro do $batch)."""
+        return url[len(self.graph_url):] if url.startswith(self.graph_url) else url
+
+    def batch(self, items: list, max_retries: int = RETRY_TOTAL) -> list:
+        """
+        Envia sub-requisições via JSON $batch, em lotes de até 20.
+        Cada item: {"method": "GET", "url": "/relativa/ao/v1.0", "headers": {...}, "body": {...}}
+        (headers/body opcionais). Retorna, NA MESMA ORDEM, {"status", "headers", "body"}.
+        Itens que voltam 423/429/503/504 são reenviados (só eles) depois do maior
+        `Retry-After` do lote; os demais erros por item voltam como estão, sem exceção.
+        """
+        results = [None] * len(items)
+        pending = list(range(len(items)))
+        attempt = 0
+        while pending:
+            retry, wait = [], 0.0
+            for start in range(0, len(pending), BATCH_MAX):
+                ids = pending[start:start + BATCH_MAX]
+                body = {"requests": []}
+                for i in ids:
+                    sub = {"id": str(i), "method": items[i].get("method", "GET").upper(),
+                           "url": self._relative_url(items[i]["url"])}
+                    if items[i].get("body") is not None:
+                        sub["body"] = items[i]["body"]
+                        sub["headers"] = {"Content-Type": "application/json", **(items[i].get("headers") or {})}
+                    elif items[i].get("headers"):
+                        sub["headers"] = items[i]["headers"]
+                    body["requests"].append(sub)
+                r = self._http.post(f"{self.graph_url}/$batch", headers=self._headers(),
+                                    json=body, timeout=self._timeout(60))
+                r.raise_for_status()
+                for resp in r.json().get("responses", []):
+                    i = int(resp["id"])
+                    headers = resp.get("headers") or {}
+                    results[i] = {"status": int(resp.get("status", 0)), "headers": headers,
+                                  "body": resp.get("body")}
+                    if results[i]["status"] in RETRY_STATUSES:
+                        retry.append(i)
+                        wait = max(wait, _retry_after_seconds(headers, attempt))
+            if not retry or attempt >= max_retries:
+                break
+            attempt += 1
+            time.sleep(wait)
+            pending = sorted(retry)
+        return results
+
+    def get_metadata_many(self, paths) -> dict:
+        """{caminho: metadados | Exception} — eTags de vários arquivos numa só ida (por 20)."""
+        paths = list(paths)
+        urls = [self._relative_url(self._item_url(p)) for p in paths]
+        out = {}
+        for p, url, res in zip(paths, urls, self.batch([{"method": "GET", "url": u} for u in urls])):
+            try:
+                _raise_for_batch_item(res, p)
+                out[p] = res["body"]
+            except Exception as e:
+                out[p] = e
+        return out
+
+    # -------- URLs de item --------
+    def _item_url(self, path: str) -> str:
+        return self._item_url_for(path, None if self.is_onedrive else self._drive_id())
+
+    # -------- Cache de conteúdo (eTag) --------
+    # Entrada: {"eTag", "cTag", "content": bytes | None, "file": caminho | None}
+    # Com `cache_dir` o conteúdo fica só em disco; sem ele, uma única cópia em memória
+    # (compartilhada por quem abrir — BytesIO não duplica bytes até ser escrito).
+    def _cache_files(self, key: str):
+        h = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{h}.bin"), os.path.join(self.cache_dir, f"{h}.json")
+
+    def _cache_get(self, key: str):
+        entry = self._file_cache.get(key)
+        if entry is not None or not self.cache_dir:
+            return entry
+        bin_path, meta_path = self._cache_files(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("key") != key or not meta.get("eTag") or not os.path.exists(bin_path):
+            return None
+        entry = {"eTag": meta["eTag"], "cTag": meta.get("cTag"), "content": None, "file": bin_path}
+        self._file_cache[key] = entry
+        return entry
+
+    def _cache_open(self, entry):
+        if entry.get("content") is not None:
+            return io.BytesIO(entry["content"])
+        return open(entry["file"], "rb")
+
+    def _cache_put(self, key: str, etag, ctag, content: bytes = None, spool=None):
+        """
+        Registra a versão `etag`. Conteúdo vem como `content` (bytes) ou `spool`
+        (arquivo temporário já escrito, posicionado em qualquer lugar).
+        """
+        if not etag or (content is None and spool is None):
+            self._cache_drop(key)
+            return
+        if not self.cache_dir:
+            if not self.memory_cache:
+                return
+            if content is None:
+                spool.seek(0)
+                content = spool.read()
+            self._file_cache[key] = {"eTag": etag, "cTag": ctag, "content": content, "file": None}
+            return
+        bin_path, meta_path = self._cache_files(key)
+        try:
+            # escreve em temporário e troca: outro processo nunca lê arquivo pela metade
+            tmp = f"{bin_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                if content is not None:
+                    f.write(content)
+                else:
+                    spool.seek(0)
+                    for block in iter(lambda: spool.read(DOWNLOAD_CHUNK_SIZE), b""):
+                        f.write(block)
+            os.replace(tmp, bin_path)
+            tmp = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "eTag": etag, "cTag": ctag}, f)
+            os.replace(tmp, meta_path)
+        except OSError:
+            self._cache_drop(key)
+            return
+        self._file_cache[key] = {"eTag": etag, "cTag": ctag, "content": None, "file": bin_path}
+
+    def _cache_drop(self, key: str):
+        self._file_cache.pop(key, None)
+        if self.cache_dir:
+            for p in self._cache_files(key):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    def cached_etag(self, path: str):
+        """eTag da última versão baixada/enviada deste caminho (ou None)."""
+        entry = self._cache_get(self._cache_key(path))
+        return entry["eTag"] if entry else None
+
+    def invalidate(self, path: str):
+        """Descarta o conteúdo em cache do caminho (memória e disco)."""
+        self._cache_drop(self._cache_key(path))
+
+    def get_metadata(self, path: str) -> dict:
+        """Metadados do item (eTag, cTag, size, ...) — requisição leve, sem conteúdo."""
+        r = self._http.get(self._item_url(path), headers=self._headers(), timeout=self._timeout(30))
         if r.status_code == 404:
             raise FileNotFoundError(path)
         r.raise_for_status()
-        return r.content
+        return r.json()
 
-    def upload_small(self, path: str, content: bytes, overwrite: bool = True):
-        rel = quote(self.normalize_path(path), safe="/")
+    def list_children(self, path: str) -> list:
+        """Metadados (name, eTag, size, ...) dos itens da pasta `path` (todas as páginas)."""
+        url = f"{self._item_url(path)}:/children"
+        items = []
+        while url:
+            r = self._http.get(url, headers=self._headers(), timeout=self._timeout(30))
+            if r.status_code == 404:
+                raise FileNotFoundError(path)
+            r.raise_for_status()
+            data = r.json()
+            items.extend(data.get("value", []))
+            url = data.get("@odata.nextLink")
+        return items
+
+    # -------- Download / Upload --------
+    def open_download(self, path: str, revalidate: bool = True, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+        """
+        Abre a versão atual do arquivo como objeto binário (com seek), pronto para
+        `pd.read_excel`/`pd.ExcelFile`. O corpo é lido em fatias de `chunk_size`
+        direto para o cache em disco ou para um SpooledTemporaryFile, sem montar
+        o arquivo inteiro em `bytes`. Quem chama fecha o arquivo.
+        `revalidate=False` devolve o que estiver em cache sem ir à rede.
+        """
+        return self.open_download_with_etag(path, revalidate=revalidate, chunk_size=chunk_size)[0]
+
+    def open_download_with_etag(self, path: str, revalidate: bool = True,
+                                chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+        """Como `open_download`, mas retorna (arquivo, eTag) da MESMA versão."""
+        key = self._cache_key(path)
+        cached = self._cache_get(key)
+        if cached and not revalidate:
+            return self._cache_open(cached), cached["eTag"]
+
+        headers = self._headers()
+        if cached:
+            headers["If-None-Match"] = cached["eTag"]
+        with self._http.get(f"{self._item_url(path)}:/content", headers=headers,
+                            timeout=self._timeout(180), stream=True) as r:
+            if r.status_code == 304 and cached:
+                return self._cache_open(cached), cached["eTag"]
+            if r.status_code == 404:
+                self._cache_drop(key)
+                raise FileNotFoundError(path)
+            r.raise_for_status()
+            spool = tempfile.SpooledTemporaryFile(max_size=chunk_size)
+            for block in r.iter_content(chunk_size):
+                spool.write(block)
+            etag = r.headers.get("ETag")
+
+        # o redirect de download costuma trazer o ETag; se não vier, pergunta aos metadados
+        ctag = None
+        if not etag:
+            try:
+                meta = self.get_metadata(path)
+                etag, ctag = meta.get("eTag"), meta.get("cTag")
+            except Exception:
+                etag = None
+        self._cache_put(key, etag, ctag, spool=spool)
+        spool.seek(0)
+        return spool, etag
+
+    def download(self, path: str) -> bytes:
+        with self.open_download(path) as f:
+            return f.read()
+
+    def download_with_etag(self, path: str, revalidate: bool = True):
+        """
+        Retorna (bytes, eTag) da versão atual.
+        Com `revalidate=False` devolve direto o que estiver em cache (sem rede), se houver.
+        """
+        f, etag = self.open_download_with_etag(path, revalidate=revalidate)
+        with f:
+            return f.read(), etag
+
+    def upload_small(self, path: str, content: bytes, overwrite: bool = True, if_match: str = None):
+        """
+        PUT simples do conteúdo.
+        `if_match`: eTag da versão em que a edição foi baseada; se o arquivo mudou
+        desde então o Graph responde 412 e levantamos `PreconditionFailed`.
+        """
         params = {"@microsoft.graph.conflictBehavior": "replace" if overwrite else "fail"}
-        if self.is_onedrive:
-            url = f"{GRAPH}/users/{self.user_upn}/drive/root:/{rel}:/content"
-        else:
-            url = f"{GRAPH}/drives/{self._drive_id()}/root:/{rel}:/content"
-        r = requests.put(url, headers=self._headers(), params=params, data=content, timeout=300)
+        url = f"{self._item_url(path)}:/content"
+        headers = self._headers()
+        if if_match:
+            headers["If-Match"] = if_match
+        r = self._http.put(url, headers=headers, params=params, data=content, timeout=self._timeout(300))
+        if r.status_code == 412:
+            raise PreconditionFailed(f"{path} foi alterado por outra sessão (eTag {if_match} desatualizado)")
         r.raise_for_status()
-        return r.json()
+        item = r.json()
+        # o que acabamos de enviar é a versão atual: próximo download vira 304
+        self._cache_put(self._cache_key(path), item.get("eTag"), item.get("cTag"), content)
+        return item
+
+    def upload(self, path: str, content, overwrite: bool = True, if_match: str = None,
+               chunk_size: int = UPLOAD_CHUNK_SIZE):
+        """PUT simples para bytes pequenos; sessão de upload para o resto (arquivos, streams, > 4 MiB)."""
+        if isinstance(content, (bytes, bytearray)) and len(content) <= SIMPLE_UPLOAD_MAX:
+            return self.upload_small(path, bytes(content), overwrite=overwrite, if_match=if_match)
+        return self.upload_large(path, content, overwrite=overwrite, if_match=if_match,
+                                 chunk_size=chunk_size)
+
+    def upload_large(self, path: str, source, overwrite: bool = True, if_match: str = None,
+                     chunk_size: int = UPLOAD_CHUNK_SIZE, max_resumes: int = 5):
+        """
+        Upload em fatias via `createUploadSession`.
+        `source`: bytes, caminho de arquivo, objeto arquivo (binário) ou iterador de bytes.
+        Falhas de rede/5xx no meio do envio retomam da faixa que o Graph diz esperar
+        (`nextExpectedRanges`), sem reenviar o que já foi confirmado.
+        """
+        chunk_size = max(UPLOAD_CHUNK_ALIGN, chunk_size - chunk_size % UPLOAD_CHUNK_ALIGN)
+        f, size, owned = self._open_upload_source(source, chunk_size)
+        try:
+            if size == 0:
+                # sessão de upload não aceita arquivo vazio
+                return self.upload_small(path, b"", overwrite=overwrite, if_match=if_match)
+
+            upload_url = self._create_upload_session(path, overwrite, if_match)
+            offset, failures, item = 0, 0, None
+            while item is None:
+                f.seek(offset)
+                chunk = f.read(min(chunk_size, size - offset))
+                end = offset + len(chunk) - 1
+                try:
+                    # uploadUrl já é pré-autenticada: não enviar Authorization
+                    r = self._http.put(upload_url, data=chunk, timeout=self._timeout(300), headers={
+                        "Content-Length": str(len(chunk)),
+                        "Content-Range": f"bytes {offset}-{end}/{size}",
+                    })
+                except requests.RequestException:
+                    r = None
+                if r is not None and r.status_code in (200, 201):
+                    item = r.json()
+                elif r is not None and r.status_code == 202:
+                    offset = self._next_expected_offset(r.json(), end + 1)
+                    failures = 0
+                elif r is None or r.status_code == 416 or r.status_code >= 500:
+                    failures += 1
+                    if failures > max_resumes:
+                        self._cancel_upload_session(upload_url)
+                        raise RuntimeError(f"Upload de {path} interrompido após {max_resumes} retomadas")
+                    # o backoff já foi feito pela Session; aqui só retoma da faixa confirmada
+                    offset = self._upload_session_offset(upload_url)
+                else:
+                    self._cancel_upload_session(upload_url)
+                    r.raise_for_status()
+                    raise RuntimeError(f"Resposta inesperada do upload ({r.status_code})")
+
+            # o que acabamos de enviar é a versão atual: próximo download vira 304
+            key = self._cache_key(path)
+            if isinstance(source, (bytes, bytearray)):
+                self._cache_put(key, item.get("eTag"), item.get("cTag"), bytes(source))
+            else:
+                self._cache_put(key, item.get("eTag"), item.get("cTag"), spool=f)
+            return item
+        finally:
+            if owned:
+                f.close()
+
+    @staticmethod
+    def _open_upload_source(source, chunk_size: int):
+        """-> (arquivo binário com seek, tamanho total, se foi aberto aqui e deve ser fechado)."""
+        if isinstance(source, (bytes, bytearray)):
+            return io.BytesIO(source), len(source), True
+        if isinstance(source, (str, os.PathLike)):
+            return open(source, "rb"), os.path.getsize(source), True
+        if hasattr(source, "read") and hasattr(source, "seek") and \
+                (not hasattr(source, "seekable") or source.seekable()):
+            start = source.tell()
+            size = source.seek(0, io.SEEK_END) - start
+            # reposiciona a origem para que offset 0 seja o ponto atual do arquivo
+            if start:
+                spooled = tempfile.SpooledTemporaryFile(max_size=chunk_size)
+                source.seek(start)
+                for block in iter(lambda: source.read(chunk_size), b""):
+                    spooled.write(block)
+                return spooled, size, True
+            return source, size, False
+        # iterador / stream sem seek: despeja num temporário (memória limitada a uma fatia)
+        blocks = iter(lambda: source.read(chunk_size), b"") if hasattr(source, "read") else source
+        spooled = tempfile.SpooledTemporaryFile(max_size=chunk_size)
+        size = 0
+        for block in blocks:
+            spooled.write(block)
+            size += len(block)
+        return spooled, size, True
+
+    def _create_upload_session(self, path: str, overwrite: bool, if_match: str = None) -> str:
+        headers = self._headers()
+        if if_match:
+            headers["If-Match"] = if_match
+        body = {"item": {"@microsoft.graph.conflictBehavior": "replace" if overwrite else "fail"}}
+        r = self._http.post(f"{self._item_url(path)}:/createUploadSession",
+                            headers=headers, json=body, timeout=self._timeout(30))
+        if r.status_code == 412:
+            raise PreconditionFailed(f"{path} foi alterado por outra sessão (eTag {if_match} desatualizado)")
+        r.raise_for_status()
+        return r.json()["uploadUrl"]
+
+    @staticmethod
+    def _next_expected_offset(payload: dict, default: int) -> int:
+        ranges = payload.get("nextExpectedRanges") or []
+        if not ranges:
+            return default
+        return int(str(ranges[0]).split("-")[0])
+
+    def _upload_session_offset(self, upload_url: str) -> int:
+        """Pergunta à sessão de upload a partir de qual byte continuar."""
+        r = self._http.get(upload_url, timeout=self._timeout(30))
+        if r.status_code == 404:
+            raise RuntimeError("Sessão de upload expirou; reenvie o arquivo.")
+        r.raise_for_status()
+        return self._next_expected_offset(r.json(), 0)
+
+    def _cancel_upload_session(self, upload_url: str):
+        try:
+            self._http.delete(upload_url, timeout=self._timeout(30))
+        except requests.RequestException:
+            pass
 
     # -------- Conveniências DataFrame --------
     def read_excel(self, path: str, **kw) -> pd.DataFrame:
-        return pd.read_excel(io.BytesIO(self.download(path)), **kw)
+        with self.open_download(path) as f:
+            return pd.read_excel(f, **kw)
 
     def read_csv(self, path: str, **kw) -> pd.DataFrame:
-        return pd.read_csv(io.BytesIO(self.download(path)), **kw)
+        with self.open_download(path) as f:
+            return pd.read_csv(f, **kw)
 
     def write_excel(self, df: pd.DataFrame, path: str, overwrite: bool = True):
         bio = io.BytesIO()
         df.to_excel(bio, index=False)
-        return self.upload_small(path, bio.getvalue(), overwrite=overwrite)
+        return self.upload(path, bio.getvalue(), overwrite=overwrite)
@@ -0,0 +1,30 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_graph import FakeGraph, HOSTNAME, SITE_PATH, LIBRARY  # noqa: E402
+from sp_connector import SPConnector  # noqa: E402
+
+
+def with_token(conn):
+    """Token fixo: os testes nunca vão ao login.microsoftonline.com."""
+    conn._set_token("token-de-teste", time.time() + 3600)
+    return conn
+
+
+@pytest.fixture
+def fake():
+    with FakeGraph() as server:
+        yield server
+
+
+@pytest.fixture
+def sp(fake):
+    # sem retry com espera: falhas injetadas voltam direto para o código testado
+    return with_token(SPConnector("tenant", "client", "secret", hostname=HOSTNAME, site_path=SITE_PATH,
+                                  library_name=LIBRARY, graph_url=fake.url, retries=0))
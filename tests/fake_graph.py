@@ -0,0 +1,422 @@
+"""
+Servidor local que imita o pedaço do Microsoft Graph usado pelos conectores:
+descoberta de site/biblioteca, `$batch`, metadados/conteúdo de itens (eTag,
+If-None-Match, If-Match), listagem de pasta, sessões de upload em fatias
+(`createUploadSession`, PUT com Content-Range, `nextExpectedRanges`) e a API de workbook (`createSession`,
+`usedRange`, `range` GET/PATCH/delete, `tables`/`rows/add`) sobre .xlsx de verdade
+(openpyxl). Cada gravação no workbook troca o eTag do item, como no SharePoint.
+
+    with FakeGraph() as fake:
+        fake.put_file("Pasta/arquivo.xlsx", conteudo)
+        sp = SPConnector(..., graph_url=fake.url)
+
+Injeção de falhas: `fake.fail("PATCH", "range(", status=500, times=1)`;
+`fake.before_request` (callable(method, path)) roda antes de cada requisição
+(p.ex. para simular outra instância gravando no meio).
+"""
+import io
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import openpyxl
+from openpyxl.utils import column_index_from_string
+
+HOSTNAME = "contoso.sharepoint.com"
+SITE_PATH = "sites/arquivo"
+LIBRARY = "Documentos"
+SITE_ID = "site-1"
+DRIVE_ID = "drive-1"
+
+_ADDRESS_RE = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+
+class _Reply(Exception):
+    def __init__(self, status: int, body=None, headers=None):
+        super().__init__(status)
+        self.status, self.body, self.headers = status, body, headers or {}
+
+
+def _parse_address(address: str):
+    """'A1:C3' / 'B5' / '5:5' -> (linha1, col1, linha2, col2) 1-based; col None = linha inteira."""
+    m = _ADDRESS_RE.match(address.replace("$", "").upper())
+    if not m:
+        raise _Reply(400, {"error": {"code": "InvalidArgument", "message": address}})
+    c1, r1, c2, r2 = m.groups()
+    c2 = c1 if c2 is None else c2
+    r2 = r1 if r2 is None else r2
+    col1 = column_index_from_string(c1) if c1 else None
+    col2 = column_index_from_string(c2) if c2 else None
+    return int(r1), col1, int(r2), col2
+
+
+class FakeGraph:
+    def __init__(self):
+        self.files = {}                         # caminho -> {"content", "etag", "version"}
+        self.tables = {}                        # (caminho, aba) -> id da tabela
+        self.sessions = {}                      # id -> {"path", "persist", "closed"}
+        self.uploads = {}                       # id -> {"path", "received"} (sessões de upload abertas)
+        self.requests = []                      # (método, caminho, status, headers da requisição)
+        self.before_request = None
+        self.delay = 0.0                        # atraso artificial por requisição (s)
+        self.page_size = 200                    # itens por página na listagem de pasta
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._faults = []                       # [método, trecho, status, vezes, headers]
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+
+    # -------- Ciclo de vida --------
+    def start(self):
+        fake = self
+
+        class Handler(_Handler):
+            graph = fake
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1.0"
+
+    # -------- Arquivos --------
+    def put_file(self, path: str, content: bytes) -> str:
+        with self._lock:
+            entry = self.files.get(path)
+            version = entry["version"] + 1 if entry else 1
+            etag = f'"{{{uuid.uuid4()}}},{version}"'
+            self.files[path] = {"content": bytes(content), "etag": etag, "version": version}
+            return etag
+
+    def put_workbook(self, path: str, sheets: dict) -> str:
+        """`sheets` = {aba: [[cabeçalho...], [linha...], ...]}."""
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        for name, rows in sheets.items():
+            ws = wb.create_sheet(name)
+            for row in rows:
+                ws.append(list(row))
+        bio = io.BytesIO()
+        wb.save(bio)
+        return self.put_file(path, bio.getvalue())
+
+    def content(self, path: str) -> bytes:
+        return self.files[path]["content"]
+
+    def etag(self, path: str) -> str:
+        return self.files[path]["etag"]
+
+    def sheet_values(self, path: str, sheet: str) -> list:
+        """Linhas da aba como listas (None para vazio)."""
+        ws = openpyxl.load_workbook(io.BytesIO(self.content(path)))[sheet]
+        return [list(r) for r in ws.iter_rows(values_only=True)]
+
+    # -------- Falhas --------
+    def fail(self, method: str, fragment: str, status: int = 500, times: int = 1, headers=None):
+        """As próximas `times` requisições `method` cujo caminho contém `fragment` respondem `status`."""
+        with self._lock:
+            self._faults.append([method.upper(), fragment, status, times, headers or {}])
+
+    def _injected(self, method: str, path: str):
+        with self._lock:
+            for fault in self._faults:
+                if fault[0] == method and fault[1] in path and fault[3] > 0:
+                    fault[3] -= 1
+                    return fault[2], fault[4]
+        return None
+
+    def count(self, method: str, fragment: str = "", status: int | None = None) -> int:
+        return sum(1 for m, p, s, _ in self.requests
+                   if m == method and fragment in p and (status is None or s == status))
+
+    # -------- Despacho --------
+    def handle(self, method: str, raw_path: str, headers: dict, body: bytes):
+        """-> (status, headers, corpo: bytes | dict | None)."""
+        split = urlsplit(raw_path)
+        path = unquote(split.path)
+        query = parse_qs(split.query)
+        try:
+            if self.before_request is not None:
+                self.before_request(method, path)
+            injected = self._injected(method, path)
+            if injected:
+                raise _Reply(injected[0], {"error": {"code": "Injected", "message": path}}, injected[1])
+            return self._route(method, path, query, headers, body)
+        except _Reply as r:
+            return r.status, r.headers, r.body
+
+    def _route(self, method, path, query, headers, body):
+        if not path.startswith("/v1.0/"):
+            raise _Reply(404)
+        path = path[len("/v1.0"):]
+        if path.startswith("/upload/"):
+            return self._upload_session(method, path[len("/upload/"):], headers, body)
+        if path == "/$batch" and method == "POST":
+            return 200, {}, self._batch(json.loads(body or b"{}"))
+        if path == f"/sites/{HOSTNAME}:/{SITE_PATH}":
+            return 200, {}, {"id": SITE_ID}
+        if path in (f"/sites/{HOSTNAME}:/{SITE_PATH}:/drives", f"/sites/{SITE_ID}/drives"):
+            return 200, {}, {"value": [{"id": DRIVE_ID, "name": LIBRARY, "driveType": "documentLibrary"}]}
+        prefix = f"/drives/{DRIVE_ID}/root:/"
+        if not path.startswith(prefix):
+            raise _Reply(404, {"error": {"code": "itemNotFound", "message": path}})
+        item, _, action = path[len(prefix):].partition(":/")
+        if not action:
+            return self._metadata(item)
+        if action == "content":
+            return self._content(method, item, query, headers, body)
+        if action == "children":
+            return self._children(item, query)
+        if action == "createUploadSession" and method == "POST":
+            return self._create_upload(item, headers, json.loads(body or b"{}"))
+        if action.startswith("workbook"):
+            return self._workbook(method, item, action[len("workbook"):], query, headers, body)
+        raise _Reply(400, {"error": {"code": "invalidRequest", "message": action}})
+
+    def _batch(self, payload: dict) -> dict:
+        responses = []
+        for sub in payload.get("requests", []):
+            body = json.dumps(sub["body"]).encode() if sub.get("body") is not None else b""
+            status, headers, out = self.handle(sub.get("method", "GET"), f"/v1.0{sub['url']}",
+                                               sub.get("headers") or {}, body)
+            if isinstance(out, (bytes, bytearray)):
+                out = None
+            responses.append({"id": sub["id"], "status": status, "headers": headers, "body": out})
+        return {"responses": responses}
+
+    # -------- Itens --------
+    def _item(self, path: str) -> dict:
+        entry = self.files.get(path)
+        return {"id": path, "name": path.rsplit("/", 1)[-1], "eTag": entry["etag"],
+                "cTag": entry["etag"].replace("{", "c:{"), "size": len(entry["content"])}
+
+    def _metadata(self, path: str):
+        with self._lock:
+            if path not in self.files:
+                raise _Reply(404, {"error": {"code": "itemNotFound", "message": path}})
+            return 200, {}, self._item(path)
+
+    def _children(self, folder: str, query: dict):
+        with self._lock:
+            base = folder.rstrip("/") + "/"
+            under = [p[len(base):] for p in self.files if p.startswith(base)]
+            if not under:
+                raise _Reply(404, {"error": {"code": "itemNotFound", "message": folder}})
+            items = [self._item(base + r) for r in under if "/" not in r]
+            sub = sorted({r.split("/", 1)[0] for r in under if "/" in r})
+            items += [{"id": base + d, "name": d, "folder": {"childCount": sum(r.startswith(d + "/") for r in under)}}
+                      for d in sub]
+            items.sort(key=lambda it: it["name"])
+            # paginação como a do Graph (@odata.nextLink)
+            skip = int(query.get("$skiptoken", ["0"])[0])
+            body = {"value": items[skip:skip + self.page_size]}
+            if skip + self.page_size < len(items):
+                body["@odata.nextLink"] = (f"{self.url}/drives/{DRIVE_ID}/root:/{folder}:/children"
+                                           f"?$skiptoken={skip + self.page_size}")
+            return 200, {}, body
+
+    def _content(self, method: str, path: str, query: dict, headers: dict, body: bytes):
+        with self._lock:
+            entry = self.files.get(path)
+            if method == "GET":
+                if entry is None:
+                    raise _Reply(404, {"error": {"code": "itemNotFound", "message": path}})
+                if headers.get("if-none-match") == entry["etag"]:
+                    return 304, {"ETag": entry["etag"]}, None
+                return 200, {"ETag": entry["etag"]}, entry["content"]
+            if method == "PUT":
+                if_match = headers.get("if-match")
+                if if_match and (entry is None or entry["etag"] != if_match):
+                    raise _Reply(412, {"error": {"code": "preconditionFailed", "message": path}})
+                if entry is not None and query.get("@microsoft.graph.conflictBehavior") == ["fail"]:
+                    raise _Reply(409, {"error": {"code": "nameAlreadyExists", "message": path}})
+                self.put_file(path, body)
+                return 200, {}, self._item(path)
+        raise _Reply(405)
+
+    # -------- Sessões de upload --------
+    def _create_upload(self, path: str, headers: dict, payload: dict):
+        with self._lock:
+            entry = self.files.get(path)
+            if_match = headers.get("if-match")
+            if if_match and (entry is None or entry["etag"] != if_match):
+                raise _Reply(412, {"error": {"code": "preconditionFailed", "message": path}})
+            conflict = (payload.get("item") or {}).get("@microsoft.graph.conflictBehavior")
+            if entry is not None and conflict == "fail":
+                raise _Reply(409, {"error": {"code": "nameAlreadyExists", "message": path}})
+            uid = uuid.uuid4().hex
+            self.uploads[uid] = {"path": path, "received": bytearray()}
+            # como no Graph, a URL é pré-autenticada e fica fora de /drives
+            return 200, {}, {"uploadUrl": f"{self.url}/upload/{uid}"}
+
+    def _upload_session(self, method: str, uid: str, headers: dict, body: bytes):
+        with self._lock:
+            upload = self.uploads.get(uid)
+            if upload is None:
+                raise _Reply(404, {"error": {"code": "itemNotFound", "message": uid}})
+            received = upload["received"]
+            if method == "DELETE":
+                del self.uploads[uid]
+                return 204, {}, None
+            if method == "GET":
+                return 200, {}, {"nextExpectedRanges": [f"{len(received)}-"]}
+            if method != "PUT":
+                raise _Reply(405)
+            m = re.match(r"^bytes (\d+)-(\d+)/(\d+)$", headers.get("content-range", ""))
+            if not m:
+                raise _Reply(400, {"error": {"code": "invalidRange", "message": "Content-Range"}})
+            start, end, total = (int(g) for g in m.groups())
+            if start != len(received) or end - start + 1 != len(body):
+                raise _Reply(416, {"error": {"code": "invalidRange", "message": f"{start}-{end}"},
+                                   "nextExpectedRanges": [f"{len(received)}-"]})
+            received += body
+            if len(received) < total:
+                return 202, {}, {"nextExpectedRanges": [f"{len(received)}-{total - 1}"]}
+            del self.uploads[uid]
+            self.put_file(upload["path"], bytes(received))
+            return 201, {}, self._item(upload["path"])
+
+    # -------- Workbook --------
+    def _load(self, path: str):
+        entry = self.files.get(path)
+        if entry is None:
+            raise _Reply(404, {"error": {"code": "itemNotFound", "message": path}})
+        return openpyxl.load_workbook(io.BytesIO(entry["content"]))
+
+    def _save(self, path: str, wb):
+        bio = io.BytesIO()
+        wb.save(bio)
+        self.put_file(path, bio.getvalue())
+
+    def _worksheet(self, wb, name: str):
+        if name not in wb.sheetnames:
+            raise _Reply(404, {"error": {"code": "ItemNotFound", "message": f"worksheet {name}"}})
+        return wb[name]
+
+    def _workbook(self, method, path, action, query, headers, body):
+        with self._lock:
+            payload = json.loads(body) if body else {}
+            if action == "/createSession" and method == "POST":
+                self._load(path)
+                sid = str(uuid.uuid4())
+                self.sessions[sid] = {"path": path, "persist": bool(payload.get("persistChanges")),
+                                      "closed": False}
+                return 201, {}, {"id": sid, "persistChanges": self.sessions[sid]["persist"]}
+            if action == "/closeSession" and method == "POST":
+                sid = headers.get("workbook-session-id")
+                if sid in self.sessions:
+                    self.sessions[sid]["closed"] = True
+                return 204, {}, None
+            wb = self._load(path)
+            m = re.match(r"^/tables/([^/]+)/rows/add$", action)
+            if m and method == "POST":
+                sheet = next((s for (p, s), t in self.tables.items() if p == path and t == m.group(1)), None)
+                if sheet is None:
+                    raise _Reply(404, {"error": {"code": "ItemNotFound", "message": m.group(1)}})
+                ws = self._worksheet(wb, sheet)
+                for row in payload.get("values", []):
+                    ws.append([None if v == "" else v for v in row])
+                self._save(path, wb)
+                return 201, {}, {"index": ws.max_row - 2}
+            m = re.match(r"^/worksheets\('((?:[^']|'')*)'\)(.*)$", action)
+            if not m:
+                raise _Reply(400, {"error": {"code": "invalidRequest", "message": action}})
+            ws = self._worksheet(wb, m.group(1).replace("''", "'"))
+            rest = m.group(2)
+            if rest.startswith("/usedRange") and method == "GET":
+                return 200, {}, {"rowIndex": 0, "rowCount": ws.max_row, "columnIndex": 0,
+                                 "columnCount": ws.max_column}
+            if rest == "/tables" and method == "GET":
+                tid = self.tables.get((path, ws.title))
+                return 200, {}, {"value": [{"id": tid}] if tid else []}
+            m = re.match(r"^/range\(address='([^']*)'\)(/delete)?$", rest)
+            if not m:
+                raise _Reply(400, {"error": {"code": "invalidRequest", "message": rest}})
+            r1, c1, r2, c2 = _parse_address(m.group(1))
+            if m.group(2):
+                if method != "POST" or c1 is not None or payload.get("shift") != "Up":
+                    raise _Reply(400, {"error": {"code": "invalidRequest", "message": "delete"}})
+                ws.delete_rows(r1, r2 - r1 + 1)
+                self._save(path, wb)
+                return 204, {}, None
+            if c1 is None:
+                c1, c2 = 1, max(ws.max_column, 1)
+            if method == "GET":
+                values = [["" if ws.cell(r, c).value is None else ws.cell(r, c).value
+                           for c in range(c1, c2 + 1)] for r in range(r1, r2 + 1)]
+                return 200, {}, {"address": m.group(1), "values": values}
+            if method == "PATCH":
+                values = payload.get("values") or []
+                if len(values) != r2 - r1 + 1 or any(len(v) != c2 - c1 + 1 for v in values):
+                    raise _Reply(400, {"error": {"code": "InvalidArgument", "message": "dimensões"}})
+                for i, row in enumerate(values):
+                    for j, v in enumerate(row):
+                        if v is not None:
+                            ws.cell(r1 + i, c1 + j).value = None if v == "" else v
+                self._save(path, wb)
+                return 200, {}, {"address": m.group(1)}
+            raise _Reply(405)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    graph = None
+
+    def log_message(self, *args):
+        pass
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        fake = self.graph
+        with fake._lock:
+            fake.in_flight += 1
+            fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+        try:
+            if fake.delay:
+                time.sleep(fake.delay)
+            status, out_headers, out = fake.handle(self.command, self.path, headers, body)
+        finally:
+            with fake._lock:
+                fake.in_flight -= 1
+        with fake._lock:
+            fake.requests.append((self.command, unquote(urlsplit(self.path).path), status, headers))
+        if isinstance(out, (dict, list)):
+            data, ctype = json.dumps(out).encode(), "application/json"
+        else:
+            data, ctype = (out or b""), "application/octet-stream"
+        if status == 304:
+            data = b""
+        self.send_response(status)
+        for k, v in (out_headers or {}).items():
+            self.send_header(k, str(v))
+        if data:
+            self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    do_GET = do_PUT = do_POST = do_PATCH = do_DELETE = _serve
@@ -0,0 +1,155 @@
+"""Aba Editar de ponta a ponta (streamlit AppTest) contra o Graph local simulado."""
+import json
+import os
+import time
+
+import pandas as pd
+import pytest
+import streamlit as st
+import streamlit.testing.v1.element_tree as element_tree
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.testing.v1 import AppTest
+
+import async_sp_connector
+import sp_connector
+from history_store import IMPORT_TAG
+from fake_graph import HOSTNAME, SITE_PATH, LIBRARY
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PATH = "Pasta/arquivo.xlsx"
+HEADER = ["ID", "Status", "Local", "Estante", "Prateleira", "Caixa", "Conteúdo da Caixa",
+          "Tipo de Documento", "Departamento Origem", "Data Arquivamento"]
+
+
+@pytest.fixture
+def app(fake, monkeypatch, tmp_path):
+    """-> função(n_linhas, diario) que sobe o app com um workbook de `n_linhas` caixas."""
+    init = sp_connector.SPConnectorBase.__init__
+
+    def _init(self, *a, **kw):
+        init(self, *a, **{**kw, "graph_url": fake.url, "refresh_in_background": False})
+        self._set_token("token-de-teste", time.time() + 3600)
+
+    monkeypatch.setattr(sp_connector.SPConnectorBase, "__init__", _init)
+
+    # AppTest não edita st.data_editor: o estado do widget é montado como o front-end faria
+    get_state = element_tree.get_widget_state
+
+    def _get_state(node):
+        if isinstance(node, element_tree.Dataframe) and getattr(node, "edits", None) is not None:
+            ws = WidgetState(id=node.proto.id)
+            ws.string_value = json.dumps({"edited_rows": node.edits, "added_rows": [], "deleted_rows": []})
+            return ws
+        return get_state(node)
+
+    monkeypatch.setattr(element_tree, "get_widget_state", _get_state)
+    # caches de recurso são do processo: nada de conector/diário de outro teste
+    monkeypatch.setattr(async_sp_connector, "_shared", {})
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+    def _start(n_linhas=3, diario=False):
+        fake.put_workbook(PATH, {
+            "Arquivos": [HEADER] + [[f"AB{i:02d}A", "ARQUIVADO", "ARQUIVO 1", 1, 1, i, f"conteudo {i}",
+                                     "Contrato", "TI", "10/01/2024"] for i in range(1, n_linhas + 1)],
+            "Espaços": [["Arquivo", "Estantes", "Prateleiras"], ["1", 2, 3]],
+            "Selectboxes": [["RESPONSÁVEL ARQUIVAMENTO", "Departamentos", "Tipos de Documento"],
+                            ["ana", "TI", "Contrato"]],
+            "Retenção": [["ORIGEM DOCUMENTO SUBMISSÃO"], ["TI"]],
+            "Histórico": [["ID", "Evento", "Responsável", "Data", "Observação"],
+                          ["AB01A", "ARQUIVADO", "ana", "09/01/2024", ""]],
+        })
+        at = AppTest.from_file(APP, default_timeout=60)
+        at.secrets["graph"] = {"tenant_id": "t", "client_id": "c", "client_secret": "s",
+                               "hostname": HOSTNAME, "site_path": SITE_PATH, "library_name": LIBRARY}
+        at.secrets["files"] = {"arquivo": PATH, "mirror_path": "off",
+                               "journal_path": str(tmp_path / "diario.jsonl") if diario else "off"}
+        at.run()
+        at.sidebar.selectbox[0].select("Editar").run()
+        return at
+
+    yield _start
+    st.cache_resource.clear()
+
+
+def salvar(at, prefixo, edicoes, esperado="1 registro(s) atualizado(s)."):
+    editor = at.main.get("arrow_data_frame")[0]
+    editor.edits = edicoes
+    at.selectbox(key=f"{prefixo}_responsavel").select("ana")
+    next(b for b in at.button if b.label == "Salvar alterações").click().run()
+    assert not at.exception, at.exception
+    if esperado:
+        assert esperado in [m.value for m in [*at.success, *at.info]]
+
+
+def anexos(fake):
+    """Conteúdo dos anexos de histórico gravados pelo app (sem a importação da aba antiga)."""
+    return [f["content"] for p, f in sorted(fake.files.items())
+            if p.startswith("Pasta/historico/") and p.endswith(".csv") and IMPORT_TAG not in p]
+
+
+def enviada(fake, id_val, coluna, valor, timeout=10):
+    """Linha `id_val` no SharePoint assim que `coluna` valer `valor` (o diário envia em segundo plano)."""
+    i = HEADER.index(coluna)
+    fim = time.time() + timeout
+    while True:
+        row = next(r for r in fake.sheet_values(PATH, "Arquivos") if r[0] == id_val)
+        if row[i] == valor or time.time() > fim:
+            return row
+        time.sleep(0.1)
+
+
+def test_search_edit_and_save(fake, app):
+    at = app()
+    at.text_input(key="editar_busca_id").input("AB0").run()
+    assert not at.exception, at.exception
+    assert list(at.main.get("arrow_data_frame")[0].value["ID"]) == ["AB01A", "AB02A", "AB03A"]
+
+    salvar(at, "editar_por_id", {"1": {"Status": "Conferido", "Conteúdo da Caixa": "novo conteúdo"}})
+    assert enviada(fake, "AB02A", "Status", "Conferido")[1:7] == ["Conferido", "ARQUIVO 1", 1, 1, 2, "novo conteúdo"]
+    assert [c.decode("utf-8-sig").count("EDIÇÃO,AB02A") for c in anexos(fake)] == [1]
+
+
+def test_history_is_written_only_for_a_confirmed_change(fake, app):
+    at = app()
+    at.text_input(key="editar_busca_id").input("AB01").run()
+    # nada mudou: nem envio, nem histórico
+    salvar(at, "editar_por_id", {"0": {"Status": "ARQUIVADO"}}, esperado="Nenhuma alteração detectada.")
+    # envio do arquivo falha: o histórico não é gravado
+    fake.fail("PUT", PATH, status=500)
+    salvar(at, "editar_por_id", {"0": {"Status": "Conferido"}}, esperado=None)
+    assert any("Erro ao salvar" in e.value for e in at.error)
+    assert anexos(fake) == []
+    assert fake.sheet_values(PATH, "Arquivos")[1][1] == "ARQUIVADO"
+
+
+def test_edit_on_second_page_hits_the_right_row(fake, app):
+    at = app(n_linhas=60, diario=True)
+    at.text_input(key="editar_busca_id").input("AB").run()
+    at.selectbox(key="editar_por_id_paginas_tamanho").select(25).run()
+    at.button(key="editar_por_id_paginas_proxima").click().run()
+    assert [c.value for c in at.caption if "registro" in c.value] == ["26–50 de 60 registro(s) · página 2 de 3"]
+    assert at.main.get("arrow_data_frame")[0].value["ID"].iloc[2] == "AB28A"
+
+    salvar(at, "editar_por_id", {"2": {"Conteúdo da Caixa": "editado na página 2"}})
+    assert enviada(fake, "AB28A", "Conteúdo da Caixa", "editado na página 2")[6] == "editado na página 2"
+    assert [r[6] for r in fake.sheet_values(PATH, "Arquivos")].count("editado na página 2") == 1
+
+    # o histórico vai depois do arquivo, pela mesma entrada do diário
+    fim = time.time() + 10
+    while not anexos(fake) and time.time() < fim:
+        time.sleep(0.1)
+    assert [c.decode("utf-8-sig").count("AB28A") for c in anexos(fake)] == [1]
+    ordem = [p for m, p, st_, _ in fake.requests if m == "PUT" and st_ == 200]
+    hist = next(p for p in ordem if "/historico/2" in p and IMPORT_TAG not in p)
+    assert ordem.index(hist) > ordem.index(next(p for p in ordem if PATH in p))
+
+    at.button(key="editar_por_id_paginas_proxima").click().run()
+    at.button(key="editar_por_id_paginas_anterior").click().run()
+    editor = at.main.get("arrow_data_frame")[0].value
+    assert editor.loc[editor["ID"] == "AB28A", "Conteúdo da Caixa"].tolist() == ["editado na página 2"]
+
+    at.sidebar.selectbox[0].select("Histórico").run()
+    assert not at.exception, at.exception
+    historico = pd.concat([d.value for d in at.main.get("arrow_data_frame")])
+    assert historico["ID"].tolist().count("AB28A") == 1
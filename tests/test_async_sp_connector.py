@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import async_sp_connector
+from async_sp_connector import AsyncSPConnector, BackgroundLoop, shared_connector
+from conftest import with_token
+from fake_graph import HOSTNAME, SITE_PATH, LIBRARY
+
+PATHS = [f"Pasta/historico/historico-2024-{m:02d}.csv" for m in range(1, 7)]
+
+
+def run(fake, fn, **kw):
+    """Roda `fn(conector)` num loop novo, com um conector ligado ao Graph local."""
+    async def _main():
+        async with with_token(AsyncSPConnector("tenant", "client", "secret", hostname=HOSTNAME,
+                                               site_path=SITE_PATH, library_name=LIBRARY,
+                                               graph_url=fake.url, **kw)) as conn:
+            return await fn(conn)
+    return asyncio.run(_main())
+
+
+@pytest.fixture
+def files(fake):
+    for i, p in enumerate(PATHS):
+        fake.put_file(p, f"conteudo {i}".encode())
+    return PATHS
+
+
+def test_download_many_runs_in_parallel_up_to_the_limit(fake, files):
+    async def _baixar(conn):
+        await conn._drive_id()
+        fake.delay = 0.2
+        return await conn.download_many(files + ["Pasta/nao-existe.csv"])
+
+    got = run(fake, _baixar, max_concurrency=3)
+    assert [got[p] for p in files] == [f"conteudo {i}".encode() for i in range(len(files))]
+    assert isinstance(got["Pasta/nao-existe.csv"], FileNotFoundError)
+    assert fake.max_in_flight == 3
+
+
+def test_download_revalidates_with_if_none_match(fake, files):
+    async def _duas_vezes(conn):
+        primeira = await conn.download(files[0])
+        segunda = await conn.download(files[0])
+        fake.put_file(files[0], b"novo")
+        return primeira, segunda, await conn.download(files[0])
+
+    assert run(fake, _duas_vezes) == (b"conteudo 0", b"conteudo 0", b"novo")
+    assert fake.count("GET", files[0], status=304) == 1
+    assert fake.count("GET", files[0], status=200) == 2
+
+
+def test_retries_throttled_requests_then_gives_up(fake, files):
+    fake.fail("GET", files[1], status=503, times=2, headers={"Retry-After": "0"})
+    assert run(fake, lambda conn: conn.download(files[1]), retries=2) == b"conteudo 1"
+    assert fake.count("GET", files[1], status=503) == 2
+
+    fake.fail("GET", files[2], status=429, times=3, headers={"Retry-After": "0"})
+    with pytest.raises(Exception, match="429"):
+        run(fake, lambda conn: conn.download(files[2]), retries=2)
+
+
+def test_background_loop_runs_the_connector_from_sync_code(fake, files):
+    loop = BackgroundLoop()
+    try:
+        conn = with_token(loop.call(AsyncSPConnector, "tenant", "client", "secret", hostname=HOSTNAME,
+                                    site_path=SITE_PATH, library_name=LIBRARY, graph_url=fake.url))
+        got = loop.submit(conn.download_many(files[:2])).result(timeout=10)
+        assert got == {files[0]: b"conteudo 0", files[1]: b"conteudo 1"}
+        loop.submit(conn.aclose()).result(timeout=10)
+    finally:
+        loop.stop()
+
+
+def test_retry_after_is_capped():
+    class R:
+        headers = {"Retry-After": "3600"}
+    assert AsyncSPConnector._retry_delay(R(), 1) == async_sp_connector.RETRY_BACKOFF_MAX
+
+
+def test_shared_connector_is_reused_across_cache_clears(fake, files, monkeypatch):
+    monkeypatch.setattr(async_sp_connector, "_shared", {})
+    kw = dict(hostname=HOSTNAME, site_path=SITE_PATH, library_name=LIBRARY, graph_url=fake.url)
+    loop, conn = shared_connector("tenant", "client", "secret", **kw)
+    with_token(conn)
+    # o app chama de novo a cada execução do script (e depois de limpar o cache_resource)
+    assert shared_connector("tenant", "client", "secret", **kw) == (loop, conn)
+    assert loop.submit(conn.download(files[0])).result(timeout=10) == b"conteudo 0"
+    loop.submit(conn.aclose()).result(timeout=10)
+    loop.stop()
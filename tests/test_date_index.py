@@ -0,0 +1,43 @@
+from datetime import date, datetime
+
+import pandas as pd
+
+from date_index import DateIndex
+
+VALUES = ["10/01/2024 15:30", "2024-01-09", None, datetime(2024, 1, 10), "sem data", "11/01/2024"]
+
+
+def test_sorted_order_and_missing_dates():
+    ix = DateIndex(VALUES)
+    assert len(ix) == 6 and ix.missing == 2
+    assert ix.order().tolist() == [1, 3, 0, 5]
+    assert ix.order(newest_first=True).tolist() == [5, 0, 3, 1]
+    assert ix.min() == pd.Timestamp("2024-01-09") and ix.max() == pd.Timestamp("2024-01-11")
+
+
+def test_date_end_includes_the_whole_day():
+    ix = DateIndex(VALUES)
+    assert ix.between(date(2024, 1, 10), date(2024, 1, 10)).tolist() == [3, 0]
+    assert ix.count(date(2024, 1, 9), date(2024, 1, 10)) == 3
+
+
+def test_datetime_bounds_are_inclusive_to_the_instant():
+    ix = DateIndex(VALUES)
+    assert ix.between(datetime(2024, 1, 10), datetime(2024, 1, 10, 15, 30)).tolist() == [3, 0]
+    assert ix.between(datetime(2024, 1, 10, 0, 0, 1), datetime(2024, 1, 10, 15, 29)).tolist() == []
+
+
+def test_open_and_empty_ranges():
+    ix = DateIndex(VALUES)
+    assert ix.between(inicio=date(2024, 1, 11)).tolist() == [5]
+    assert ix.between(fim=date(2024, 1, 9)).tolist() == [1]
+    assert ix.between().tolist() == [1, 3, 0, 5]
+    assert ix.count(date(2024, 2, 1), date(2024, 1, 1)) == 0  # início depois do fim
+    assert ix.count(date(2023, 1, 1), date(2023, 12, 31)) == 0
+
+
+def test_timezone_aware_column_and_empty_index():
+    ix = DateIndex(pd.Series(pd.to_datetime(["2024-01-02 10:00"]).tz_localize("UTC")))
+    assert ix.count(date(2024, 1, 2), date(2024, 1, 2)) == 1
+    empty = DateIndex([])
+    assert empty.between(date(2024, 1, 1)).tolist() == [] and empty.min() is pd.NaT
@@ -0,0 +1,151 @@
+import pytest
+
+from graph_workbook import ExcelSession, PartialWrite, UnsupportedOp, WorkbookConflict, write_ops
+from sp_connector import PreconditionFailed
+
+PATH = "Pasta/arquivo.xlsx"
+HEADER = ["ID", "Status", "Local", "Caixa"]
+
+
+@pytest.fixture
+def workbook(fake):
+    fake.put_workbook(PATH, {
+        "Arquivos": [HEADER, ["A1", "ARQUIVADO", "ARQ 1", 1], ["A2", "ARQUIVADO", "ARQ 1", 2],
+                     ["A3", "ARQUIVADO", "ARQ 2", 3]],
+        "Espaços": [["Local", "Capacidade"], ["ARQ 1", 10]],
+    })
+    return PATH
+
+
+def upsert(*rows):
+    return {"op": "upsert", "sheet": "Arquivos", "key": "ID", "rows": list(rows)}
+
+
+def test_apply_patches_only_changed_cells_and_adds_new_rows(fake, sp, workbook):
+    ops = [upsert({"ID": "A2", "Status": "DESARQUIVADO"}, {"ID": "A4", "Status": "ARQUIVADO", "Local": "ARQ 3"}),
+           {"op": "delete", "sheet": "Arquivos", "key": "ID", "ids": ["A1"]},
+           {"op": "append", "sheet": "Espaços", "rows": [{"Local": "ARQ 2", "Capacidade": 5}]}]
+    with ExcelSession(sp, workbook) as xs:
+        etag = xs.apply(ops)
+
+    assert fake.sheet_values(workbook, "Arquivos") == [
+        HEADER, ["A2", "DESARQUIVADO", "ARQ 1", 2], ["A3", "ARQUIVADO", "ARQ 2", 3], ["A4", "ARQUIVADO", "ARQ 3", None]]
+    assert fake.sheet_values(workbook, "Espaços") == [["Local", "Capacidade"], ["ARQ 1", 10], ["ARQ 2", 5]]
+    assert etag == fake.etag(workbook)
+    # A2: só a célula de Status (faixa B3:B3), sem reenviar o arquivo
+    assert fake.count("PATCH", "range(address='B3:B3')") == 1
+    assert fake.count("PUT", ":/content") == 0
+    assert all(s["closed"] and s["persist"] for s in fake.sessions.values())
+
+
+def test_existing_only_upsert_skips_rows_deleted_meanwhile(fake, sp, workbook):
+    op = dict(upsert({"ID": "A2", "Status": "DESARQUIVADO"}, {"ID": "A9", "Status": "X"}), existing_only=True)
+    with ExcelSession(sp, workbook) as xs:
+        xs.apply([op])
+    assert [r[:2] for r in fake.sheet_values(workbook, "Arquivos")] == [
+        HEADER[:2], ["A1", "ARQUIVADO"], ["A2", "DESARQUIVADO"], ["A3", "ARQUIVADO"]]
+
+
+def test_append_uses_table_rows_add(fake, sp, workbook):
+    fake.tables[(workbook, "Espaços")] = "Tabela1"
+    with ExcelSession(sp, workbook) as xs:
+        xs.apply([{"op": "append", "sheet": "Espaços", "rows": [{"Local": "ARQ 3", "Capacidade": 7}]}])
+    assert fake.count("POST", "/tables/Tabela1/rows/add") == 1
+    assert fake.sheet_values(workbook, "Espaços")[-1] == ["ARQ 3", 7]
+
+
+@pytest.mark.parametrize("op", [
+    {"op": "replace", "sheet": "Arquivos", "columns": HEADER, "rows": []},
+    upsert({"ID": "A1", "Coluna Nova": "x"}),
+    {"op": "append", "sheet": "Aba Nova", "rows": [{"A": 1}]},
+])
+def test_check_rejects_before_touching_cells(fake, sp, workbook, op):
+    with ExcelSession(sp, workbook) as xs:
+        with pytest.raises(UnsupportedOp):
+            xs.check([upsert({"ID": "A1", "Status": "X"}), op])
+    assert fake.count("PATCH") == fake.count("POST", "/delete") == 0
+
+
+def test_write_ops_unsupported_falls_back_with_all_ops(fake, sp, workbook):
+    ops = [upsert({"ID": "A1", "Status": "X"}), {"op": "replace", "sheet": "Espaços", "columns": [], "rows": []}]
+    etag_antes = fake.etag(workbook)
+    assert write_ops(sp, workbook, ops) == (None, ops)
+    assert fake.etag(workbook) == etag_antes
+
+
+def test_write_ops_falls_back_when_session_cannot_be_created(fake, sp, workbook):
+    fake.fail("POST", "/createSession", status=404)
+    ops = [upsert({"ID": "A1", "Status": "X"})]
+    assert write_ops(sp, workbook, ops) == (None, ops)
+    assert fake.count("PATCH") == 0
+
+
+def test_write_ops_checks_etag_before_writing(fake, sp, workbook):
+    ops = [upsert({"ID": "A1", "Status": "X"})]
+    with ExcelSession(sp, workbook) as xs:
+        with pytest.raises(PreconditionFailed):
+            xs.apply(ops, if_match='"{outra-versao},1"')
+    assert write_ops(sp, workbook, ops, if_match='"{outra-versao},1"') == (None, ops)
+    assert fake.count("PATCH") == 0
+
+    etag, pendentes = write_ops(sp, workbook, ops, if_match=fake.etag(workbook))
+    assert pendentes == [] and etag == fake.etag(workbook)
+    assert fake.sheet_values(workbook, "Arquivos")[1][1] == "X"
+
+
+def test_mid_apply_failure_reports_what_is_left_and_drops_cache(fake, sp, workbook):
+    sp.download(workbook)
+    assert sp.cached_etag(workbook) is not None
+    ops = [upsert({"ID": "A1", "Status": "X"}), upsert({"ID": "A2", "Status": "Y"}), upsert({"ID": "A3", "Status": "Z"})]
+    fake.fail("PATCH", "range(address='B3:B3')", status=500)
+
+    with ExcelSession(sp, workbook) as xs:
+        with pytest.raises(PartialWrite) as exc:
+            xs.apply(ops)
+    assert exc.value.done == 1
+
+    fake.fail("PATCH", "range(address='B3:B3')", status=500)
+    assert write_ops(sp, workbook, ops) == (None, ops[1:])
+    assert sp.cached_etag(workbook) is None
+    # o que foi gravado antes da falha fica; o resto fica para o envio do arquivo inteiro
+    assert [r[1] for r in fake.sheet_values(workbook, "Arquivos")[1:]] == ["X", "ARQUIVADO", "ARQUIVADO"]
+
+
+def test_concurrent_upload_during_apply_is_detected(fake, sp, workbook):
+    def outra_instancia(method, path):
+        # outra instância envia o arquivo inteiro (com uma linha nova no topo) entre duas escritas
+        if method == "PATCH" and fake.before_request is outra_instancia:
+            fake.before_request = None
+            fake.put_workbook(workbook, {
+                "Arquivos": [HEADER, ["B9", "ARQUIVADO", "ARQ 9", 9], ["A1", "ARQUIVADO", "ARQ 1", 1],
+                             ["A2", "ARQUIVADO", "ARQ 1", 2], ["A3", "ARQUIVADO", "ARQ 2", 3]],
+                "Espaços": [["Local", "Capacidade"], ["ARQ 1", 10]],
+            })
+
+    ops = [upsert({"ID": "A1", "Status": "X"}, {"ID": "A3", "Status": "Z"}),
+           {"op": "append", "sheet": "Espaços", "rows": [{"Local": "ARQ 2", "Capacidade": 5}]}]
+    with ExcelSession(sp, workbook) as xs:
+        fake.before_request = outra_instancia
+        with pytest.raises(WorkbookConflict):
+            xs.apply(ops)
+
+    fake.put_workbook(workbook, {"Arquivos": [HEADER, ["A1", "ARQUIVADO", "ARQ 1", 1], ["A3", "ARQUIVADO", "ARQ 2", 3]],
+                                 "Espaços": [["Local", "Capacidade"]]})
+    fake.before_request = outra_instancia
+    etag, pendentes = write_ops(sp, workbook, ops)
+    # upserts voltam para serem reaplicados sobre a versão relida; o anexo já foi gravado
+    assert etag is None and pendentes == ops[:1]
+
+
+def test_change_while_reading_keys_rereads_before_writing(fake, sp, workbook):
+    def outra_instancia(method, path):
+        if method == "GET" and "range(address='A2:" in path:
+            fake.before_request = None
+            fake.put_workbook(workbook, {"Arquivos": [HEADER, ["B9", "ARQUIVADO", "ARQ 9", 9],
+                                                      ["A1", "ARQUIVADO", "ARQ 1", 1]]})
+
+    fake.before_request = outra_instancia
+    etag, pendentes = write_ops(sp, workbook, [upsert({"ID": "A1", "Status": "X"})])
+    assert pendentes == [] and etag == fake.etag(workbook)
+    assert fake.sheet_values(workbook, "Arquivos") == [
+        HEADER, ["B9", "ARQUIVADO", "ARQ 9", 9], ["A1", "X", "ARQ 1", 1]]
@@ -0,0 +1,103 @@
+import pandas as pd
+import pytest
+
+import history_store
+from history_store import HistoryStore, IMPORT_TAG, MARKER
+
+FOLDER = "Pasta/historico"
+COLUMNS = ["ID", "Evento", "Responsável", "Data", "Observação"]
+
+
+@pytest.fixture
+def store(sp):
+    return HistoryStore(sp, FOLDER, COLUMNS)
+
+
+@pytest.fixture
+def no_listing_cache(monkeypatch):
+    monkeypatch.setattr(history_store, "LISTING_TTL", 0)
+
+
+def linha(i, data, obs=""):
+    return {"ID": f"A{i}", "Evento": "ARQUIVADO", "Responsável": "ana", "Data": data, "Observação": obs}
+
+
+def test_append_only_uploads_the_new_rows(fake, store):
+    assert store.is_empty()
+    store.append([linha(1, "2024-01-10 08:00:00"), linha(2, "05/02/2024", "São Paulo")], tag="t1")
+    store.append([linha(3, "2024-02-20 09:30:00")], tag="t2")
+
+    assert store.partitions() == ["2024-01", "2024-02"]
+    assert store.files("2024-02") == ["t1", "t2"]
+    novo = fake.content(f"{FOLDER}/2024-02/t2.csv")
+    assert novo.startswith(b"\xef\xbb\xbfID,") and novo.count(b"\n") == 2
+    # anexar não baixa nem regrava o que já existe
+    assert fake.count("GET", ":/content") == 0
+    assert fake.count("PUT", f"{FOLDER}/2024-02/t1.csv") == 1
+    assert list(store.segment("2024-02")["ID"]) == ["A2", "A3"]
+    assert store.segment("2024-02")["Observação"][0] == "São Paulo"
+    assert list(store.read(newest_first=True)["ID"]) == ["A3", "A2", "A1"]
+
+
+def test_resending_the_same_append_does_not_duplicate(fake, store):
+    rows = [linha(1, "2024-01-10"), linha(2, "2024-02-10")]
+    assert store.append(rows, tag="envio-1") == 2
+    # novo envio da mesma entrada (p.ex. após falha na confirmação): 409, nada muda
+    assert store.append(rows, tag="envio-1") == 2
+    assert fake.count("PUT", "envio-1.csv", status=409) == 2
+    assert len(store.read()) == 2
+
+
+def test_read_lists_and_downloads_only_the_months_in_range(fake, sp, store, no_listing_cache):
+    store.append([linha(1, "2024-01-10"), linha(2, "2024-02-10"), linha(3, "2024-03-10")], tag="t1")
+    fake.requests.clear()
+    assert list(store.read("2024-02-01", "2024-02-28")["ID"]) == ["A2"]
+    assert fake.count("GET", f"{FOLDER}/2024-01") == fake.count("GET", f"{FOLDER}/2024-03") == 0
+
+    # outra instância anexa em fevereiro: só o arquivo novo é baixado
+    HistoryStore(sp, FOLDER, COLUMNS).append([linha(9, "2024-02-11")], tag="t2")
+    fake.requests.clear()
+    assert list(store.read("2024-02-01", "2024-02-28")["ID"]) == ["A2", "A9"]
+    assert fake.count("GET", ":/content") == fake.count("GET", "2024-02/t2.csv:/content") == 1
+
+
+def test_listing_follows_pages(fake, store):
+    fake.page_size = 2
+    for i in range(5):
+        store.append([linha(i, "2024-01-10")], tag=f"t{i}")
+    assert store.files("2024-01") == [f"t{i}" for i in range(5)]
+    assert list(store.segment("2024-01")["ID"]) == [f"A{i}" for i in range(5)]
+
+
+def test_import_runs_once_and_an_interrupted_import_can_be_redone(fake, sp, store):
+    antigo = pd.DataFrame([linha(1, "2023-12-01"), linha(2, "2024-01-02")])
+    fake.fail("PUT", MARKER, status=500)
+    with pytest.raises(Exception):
+        store.import_once([antigo])
+    assert not store.is_migrated()
+
+    # refeita (outra instância, disco local vazio): os arquivos da importação não duplicam
+    nova = HistoryStore(sp, FOLDER, COLUMNS)
+    assert nova.import_once([antigo]) == 2
+    assert nova.is_migrated() and nova.files("2023-12") == [IMPORT_TAG]
+    assert nova.import_once([antigo]) == 0
+    assert len(HistoryStore(sp, FOLDER, COLUMNS).read()) == 2
+
+
+def test_read_fetches_unseen_files_together(fake, sp):
+    pedidos = []
+
+    def fetch_many(paths):
+        pedidos.append(sorted(paths))
+        return {p: (fake.content(p) if p in fake.files else FileNotFoundError(p)) for p in paths}
+
+    HistoryStore(sp, FOLDER, COLUMNS).append([linha(i, f"2024-0{i}-10") for i in (1, 2, 3)], tag="t1")
+    store = HistoryStore(sp, FOLDER, COLUMNS, fetch_many=fetch_many)
+    fake.requests.clear()
+    assert list(store.read()["ID"]) == ["A1", "A2", "A3"]
+    assert pedidos == [[f"{FOLDER}/2024-0{i}/t1.csv" for i in (1, 2, 3)]]
+    assert fake.count("GET", ":/content") == 0
+
+    # já vistos: nada a buscar de novo
+    store.read()
+    assert len(pedidos) == 1
@@ -0,0 +1,58 @@
+import json
+import threading
+
+from conftest import with_token
+from fake_graph import HOSTNAME, SITE_PATH, LIBRARY
+from id_allocator import IdAllocator
+from sp_connector import SPConnector
+
+CONTROLE = "Pasta/ids_reservados.json"
+
+
+def conector(fake):
+    # um conector por "instância": caches de eTag independentes
+    return with_token(SPConnector("tenant", "client", "secret", hostname=HOSTNAME, site_path=SITE_PATH,
+                                  library_name=LIBRARY, graph_url=fake.url, retries=0))
+
+
+def test_reserve_is_one_conditional_write(fake):
+    alloc = IdAllocator(conector(fake), CONTROLE)
+    assert alloc.reserve("AB", 100, floor=9) == list(range(10, 110))
+    assert fake.count("PUT", CONTROLE) == 1
+    assert json.loads(fake.content(CONTROLE))["prefixos"]["AB"] == 109
+    assert alloc.reserve("AB", 0) == []
+
+
+def test_racing_reservations_never_overlap(fake):
+    a, b = IdAllocator(conector(fake), CONTROLE), IdAllocator(conector(fake), CONTROLE)
+    a.reserve("AB", 1)
+    bloco_b = []
+
+    def outra_instancia(method, path):
+        # b reserva entre a leitura e a gravação de a: a gravação de a volta 412 e a relê
+        if method == "PUT" and CONTROLE in path and fake.before_request is outra_instancia:
+            fake.before_request = None
+            bloco_b.extend(b.reserve("AB", 50))
+
+    fake.before_request = outra_instancia
+    bloco_a = a.reserve("AB", 50)
+    assert fake.count("PUT", CONTROLE, status=412) == 1
+    assert bloco_b == list(range(1, 51)) and bloco_a == list(range(51, 101))
+
+    # muitas reservas simultâneas (lotes e avulsas) das duas instâncias
+    resultados, erros = [], []
+
+    def trabalho(alloc, n):
+        try:
+            resultados.append(alloc.reserve("AB", n) if n > 1 else [alloc.allocate("AB")])
+        except Exception as e:  # pragma: no cover - falha aparece no assert
+            erros.append(e)
+
+    threads = [threading.Thread(target=trabalho, args=(alloc, n)) for alloc in (a, b) for n in (1, 7, 20, 3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not erros
+    todos = bloco_a + bloco_b + [i for r in resultados for i in r]
+    assert len(todos) == len(set(todos))
@@ -0,0 +1,75 @@
+import pytest
+
+from journal import WriteJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return WriteJournal(str(tmp_path / "diario.jsonl"))
+
+
+def ids(entries):
+    return [e["id"] for e in entries]
+
+
+def test_later_entries_wait_for_the_one_in_flight(journal):
+    a = journal.append("x.xlsx", [{"op": "append", "sheet": "H", "rows": [{"n": 1}]}])
+    outro = journal.append("y.xlsx", [])
+    assert ids(journal.claim_pending()) == [a["id"], outro["id"]]
+
+    b = journal.append("x.xlsx", [])
+    c = journal.append("x.xlsx", [])
+    # `a` ainda em envio: nada de x.xlsx sai antes dele
+    assert journal.claim_pending() == []
+    journal.mark_done(a["id"])
+    assert ids(journal.claim_pending()) == [b["id"], c["id"]]
+
+
+def test_failed_entry_holds_its_file_and_is_retried_alone(journal):
+    a = journal.append("x.xlsx", [])
+    b = journal.append("x.xlsx", [])
+    assert ids(journal.claim_pending()) == [a["id"], b["id"]]
+
+    for e in (a, b):
+        journal.release(e["id"], retry_after=60)
+    c = journal.append("x.xlsx", [])
+    y = journal.append("y.xlsx", [])
+    # x.xlsx espera o novo envio; outros arquivos seguem
+    assert ids(journal.claim_pending()) == [y["id"]]
+
+    journal._held.clear()                       # passou o tempo de espera
+    assert ids(journal.claim_pending()) == [a["id"]]
+    assert journal.claim_pending() == []
+    journal.mark_done(a["id"])
+    assert ids(journal.claim_pending()) == [b["id"]]
+    journal.mark_done(b["id"])
+    assert ids(journal.claim_pending()) == [c["id"]]
+
+
+def test_replay_keeps_order(tmp_path):
+    path = str(tmp_path / "diario.jsonl")
+    j = WriteJournal(path)
+    entries = [j.append("x.xlsx", [{"op": "delete", "sheet": "A", "key": "ID", "ids": [str(i)]}]) for i in range(3)]
+    j.mark_done(entries[0]["id"])
+    j._owner.close()
+
+    j2 = WriteJournal(path)
+    assert ids(j2.claim_pending()) == ids(entries[1:])
+    assert j2.pending_ops("x.xlsx") == [e["ops"][0] for e in entries[1:]]
+
+
+def test_sent_entry_keeps_only_its_second_stage_pending(tmp_path):
+    path = str(tmp_path / "diario.jsonl")
+    j = WriteJournal(path)
+    sheet_op = {"op": "upsert", "sheet": "Arquivos", "key": "ID", "rows": [{"ID": "A1"}]}
+    e = j.append("x.xlsx", [sheet_op, {"op": "history", "tag": "t1", "rows": [{"ID": "A1"}]}])
+    j.mark_sent(e["id"], '"{v},2"')
+    # o arquivo já tem a alteração: não é reaplicada nas leituras
+    assert j.pending_ops("x.xlsx") == []
+    j._owner.close()
+
+    j2 = WriteJournal(path)
+    [pendente] = j2.claim_pending()
+    assert pendente["sent"] == '"{v},2"' and pendente["ops"][1]["op"] == "history"
+    j2.mark_done(pendente["id"])
+    assert j2.pending() == []
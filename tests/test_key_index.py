@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from key_index import KeyIndex, normalize_keys, parse_id_list
+
+IDS = [" ab01a", "AB02A", None, "AB10B", "XY01A", "ab02a", ""]
+
+
+def test_normalize_keys_strips_upcases_and_blanks_missing():
+    assert normalize_keys(IDS).tolist() == ["AB01A", "AB02A", "", "AB10B", "XY01A", "AB02A", ""]
+
+
+def test_exact_lookup_uses_the_first_row_of_a_repeated_key():
+    ix = KeyIndex(IDS)
+    assert len(ix) == len(IDS)
+    assert ix.get("ab01a ") == 0 and ix.get("AB02A") == 1
+    assert ix.get("") is None and ix.get(None) is None and ix.get("ZZ") is None
+    assert "xy01a" in ix and "AB03A" not in ix
+    assert ix.get_many(["XY01A", "nada", "ab10b"]).tolist() == [4, -1, 3]
+
+
+def test_rows_keeps_the_requested_order_without_repeats():
+    df = pd.DataFrame({"ID": IDS, "n": range(len(IDS))})
+    ix = KeyIndex(df["ID"])
+    assert ix.rows(df, ["XY01A", "AB01A", "xy01a", "ZZ"])["n"].tolist() == [4, 0]
+
+
+def test_prefix_bounds():
+    ix = KeyIndex(IDS)
+    assert ix.prefix("ab0").tolist() == [0, 1, 5]       # todas as linhas, inclusive repetidas
+    assert ix.prefix("AB1").tolist() == [3]
+    assert ix.prefix("AB10BX").tolist() == [] and ix.prefix("ZZ").tolist() == []
+    # limites do vetor ordenado: antes da primeira e depois da última chave
+    assert ix.prefix("A").tolist() == [0, 1, 3, 5] and ix.prefix("Y").tolist() == []
+    assert ix.prefix("").tolist() == list(range(len(IDS)))
+
+
+def test_contains_matches_anywhere_in_the_key():
+    ix = KeyIndex(IDS)
+    assert ix.contains("02").tolist() == [1, 5]
+    assert ix.contains("1a").tolist() == [0, 4]
+    assert ix.contains("q").tolist() == []
+
+
+def test_empty_index():
+    ix = KeyIndex([])
+    assert ix.get("A") is None and ix.prefix("A").tolist() == [] and ix.contains("A").tolist() == []
+    assert np.array_equal(ix.get_many([]), np.array([], dtype=np.int64))
+
+
+def test_parse_id_list_accepts_any_separator_and_drops_repeats():
+    assert parse_id_list(" ab01a, AB02A;ab01a\nXY01A\t ;;") == ["AB01A", "AB02A", "XY01A"]
+    assert parse_id_list(None) == [] and parse_id_list("") == []
+
+
+def test_suggest_returns_distinct_keys_in_order():
+    ix = KeyIndex(IDS)
+    assert [normalize_keys(IDS)[p] for p in ix.suggest("ab")] == ["AB01A", "AB02A", "AB10B"]
+    assert len(ix.suggest("ab", k=2)) == 2
+    assert ix.suggest("").tolist() == [] and ix.suggest("ZZ").tolist() == []
+
+
+def test_lookup_and_partition_split_a_pasted_list():
+    ix = KeyIndex(IDS)
+    assert ix.lookup(["xy01a", "AB02A", "ZZ", "", "AB10"]).tolist() == [4, 1, -1, -1, -1]
+    status = ["ARQUIVADO", "DESARQUIVADO", "", "ARQUIVADO", "ARQUIVADO", "ARQUIVADO", ""]
+    conhecidas, desconhecidas, bloqueadas = ix.partition(["ab01a", "ZZ", "AB02A", "xy01a", "AB01A"], status)
+    assert (conhecidas, desconhecidas, bloqueadas) == (["AB01A", "XY01A"], ["ZZ"], ["AB02A"])
+    assert KeyIndex([]).lookup(["A"]).tolist() == [-1]
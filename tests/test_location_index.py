@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from location_index import LocationIndex
+
+
+@pytest.fixture
+def ix():
+    return LocationIndex(pd.DataFrame({
+        "Local": ["Arquivo 1", "ARQUIVO 1 ", "arquivo 1", "Arquivo 2", None],
+        "Estante": ["002", "002", "001", "001", "001"],
+        "Prateleira": [1, 1, 2, 1, 1],
+        "Caixa": [10, 11, 10, 5, 5],
+    }))
+
+
+def test_rows_and_counts_by_path_ignore_case_and_spaces(ix):
+    assert len(ix) == 5
+    assert ix.rows().tolist() == [0, 1, 2, 3, 4]
+    assert ix.rows("arquivo 1").tolist() == [0, 1, 2]
+    assert ix.rows(" ARQUIVO 1", "002", 1).tolist() == [0, 1]
+    assert ix.count("Arquivo 1", "002", "1", "11") == 1
+    assert ix.is_occupied("Arquivo 2", "001", 1, 5)
+    assert not ix.is_occupied("Arquivo 2", "001", 1, 6) and ix.count("Arquivo 9") == 0
+
+
+def test_children_are_sorted_and_skip_blank_values(ix):
+    assert ix.children() == ["Arquivo 1", "Arquivo 2"]  # Local vazio não vira opção
+    assert ix.children("arquivo 1") == ["001", "002"]
+    assert ix.children("Arquivo 1", "002", 1) == ["10", "11"]
+    assert ix.children("Arquivo 1", "002", 1, 10) == [] and ix.children("nada") == []
+
+
+def test_occupancy_of_the_next_level(ix):
+    occ = ix.occupancy("Arquivo 1")
+    assert occ.to_dict("list") == {"Estante": ["001", "002"], "Documentos": [1, 2]}
+    assert ix.occupancy("Arquivo 1", "002", 1, 10).empty
+
+
+def test_path_deeper_than_the_levels_is_rejected(ix):
+    with pytest.raises(ValueError):
+        ix.rows("a", "b", "c", "d", "e")
+
+
+def test_missing_level_columns_count_as_blank():
+    ix = LocationIndex(pd.DataFrame({"Local": ["A", "A"]}))
+    assert ix.rows("A").tolist() == [0, 1] and ix.children("A") == []
@@ -0,0 +1,44 @@
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from mirror import SheetMirror
+
+
+def test_mixed_date_column_round_trips_without_pickle(tmp_path):
+    m = SheetMirror(str(tmp_path / "m.sqlite"), source="a.xlsx")
+    df = pd.DataFrame({"ID": ["A1", "A2", "A3"],
+                       "Data": [datetime(2024, 1, 2, 3, 4, 5), "sem data", None]})
+    m.store('"{v},1"', {"Arquivos": df})
+    with m._connect() as conn:
+        tipos = dict(conn.execute("SELECT pos, tipo FROM colunas").fetchall())
+    assert tipos == {0: "text", 1: "datetext"}  # nada de pickle por célula
+    back = m.read_sheet('"{v},1"', "Arquivos")
+    assert back["Data"][0] == pd.Timestamp("2024-01-02 03:04:05")
+    assert back["Data"][1] == "sem data" and pd.isna(back["Data"][2])
+
+
+class SlowSheets(dict):
+    def __init__(self, frames, gate):
+        super().__init__(frames)
+        self.gate = gate
+
+    def __getitem__(self, name):
+        self.gate.wait(5)
+        return super().__getitem__(name)
+
+
+def test_store_later_does_not_block_and_publishes_the_whole_version(tmp_path):
+    m = SheetMirror(str(tmp_path / "m.sqlite"), source="a.xlsx")
+    gate = threading.Event()
+    sheets = SlowSheets({"Arquivos": pd.DataFrame({"ID": ["A1"]}),
+                         "Espaços": pd.DataFrame({"Local": ["L1"]})}, gate)
+    m.store_later('"{v},1"', sheets)
+    m.store_later('"{v},1"', sheets)  # mesma versão: não entra duas vezes na fila
+    # ainda convertendo: a versão não aparece pela metade
+    assert not m.has_version('"{v},1"')
+    gate.set()
+    assert m.flush(timeout=5)
+    assert m.sheet_names('"{v},1"') == ["Arquivos", "Espaços"]
+    assert m.workbook('"{v},1"')["Espaços"]["Local"].tolist() == ["L1"]
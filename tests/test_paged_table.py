@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from paged_table import page_count, paginate, sort_order
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "ID": [f"A{i:02d}" for i in range(7)],
+        "Data": ["10/01/2024", "2024-01-02", None, "03/01/2024", "sem data", "31/12/2023", "2024-01-02"],
+        "n": [3, 1, 2, 0, 6, 5, 4],
+    }, index=range(100, 107))
+
+
+@pytest.mark.parametrize("total,size,pages", [(0, 25, 1), (1, 25, 1), (25, 25, 1), (26, 25, 2), (7, 0, 7)])
+def test_page_count(total, size, pages):
+    assert page_count(total, size) == pages
+
+
+def test_page_boundaries_and_clamping(df):
+    assert paginate(df, 1, 3)[0]["ID"].tolist() == ["A00", "A01", "A02"]
+    ultima, page, n_pages = paginate(df, 3, 3)
+    assert (ultima["ID"].tolist(), page, n_pages) == (["A06"], 3, 3)
+    # página fora do intervalo volta para a primeira/última válida
+    assert paginate(df, 99, 3)[1:] == (3, 3) and paginate(df, 0, 3)[1:] == (1, 3)
+    vazio, page, n_pages = paginate(df.iloc[:0], 2, 3)
+    assert vazio.empty and (page, n_pages) == (1, 1)
+
+
+def test_sort_by_text_dates_keeps_blanks_last_and_ties_stable(df):
+    assert sort_order(df, "Data", date_columns=("Data",)).tolist() == [5, 1, 6, 3, 0, 2, 4]
+    assert sort_order(df, "Data", ascending=False, date_columns=("Data",)).tolist()[:2] == [0, 3]
+    assert sort_order(df, "nada").tolist() == list(range(7))
+
+
+def test_only_the_page_is_formatted_and_the_source_is_untouched(df):
+    page, _, _ = paginate(df, 1, 2, sort_by="n", columns=["ID", "Data", "fora"], date_columns=("Data",))
+    assert list(page.columns) == ["ID", "Data"]
+    assert page.to_dict("list") == {"ID": ["A03", "A01"], "Data": ["03/01/2024", "02/01/2024"]}
+    assert df["Data"].tolist()[1] == "2024-01-02"
+    assert paginate(df, 3, 2, sort_by="n", date_columns=("Data",))[0]["Data"].tolist() == ["02/01/2024", "31/12/2023"]
+    # o que não é data fica como texto
+    assert paginate(df, 4, 2, sort_by="n", date_columns=("Data",))[0]["Data"].tolist() == ["sem data"]
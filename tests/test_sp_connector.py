@@ -0,0 +1,35 @@
+import os
+
+from sp_connector import UPLOAD_CHUNK_ALIGN
+
+PATH = "Pasta/grande.bin"
+
+
+def test_upload_large_resumes_after_a_mid_upload_5xx(fake, sp):
+    data = os.urandom(3 * UPLOAD_CHUNK_ALIGN + 100)
+    vistos = []
+
+    def _segunda_fatia_falha(method, path):
+        if method == "PUT" and path.startswith("/v1.0/upload/"):
+            vistos.append(path)
+            if len(vistos) == 2:
+                fake.fail("PUT", "/upload/", status=503)
+
+    fake.before_request = _segunda_fatia_falha
+    item = sp.upload_large(PATH, data, chunk_size=UPLOAD_CHUNK_ALIGN)
+
+    assert fake.content(PATH) == data
+    fatias = [(r[3]["content-range"], r[2]) for r in fake.requests
+              if r[0] == "PUT" and r[1].startswith("/v1.0/upload/")]
+    a = UPLOAD_CHUNK_ALIGN
+    # a fatia que falhou é reenviada a partir do que a sessão confirmou; nada antes dela
+    assert fatias == [(f"bytes 0-{a - 1}/{len(data)}", 202),
+                      (f"bytes {a}-{2 * a - 1}/{len(data)}", 503),
+                      (f"bytes {a}-{2 * a - 1}/{len(data)}", 202),
+                      (f"bytes {2 * a}-{3 * a - 1}/{len(data)}", 202),
+                      (f"bytes {3 * a}-{len(data) - 1}/{len(data)}", 201)]
+    assert fake.count("GET", "/upload/", status=200) == 1
+    # o eTag final fica no cache: o próximo download é um 304
+    assert item["eTag"] == fake.etag(PATH) == sp.cached_etag(PATH)
+    assert sp.download(PATH) == data
+    assert fake.count("GET", PATH, status=304) == 1
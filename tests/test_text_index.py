@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+import text_index
+from text_index import TextIndex, fold, tokenize
+
+
+def carregar(textos, alvos=None):
+    ix = TextIndex()
+    df = pd.DataFrame({"Conteúdo da Caixa": textos})
+    alvos = alvos or [f"C{i}" for i in range(len(textos))]
+    ix.add_frame(df, [f"d{i}" for i in range(len(textos))], alvos)
+    return ix
+
+
+def alvos(resultado):
+    return [t for t, _ in resultado]
+
+
+def test_fold_and_tokenize_ignore_accents_and_case():
+    assert fold("Conteúdo AÇÃO") == "conteudo acao"
+    assert tokenize("Nota-Fiscal Nº 12") == ["nota", "fiscal", "no", "12"]
+
+
+def test_search_is_and_across_terms_with_prefixes():
+    ix = carregar(["Contrato de aluguel", "Nota fiscal", "Contrato de compra"])
+    assert sorted(alvos(ix.search("contr"))) == ["C0", "C2"]
+    assert alvos(ix.search("CONTRATO aluguel")) == ["C0"]
+    assert ix.search("contrato fiscal") == []
+    # termo de uma letra só casa exato
+    assert ix.search("c") == []
+
+
+def test_exact_match_outranks_prefix():
+    ix = carregar(["contrato", "contratos antigos"])
+    assert alvos(ix.search("contrato")) == ["C0", "C1"]
+
+
+def test_incremental_add_replace_and_remove():
+    ix = carregar(["contrato de aluguel", "nota fiscal"])
+    ix.add("d9", "C9", {"Tag": "Contratual"})
+    assert sorted(alvos(ix.search("contra"))) == ["C0", "C9"]
+    ix.add("d0", "C0", {"Conteúdo da Caixa": "recibo"})  # substitui o documento
+    assert alvos(ix.search("contra")) == ["C9"] and alvos(ix.search("recibo")) == ["C0"]
+    ix.remove("d9")
+    assert ix.search("contra") == [] and len(ix) == 2
+
+
+def test_delta_is_merged_and_removed_docs_are_dropped(monkeypatch):
+    monkeypatch.setattr(text_index, "DELTA_MAX_ROWS", 3)
+    ix = carregar(["caixa antiga"], alvos=["VELHA"])
+    ix.remove("d0")
+    for i in range(4):
+        ix.add(f"n{i}", f"N{i}", {"Lacre": f"lacre{i}"})
+    # passou do limite: camada fundida na base, removidos e alvos sem documento descartados
+    assert ix._delta == {} and ix._delta_sorted == []
+    assert ix._n_docs == len(ix) == 4 and "VELHA" not in ix._targets
+    assert sorted(alvos(ix.search("lacre"))) == ["N0", "N1", "N2", "N3"]
+    assert alvos(ix.search("lacre2")) == ["N2"]
+    ix.remove("n2")
+    assert alvos(ix.search("lacre2")) == []
+
+
+@pytest.mark.parametrize("n", [1, 5])
+def test_bulk_reload_replaces_documents(n):
+    ix = carregar(["alfa"] * n)
+    ix.add_frame(pd.DataFrame({"Conteúdo da Caixa": ["beta"] * n}), [f"d{i}" for i in range(n)],
+                 [f"C{i}" for i in range(n)])
+    assert ix.search("alfa") == [] and len(alvos(ix.search("beta"))) == n and len(ix) == n
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from workbook import apply_ops, diff_sheet
+
+BASE = pd.DataFrame({"ID": ["A1", "A2", "A3"], "Status": ["ARQUIVADO"] * 3, "Caixa": [1, 2, 3]})
+
+
+def test_diff_sends_only_changed_cells_and_full_new_rows():
+    edited = pd.concat([BASE, pd.DataFrame({"ID": ["A4"], "Status": ["ARQUIVADO"], "Caixa": [4]})],
+                       ignore_index=True)
+    edited.loc[1, "Status"] = "DESARQUIVADO"
+    edited = edited.drop(index=0)
+    ops = diff_sheet("Arquivos", BASE, edited, key="ID")
+    assert ops == [
+        {"op": "upsert", "sheet": "Arquivos", "key": "ID", "existing_only": True,
+         "rows": [{"Status": "DESARQUIVADO", "ID": "A2"}]},
+        {"op": "upsert", "sheet": "Arquivos", "key": "ID",
+         "rows": [{"ID": "A4", "Status": "ARQUIVADO", "Caixa": 4}]},
+        {"op": "delete", "sheet": "Arquivos", "key": "ID", "ids": ["A1"]},
+    ]
+
+
+def test_rebase_skips_edits_to_rows_another_session_deleted():
+    edited = BASE.copy()
+    edited.loc[1, "Status"] = "DESARQUIVADO"
+    edited.loc[2, "Caixa"] = 9
+    ops = diff_sheet("Arquivos", BASE, edited, key="ID")
+    # 412: a versão atual já não tem A2 (excluída por outra sessão)
+    current = BASE[BASE["ID"] != "A2"].reset_index(drop=True)
+    out = apply_ops({"Arquivos": current}, ops)["Arquivos"]
+    assert out["ID"].tolist() == ["A1", "A3"]
+    assert out.loc[1, "Caixa"] == 9 and not out["Status"].isna().any()
+
+
+def test_existing_only_upsert_on_a_missing_sheet_changes_nothing():
+    op = {"op": "upsert", "sheet": "Arquivos", "key": "ID", "existing_only": True, "rows": [{"ID": "A1", "Caixa": 2}]}
+    assert apply_ops({}, [op]) == {}
+    assert apply_ops({}, [dict(op, existing_only=False)])["Arquivos"].to_dict("list") == {"ID": ["A1"], "Caixa": [2]}
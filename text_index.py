@@ -0,0 +1,283 @@
+import re
+import threading
+from bisect import bisect_left, insort
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# Peso de cada campo na relevância (códigos e lacres valem mais que texto livre)
+FIELD_WEIGHTS = {
+    "Codificação": 3.0,
+    "Tag": 2.5,
+    "Lacre": 2.5,
+    "Livro": 2.0,
+    "Conteúdo da Caixa": 1.5,
+    "Observação Desarquivamento": 1.0,
+    "Observação": 0.8,
+}
+# Termo da consulta casado só pelo começo vale esta fração do casamento exato
+PREFIX_FACTOR = 0.6
+# Termos mais curtos que isso só casam exatos (evita prefixos que casam com tudo)
+MIN_PREFIX_LEN = 2
+# Até quantas linhas `add_frame` vai para a camada incremental (acima disso, refaz a base);
+# também o tamanho da camada (e o número de removidos) a partir do qual ela é fundida na base
+DELTA_MAX_ROWS = 2000
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_TOP = "\U0010ffff"
+
+
+def fold(text) -> str:
+    """Minúsculas sem acento ("Conteúdo" -> "conteudo"); vazio para NaN/None."""
+    if text is None or (isinstance(text, float) and text != text):
+        return ""
+    s = str(text)
+    if s.isascii():
+        return s.lower()
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(c for c in s if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text) -> list:
+    return _TOKEN_RE.findall(fold(text))
+
+
+def tokenize_series(values) -> pd.Series:
+    """`tokenize` de cada linha (cada valor distinto é tokenizado uma vez só)."""
+    s = pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    tokens = [tokenize(u) for u in uniques] + [[]]
+    return pd.Series([tokens[c] for c in codes], index=s.index, dtype=object)
+
+
+class TextIndex:
+    """
+    Índice invertido termo -> documentos, para busca de texto livre. Cada documento
+    pertence a um alvo (o ID da caixa); a busca junta os documentos por alvo.
+      - `add_frame(df, docs, alvos)`: carga em lote de uma aba (vira a base compacta:
+        vocabulário ordenado + listas de documentos/pesos em vetores numpy)
+      - `add(doc, alvo, {campo: texto})` / `remove(doc)`: atualização incremental
+        (documentos novos numa camada de dicionários; removidos só são marcados). Passando
+        de DELTA_MAX_ROWS, a camada é fundida na base e os removidos são descartados
+      - `search(consulta)`: todos os termos precisam aparecer em algum campo do alvo (E);
+        cada termo casa exato ou como prefixo (busca binária no vocabulário);
+        relevância = soma de (peso do campo × idf do termo), prefixo vale PREFIX_FACTOR
+    Texto comparado sem acento e sem diferença de maiúsculas.
+    """
+
+    def __init__(self, weights: dict | None = None):
+        self.weights = dict(FIELD_WEIGHTS if weights is None else weights)
+        self._lock = threading.RLock()
+        # documentos (int) e alvos (int)
+        self._doc_ids = {}                      # chave do documento -> int
+        self._doc_target = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._n_docs = 0
+        self._n_dead = 0                        # removidos ainda ocupando posição
+        self._target_ids = {}                   # alvo -> int
+        self._targets = []
+        # base compacta (CSR por termo)
+        self._terms = np.array([], dtype=str)
+        self._ptr = np.zeros(1, dtype=np.int64)
+        self._post_docs = np.zeros(0, dtype=np.int64)
+        self._post_w = np.zeros(0, dtype=np.float64)
+        # camada incremental
+        self._delta = {}                        # termo -> {doc: peso}
+        self._delta_terms = {}                  # doc -> termos (só da camada incremental)
+        self._delta_sorted = []                 # termos da camada, em ordem (busca por prefixo)
+
+    def __len__(self):
+        return self._n_docs - self._n_dead
+
+    # -------- Documentos / alvos --------
+    def _target(self, target) -> int:
+        tid = self._target_ids.get(target)
+        if tid is None:
+            tid = self._target_ids[target] = len(self._targets)
+            self._targets.append(target)
+        return tid
+
+    def _new_docs(self, keys, targets) -> np.ndarray:
+        """Reserva ints para os documentos (um documento já existente é substituído)."""
+        keys = list(keys)
+        for k in keys:
+            self._drop(k)
+        start, n = self._n_docs, len(keys)
+        if start + n > len(self._alive):
+            cap = max(start + n, 2 * len(self._alive), 1024)
+            self._alive = np.concatenate([self._alive, np.zeros(cap - len(self._alive), dtype=bool)])
+            self._doc_target = np.concatenate(
+                [self._doc_target, np.zeros(cap - len(self._doc_target), dtype=np.int64)])
+        ids = np.arange(start, start + n)
+        self._doc_target[ids] = [self._target(t) for t in targets]
+        self._alive[ids] = True
+        self._doc_ids.update(zip(keys, ids.tolist()))
+        self._n_docs = start + n
+        return ids
+
+    # -------- Atualização --------
+    def add_frame(self, df: pd.DataFrame, doc_keys, targets, fields=None):
+        """Indexa as linhas de `df` (documento `doc_keys[i]`, alvo `targets[i]`) nos campos `fields`."""
+        fields = [c for c in (fields or self.weights) if c in df.columns]
+        if len(df) <= DELTA_MAX_ROWS and len(self._post_docs):
+            # poucas linhas: camada incremental, sem refazer a base
+            for i, (doc, target) in enumerate(zip(doc_keys, targets)):
+                self.add(doc, target, {c: df[c].iat[i] for c in fields})
+            return
+        pairs = []
+        for c in fields:
+            toks = tokenize_series(df[c].reset_index(drop=True)).explode().dropna()
+            if not toks.empty:
+                pairs.append(pd.DataFrame({"row": toks.index.to_numpy(), "term": toks.to_numpy(),
+                                           "w": self.weights.get(c, 1.0)}))
+        with self._lock:
+            ids = self._new_docs(doc_keys, targets)
+            p = None
+            if pairs:
+                p = pd.concat(pairs, ignore_index=True)
+                p["doc"] = ids[p["row"].to_numpy()]
+                p = p.groupby(["term", "doc"], sort=False)["w"].sum().reset_index()
+            self._merge(p)
+
+    def add(self, doc, target, fields: dict):
+        """`fields` = {campo: texto}; substitui o documento se já existir."""
+        terms = {}
+        for field, text in fields.items():
+            w = self.weights.get(field, 1.0)
+            for t in tokenize(text):
+                terms[t] = terms.get(t, 0.0) + w
+        with self._lock:
+            (i,) = self._new_docs([doc], [target]).tolist()
+            for t, w in terms.items():
+                posting = self._delta.get(t)
+                if posting is None:
+                    posting = self._delta[t] = {}
+                    insort(self._delta_sorted, t)
+                posting[i] = w
+            self._delta_terms[i] = list(terms)
+            self._maybe_merge()
+
+    def remove(self, doc):
+        with self._lock:
+            self._drop(doc)
+            self._maybe_merge()
+
+    def _drop(self, doc):
+        i = self._doc_ids.pop(doc, None)
+        if i is None:
+            return
+        self._alive[i] = False
+        self._n_dead += 1
+        for t in self._delta_terms.pop(i, ()):
+            posting = self._delta.get(t)
+            if posting is not None:
+                posting.pop(i, None)
+                if not posting:
+                    del self._delta[t]
+                    del self._delta_sorted[bisect_left(self._delta_sorted, t)]
+
+    # -------- Base compacta --------
+    def _maybe_merge(self):
+        if len(self._delta_terms) > DELTA_MAX_ROWS or self._n_dead > DELTA_MAX_ROWS:
+            self._merge()
+
+    def _merge(self, extra: pd.DataFrame | None = None):
+        """
+        Refaz a base com os postings vivos da base, da camada incremental e de `extra`
+        (term/doc/w), renumerando documentos e alvos sem os removidos.
+        """
+        parts = []
+        if len(self._post_docs):
+            lens = np.diff(self._ptr)
+            parts.append(pd.DataFrame({"term": np.repeat(self._terms, lens).astype(object),
+                                       "doc": self._post_docs, "w": self._post_w}))
+        if self._delta:
+            parts.append(pd.DataFrame([(t, d, w) for t, posting in self._delta.items()
+                                       for d, w in posting.items()], columns=["term", "doc", "w"]))
+        if extra is not None:
+            parts.append(extra[["term", "doc", "w"]])
+        p = (pd.concat(parts, ignore_index=True) if parts
+             else pd.DataFrame({"term": [], "doc": np.zeros(0, dtype=np.int64), "w": []}))
+        p = p[self._alive[p["doc"].to_numpy(dtype=np.int64)]]
+
+        # só documentos vivos (e alvos que ainda têm documentos), numerados de novo
+        alive = np.flatnonzero(self._alive[:self._n_docs])
+        remap = np.full(self._n_docs, -1, dtype=np.int64)
+        remap[alive] = np.arange(len(alive))
+        used, doc_target = np.unique(self._doc_target[alive], return_inverse=True)
+        self._targets = [self._targets[t] for t in used]
+        self._target_ids = {t: i for i, t in enumerate(self._targets)}
+        self._doc_target = doc_target.astype(np.int64)
+        self._alive = np.ones(len(alive), dtype=bool)
+        self._n_docs, self._n_dead = len(alive), 0
+        self._doc_ids = {k: int(remap[i]) for k, i in self._doc_ids.items()}
+        self._delta, self._delta_terms, self._delta_sorted = {}, {}, []
+
+        p = pd.DataFrame({"term": p["term"].to_numpy().astype(str),
+                          "doc": remap[p["doc"].to_numpy(dtype=np.int64)],
+                          "w": p["w"].to_numpy(dtype=np.float64)})
+        p = p.sort_values(["term", "doc"], kind="stable", ignore_index=True)
+        terms, starts = np.unique(p["term"].to_numpy(), return_index=True)
+        self._terms = terms.astype(str)
+        self._ptr = np.append(starts, len(p)).astype(np.int64)
+        self._post_docs = p["doc"].to_numpy(dtype=np.int64)
+        self._post_w = p["w"].to_numpy(dtype=np.float64)
+
+    # -------- Consulta --------
+    def _postings(self, token: str):
+        """(documentos, pesos) dos termos que casam com `token` (exato ou prefixo), já com o idf."""
+        exact_only = len(token) < MIN_PREFIX_LEN
+        n_docs = max(len(self), 1)
+        docs, weights = [], []
+        lo = np.searchsorted(self._terms, token, side="left")
+        hi = lo + 1 if exact_only else np.searchsorted(self._terms, token + _TOP, side="left")
+        delta = self._delta.get(token, {})
+        for k in range(lo, min(hi, len(self._terms))):
+            term = self._terms[k]
+            if exact_only and term != token:
+                break
+            a, b = self._ptr[k], self._ptr[k + 1]
+            extra = self._delta.get(term, {}) if term != token else delta
+            idf = np.log1p(n_docs / (b - a + len(extra)))
+            factor = 1.0 if term == token else PREFIX_FACTOR
+            docs.append(self._post_docs[a:b])
+            weights.append(self._post_w[a:b] * (idf * factor))
+        # camada incremental: mesma faixa [token, token + _TOP) nos termos ordenados
+        j = bisect_left(self._delta_sorted, token)
+        k = j + 1 if exact_only else bisect_left(self._delta_sorted, token + _TOP)
+        for term in self._delta_sorted[j:k]:
+            if exact_only and term != token:
+                break
+            posting = self._delta[term]
+            base = np.searchsorted(self._terms, term)
+            in_base = base < len(self._terms) and self._terms[base] == term
+            n_base = int(self._ptr[base + 1] - self._ptr[base]) if in_base else 0
+            idf = np.log1p(n_docs / (n_base + len(posting)))
+            factor = 1.0 if term == token else PREFIX_FACTOR
+            docs.append(np.fromiter(posting.keys(), dtype=np.int64, count=len(posting)))
+            weights.append(np.fromiter(posting.values(), dtype=np.float64, count=len(posting)) * (idf * factor))
+        if not docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        docs, weights = np.concatenate(docs), np.concatenate(weights)
+        keep = self._alive[docs]
+        return docs[keep], weights[keep]
+
+    def search(self, query: str, limit: int | None = 200) -> list:
+        """[(alvo, relevância)] do mais relevante para o menos."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            total = None
+            for token in tokens:
+                docs, weights = self._postings(token)
+                best = np.zeros(len(self._targets))
+                np.maximum.at(best, self._doc_target[docs], weights)
+                total = best if total is None else np.where((total > 0) & (best > 0), total + best, 0.0)
+                if not total.any():
+                    return []
+            hits = np.flatnonzero(total)
+            order = hits[np.argsort(-total[hits], kind="stable")]
+            if limit:
+                order = order[:limit]
+            return [(self._targets[t], float(total[t])) for t in order]
@@ -0,0 +1,330 @@
+import io
+import threading
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+# Aba de histórico: o que chega para ela é sempre ANEXADO ao que já existe
+HISTORY_APPEND_SHEET = "historico"
+# Abas cujas linhas têm chave única (as demais são comparadas por posição)
+SHEET_KEYS = {"Arquivos": "ID"}
+
+
+def sanitize_sheet_name(name: str) -> str:
+    invalid = ['\\', '/', '?', '*', '[', ']']
+    for ch in invalid:
+        name = name.replace(ch, '_')
+    return (name or "Sheet1")[:31]
+
+
+# -------- Leitura / escrita do workbook --------
+def read_workbook(source) -> dict:
+    """Lê todas as abas do .xlsx (bytes ou arquivo binário aberto) em {nome_aba: DataFrame}."""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return pd.read_excel(source, sheet_name=None) or {}
+
+
+class LazyWorkbook(Mapping):
+    """
+    Workbook aberto uma única vez (openpyxl em modo read-only); cada aba só é
+    convertida em DataFrame no primeiro acesso e fica memorizada.
+    Funciona como um dict {nome_aba: DataFrame} somente leitura — `dict(wb)` lê tudo.
+    Os DataFrames devolvidos são compartilhados: copie antes de alterar.
+    """
+
+    def __init__(self, source, version: str | None = None):
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        self.version = version
+        self._source = source
+        self._xls = pd.ExcelFile(source, engine="openpyxl")
+        self._sheets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def sheet_names(self) -> list:
+        return list(self._xls.sheet_names)
+
+    @property
+    def parsed_sheets(self) -> list:
+        """Abas que de fato já foram lidas (na ordem do workbook)."""
+        return [n for n in self.sheet_names if n in self._sheets]
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        df = self._sheets.get(name)
+        if df is not None:
+            return df
+        if name not in self._xls.sheet_names:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._sheets:
+                self._sheets[name] = self._xls.parse(name)
+            return self._sheets[name]
+
+    def __iter__(self):
+        return iter(self.sheet_names)
+
+    def __len__(self) -> int:
+        return len(self._xls.sheet_names)
+
+    def __contains__(self, name) -> bool:
+        return name in self._xls.sheet_names
+
+    def close(self):
+        self._xls.close()
+        try:
+            self._source.close()
+        except Exception:
+            pass
+
+
+class Snapshot(Mapping):
+    """
+    Versão (eTag) dos dados lida por todas as telas e sessões:
+      - funciona como o dict de abas do workbook (lidas sob demanda, compartilhadas)
+      - `history(inicio, fim)`: histórico vindo do `HistoryStore` (lista só os meses do período; arquivos já vistos não são baixados de novo)
+      - `derived(nome, fn)`: artefatos calculados a partir das abas (índices, mapas...),
+        calculados uma única vez por versão
+    """
+
+    def __init__(self, sheets, version: str | None = None, history=None):
+        self.version = version
+        self.sheets = sheets
+        self._history = history
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        return self.sheets[name]
+
+    def __iter__(self):
+        return iter(self.sheets)
+
+    def __len__(self) -> int:
+        return len(self.sheets)
+
+    def __contains__(self, name) -> bool:
+        return name in self.sheets
+
+    @property
+    def parsed_sheets(self) -> list:
+        return getattr(self.sheets, "parsed_sheets", list(self.sheets))
+
+    def history(self, inicio=None, fim=None, newest_first: bool = False) -> pd.DataFrame:
+        if self._history is None:
+            return pd.DataFrame()
+        return self._history.read(inicio, fim, newest_first=newest_first)
+
+    def derived(self, name: str, fn):
+        """`fn(snapshot)` memorizado por versão (o resultado é compartilhado: não altere)."""
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = fn(self)
+            return self._derived[name]
+
+    def close(self):
+        close = getattr(self.sheets, "close", None)
+        if close:
+            close()
+
+
+def build_workbook(sheets: dict, index: bool = False) -> bytes:
+    """Monta o .xlsx completo a partir de {nome_aba: DataFrame}."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for name, data in sheets.items():
+            (data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)) \
+                .to_excel(writer, sheet_name=sanitize_sheet_name(name), index=index)
+    return output.getvalue()
+
+
+# -------- Operações por linha --------
+# Uma operação é um dict simples (serializável), p.ex.:
+#   {"op": "upsert",  "sheet": "Arquivos", "key": "ID", "rows": [{"ID": "...", "Status": "..."}]}
+#   {"op": "delete",  "sheet": "Arquivos", "key": "ID", "ids": ["..."]}
+#   {"op": "append",  "sheet": "Historico", "rows": [{...}]}
+#   {"op": "replace", "sheet": "Selectboxes", "columns": [...], "rows": [{...}]}
+# `upsert` só carrega as colunas que mudaram (mais a chave); linhas novas vêm completas.
+
+def _same_value(a, b) -> bool:
+    a_na, b_na = _is_missing(a), _is_missing(b)
+    if a_na or b_na:
+        return a_na and b_na
+    try:
+        if a == b:
+            return True
+    except Exception:
+        pass
+    return str(a).strip() == str(b).strip()
+
+
+def _is_missing(v) -> bool:
+    try:
+        return bool(pd.isna(v))
+    except (TypeError, ValueError):
+        return False
+
+
+def _records(df: pd.DataFrame) -> list:
+    return df.to_dict(orient="records")
+
+
+def _replace_op(sheet: str, df: pd.DataFrame) -> dict:
+    return {"op": "replace", "sheet": sheet, "columns": list(df.columns), "rows": _records(df)}
+
+
+def _keyed_diff(sheet: str, base: pd.DataFrame, edited: pd.DataFrame, key: str) -> list:
+    base_keys = base[key].astype(str)
+    edited_keys = edited[key].astype(str)
+    if base_keys.duplicated().any() or edited_keys.duplicated().any() or edited[key].isna().any():
+        return [_replace_op(sheet, edited)]
+
+    base_pos = {k: i for i, k in enumerate(base_keys)}
+    pos = np.fromiter((base_pos.pop(k, -1) for k in edited_keys), dtype=np.int64, count=len(edited_keys))
+    base_cols = set(base.columns)
+    # pré-filtro vetorizado: só as linhas com alguma célula diferente passam pela comparação fina
+    matched = np.flatnonzero(pos >= 0)
+    differs = np.zeros(len(edited), dtype=bool)
+    differs[pos < 0] = True
+    for col in edited.columns:
+        if col == key:
+            continue
+        if col not in base_cols:
+            differs[matched] = True
+            break
+        # mesmo dtype nativo (datas, números): compara sem converter para objetos Python
+        native = edited[col].dtype == base[col].dtype and edited[col].dtype.kind in "biufmM"
+        new = edited[col].to_numpy(dtype=None if native else object)[matched]
+        old = base[col].to_numpy(dtype=None if native else object)[pos[matched]]
+        try:
+            same = (pd.isna(new) & pd.isna(old)) | (new == old)
+        except Exception:
+            same = np.zeros(len(matched), dtype=bool)
+        differs[matched[~same]] = True
+
+    inserts, updates = [], []
+    for i in np.flatnonzero(differs):
+        row = edited.iloc[i]
+        j = pos[i]
+        if j < 0:
+            inserts.append(row.to_dict())
+            continue
+        old = base.iloc[j]
+        changed = {
+            col: row[col] for col in edited.columns
+            if col != key and not _same_value(old[col] if col in base_cols else None, row[col])
+        }
+        if changed:
+            changed[key] = row[key]
+            updates.append(changed)
+
+    ops = []
+    if updates:
+        # só as células alteradas: se a linha sumiu (outra sessão excluiu), não vira linha nova
+        ops.append({"op": "upsert", "sheet": sheet, "key": key, "rows": updates, "existing_only": True})
+    if inserts:
+        ops.append({"op": "upsert", "sheet": sheet, "key": key, "rows": inserts})
+    if base_pos:
+        ops.append({"op": "delete", "sheet": sheet, "key": key, "ids": list(base_pos)})
+    return ops
+
+
+def _keyless_diff(sheet: str, base: pd.DataFrame, edited: pd.DataFrame) -> list:
+    n = len(base)
+    if list(edited.columns) == list(base.columns) and len(edited) >= n:
+        head = edited.iloc[:n]
+        same = all(
+            _same_value(a, b)
+            for col in base.columns
+            for a, b in zip(base[col].tolist(), head[col].tolist())
+        )
+        if same:
+            tail = edited.iloc[n:]
+            return [{"op": "append", "sheet": sheet, "rows": _records(tail)}] if len(tail) else []
+    return [_replace_op(sheet, edited)]
+
+
+def diff_sheet(sheet: str, base, edited: pd.DataFrame, key: str | None = None) -> list:
+    """
+    Traduz a aba editada pelo usuário em operações por linha em relação à `base`
+    (a versão da aba em que a edição foi feita).
+      - aba de histórico ("Historico"): tudo que veio é anexado
+      - com coluna-chave única: upsert das linhas alteradas (`existing_only`: só as células
+        alteradas, ignorado se a linha não existir mais) e das novas + delete das removidas
+      - sem chave: append se a edição só acrescentou linhas ao final; senão replace
+    """
+    if sanitize_sheet_name(sheet).lower() == HISTORY_APPEND_SHEET:
+        return [{"op": "append", "sheet": sheet, "rows": _records(edited)}] if len(edited) else []
+    if not isinstance(base, pd.DataFrame) or base.empty:
+        return [_replace_op(sheet, edited)]
+    if key and key in base.columns and key in edited.columns:
+        return _keyed_diff(sheet, base, edited, key)
+    return _keyless_diff(sheet, base, edited)
+
+
+def diff_workbook(base_sheets: dict, write_map: dict, keys: dict | None = None) -> list:
+    keys = SHEET_KEYS if keys is None else keys
+    ops = []
+    for sheet, data in write_map.items():
+        ops.extend(diff_sheet(sheet, base_sheets.get(sheet), data, key=keys.get(sheet)))
+    return ops
+
+
+def _append_frames(existing, new: pd.DataFrame) -> pd.DataFrame:
+    if existing is None or (isinstance(existing, pd.DataFrame) and existing.empty):
+        return new
+    # une colunas; o que faltar vira NaN
+    all_cols = list(dict.fromkeys(list(existing.columns) + list(new.columns)))
+    existing = existing.reindex(columns=all_cols)
+    new = new.reindex(columns=all_cols)
+    return pd.concat([existing, new], ignore_index=True)
+
+
+def _apply_upsert(df: pd.DataFrame, key: str, rows: list, existing_only: bool = False) -> pd.DataFrame:
+    if df is None or df.empty or key not in df.columns:
+        return df if existing_only else _append_frames(df, pd.DataFrame(rows))
+    df = df.copy()
+    pos = {}
+    for label, k in zip(df.index, df[key].astype(str)):
+        pos.setdefault(k, label)
+    novos = []
+    for row in rows:
+        label = pos.get(str(row.get(key)))
+        if label is None:
+            if not existing_only:
+                novos.append(row)
+            continue
+        for col, val in row.items():
+            if col not in df.columns:
+                df[col] = None
+            elif df[col].dtype != object:
+                df[col] = df[col].astype(object)
+            df.at[label, col] = val
+    if novos:
+        df = _append_frames(df, pd.DataFrame(novos))
+    return df
+
+
+def apply_ops(sheets: dict, ops: list) -> dict:
+    """Aplica as operações sobre {aba: DataFrame}; devolve um novo dict (abas tocadas são copiadas)."""
+    out = dict(sheets)
+    for op in ops:
+        sheet = op["sheet"]
+        current = out.get(sheet)
+        current = current if isinstance(current, pd.DataFrame) else None
+        kind = op["op"]
+        if kind == "upsert":
+            if current is not None or not op.get("existing_only"):
+                out[sheet] = _apply_upsert(current, op["key"], op["rows"], op.get("existing_only", False))
+        elif kind == "delete":
+            if current is not None and op["key"] in current.columns:
+                ids = {str(i) for i in op["ids"]}
+                out[sheet] = current[~current[op["key"]].astype(str).isin(ids)].reset_index(drop=True)
+        elif kind == "append":
+            out[sheet] = _append_frames(current, pd.DataFrame(op["rows"]))
+        elif kind == "replace":
+            out[sheet] = pd.DataFrame(op["rows"], columns=op.get("columns"))
+        else:
+            raise ValueError(f"Operação desconhecida: {kind}")
+    return out
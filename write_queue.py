@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import Future
+
+# Quanto esperar por mais operações depois da primeira antes de enviar (segundos)
+WRITE_WINDOW = 0.5
+
+
+class WriteCoalescer:
+    """
+    Fila de escrita única por processo. As sessões enfileiram operações por linha
+    (`submit(arquivo, ops)`) e recebem um `Future`; uma thread de fundo junta tudo o
+    que chegou dentro de `window` segundos e chama `flush(arquivo, ops)` UMA vez por
+    arquivo — um único download/upload para várias operações.
+    O resultado de `flush` (p.ex. o novo eTag) vai para todos os Futures do lote.
+    Se o lote falhar e tiver vindo de várias submissões, cada uma é reenviada
+    sozinha, para que uma operação inválida não derrube as das outras sessões.
+    """
+
+    def __init__(self, flush, window: float = WRITE_WINDOW):
+        self._flush = flush
+        self.window = window
+        self._pending = []                      # [(arquivo, ops, Future)]
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="write-coalescer")
+        self._thread.start()
+
+    def submit(self, key: str, ops: list) -> Future:
+        fut = Future()
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Fila de escrita encerrada")
+            self._pending.append((key, list(ops), fut))
+            self._cond.notify()
+        return fut
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def stop(self, timeout: float | None = None):
+        """Não aceita mais operações; as já enfileiradas ainda são enviadas."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    # -------- Worker --------
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                if not self._stopped:
+                    # janela: dá tempo de outras sessões entrarem no mesmo lote
+                    self._cond.wait(self.window)
+                batch, self._pending = self._pending, []
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch: list):
+        by_key = {}
+        for key, ops, fut in batch:
+            if fut.set_running_or_notify_cancel():
+                by_key.setdefault(key, []).append((ops, fut))
+        for key, items in by_key.items():
+            try:
+                result = self._flush(key, [op for ops, _ in items for op in ops])
+            except Exception as e:
+                if len(items) == 1:
+                    items[0][1].set_exception(e)
+                    continue
+                for ops, fut in items:
+                    try:
+                        fut.set_result(self._flush(key, ops))
+                    except Exception as e2:
+                        fut.set_exception(e2)
+                continue
+            for _, fut in items:
+                fut.set_result(result)